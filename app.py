@@ -4,28 +4,62 @@ import numpy as np
 import cv2
 import sqlite3
 import json
+import multiprocessing
+import threading
+import time
+import atexit
+import signal
+import sys
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 
-from flask import Flask, request, jsonify, render_template, url_for, redirect
+import click
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context, url_for, redirect
+
+try:
+    from flask_sock import Sock # Canal WebSocket pour la surveillance d'examen (optionnel)
+except ImportError:
+    Sock = None
 
 # Importation de vos modules d'IA
 from models import text_detection
 from models import visual_audio_detection
 from models import proactive_assistant
+from models.frame_preparation import decode_frame
+from models.inference_workers import InferenceWorkerPool, WorkerCrashed, INFERENCE_WORKERS
+from models.result_cache import TEXT_CACHE_PERSIST
+from models.text_batch import BatchProgress, TextBatchPool
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your_super_secret_key_for_hackathon' # Change this for production!
+sock = Sock(app) if Sock is not None else None
+if sock is None:
+    print("AVERTISSEMENT: flask-sock non installé, le canal WebSocket /ws/exam est désactivé (repli HTTP).")
 
 # --- Initialisation des Modules d'IA au démarrage de l'application ---
 # Chemin pour l'image d'enrôlement facial (doit exister dans static/img/)
 KNOWN_STUDENT_FACE_PATH = os.path.join(app.root_path, 'static', 'img', 'known_student_face.jpg')
 KNOWN_STUDENT_ID = "student_A_123" # ID de l'étudiant pour la démo
 
-# Charger le visage connu pour la reconnaissance faciale
-visual_audio_detection.load_known_faces({KNOWN_STUDENT_ID: KNOWN_STUDENT_FACE_PATH})
-
-# Initialiser la source audio (microphone) une seule fois
-visual_audio_detection.init_audio_source()
+# Pipeline temps réel : soit dans le thread Flask, soit dans des processus d'inférence dédiés
+# (SIPA_INFERENCE_WORKERS > 0) qui chargent chacun les modèles et reçoivent les frames par mémoire partagée.
+inference_pool = None
+if INFERENCE_WORKERS > 0:
+    # Les processus sont lancés en mode "spawn", qui ré-importe ce module : seul le processus parent démarre le pool
+    if multiprocessing.parent_process() is None:
+        inference_pool = InferenceWorkerPool(INFERENCE_WORKERS, known_faces={KNOWN_STUDENT_ID: KNOWN_STUDENT_FACE_PATH})
+        inference_pool.start()
+        # Processus joints et mémoire partagée (/dev/shm) libérée à l'arrêt du serveur
+        atexit.register(inference_pool.shutdown)
+elif multiprocessing.parent_process() is None: # Pas dans les processus d'analyse par lots (qui ré-importent ce module)
+    # Charger le visage connu pour la reconnaissance faciale
+    visual_audio_detection.load_known_faces({KNOWN_STUDENT_ID: KNOWN_STUDENT_FACE_PATH})
+
+    # Initialiser la source audio (microphone) une seule fois
+    visual_audio_detection.init_audio_source()
+
+    # Charger le détecteur d'objets dès le démarrage (sinon chargé à la première frame)
+    visual_audio_detection.get_object_detector()
 print("SIPA Backend prêt et modules chargés.")
 
 # --- Configuration de la Base de Données SQLite pour les Logs ---
@@ -56,6 +90,12 @@ def init_db():
 # Appeler l'initialisation de la DB au démarrage de l'app
 with app.app_context():
     init_db()
+    if TEXT_CACHE_PERSIST:
+        text_detection.result_cache.attach_database(DATABASE)
+
+# Analyse textuelle par lots : pool de processus créé au premier lot
+text_batch_pool = TextBatchPool(database=DATABASE if TEXT_CACHE_PERSIST else None)
+BATCH_PROGRESS_INTERVAL_S = 1.0 # Intervalle entre deux événements de progression d'un lot
 
 # --- Routes de l'Application ---
 
@@ -89,86 +129,183 @@ def api_detect_text():
     if not text_content:
         return jsonify({"error": "No text content provided."}), 400
 
-    # Appeler les fonctions de détection textuelle
-    plagiarism_result = text_detection.detect_plagiarism(text_content)
-    ai_content_result = text_detection.detect_ai_content(text_content)
+    # Analyse textuelle (servie par le cache si ce texte a déjà été analysé pour cet étudiant)
+    analysis = text_detection.analyze_text(text_content, student_id)
+    plagiarism_result = analysis['plagiarism']
+    ai_content_result = analysis['ai_content']
+    alert_level = analysis['alert_level']
+    message = analysis['message']
 
-    # Déterminer le niveau d'alerte global pour le log
-    alert_level = 'low'
-    if plagiarism_result['score'] > 0.7 or ai_content_result['score'] > 0.7:
-        alert_level = 'high'
-    elif plagiarism_result['score'] > 0.4 or ai_content_result['score'] > 0.4:
-        alert_level = 'medium'
+    # Enregistrer la détection dans la base de données (un résultat en cache a déjà été enregistré, sauf s'il a changé depuis)
+    if not analysis['cached'] or analysis['updated']:
+        _insert_text_detections([_text_detection_row(student_id, analysis)])
+
+    return jsonify({
+        "plagiarism_score": plagiarism_result['score'],
+        "plagiarism_flags": plagiarism_result['flags'],
+        "ai_content_score": ai_content_result['score'],
+        "alert_level": alert_level,
+        "message": message,
+        "cached": analysis['cached']
+    })
 
-    # Préparer les détails pour le log
+def _text_detection_row(student_id, analysis):
+    """Ligne de la table detections pour une analyse textuelle."""
     details = {
-        "plagiarism": plagiarism_result,
-        "ai_content": ai_content_result
+        "plagiarism": analysis['plagiarism'],
+        "ai_content": analysis['ai_content']
     }
-    message = f"Détection textuelle: Plagiat={plagiarism_result['score']:.2f}, IA={ai_content_result['score']:.2f}"
+    return (student_id, 'text', analysis['alert_level'], analysis['message'], json.dumps(details))
 
-    # Enregistrer la détection dans la base de données
+def _insert_text_detections(rows):
+    """Enregistre des détections textuelles en une seule transaction."""
+    if not rows:
+        return
     with get_db_connection() as conn:
-        conn.execute(
+        conn.executemany(
             "INSERT INTO detections (student_id, type, alert_level, message, details) VALUES (?, ?, ?, ?, ?)",
-            (student_id, 'text', alert_level, message, json.dumps(details))
+            rows
         )
         conn.commit()
 
-    return jsonify({
-        "plagiarism_score": plagiarism_result['score'],
-        "plagiarism_flags": plagiarism_result['flags'],
-        "ai_content_score": ai_content_result['score'],
-        "alert_level": alert_level,
-        "message": message
-    })
+def _iter_ndjson(lines):
+    """Documents d'un flux NDJSON (un objet JSON par ligne) ; une ligne invalide donne None."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
 
-@app.route('/api/detect/realtime', methods=['POST'])
-def api_detect_realtime():
+def _text_batch_events(documents):
     """
-    Endpoint API pour le traitement en temps réel des frames vidéo et des chunks audio.
-    Reçoit une frame vidéo encodée en base64 et un chunk audio encodé en base64 (optionnel).
+    Analyse un lot de documents sur le pool de processus et produit les événements à transmettre :
+    un 'result' (ou 'error') par document dès qu'il est terminé, un 'progress' au plus toutes les
+    BATCH_PROGRESS_INTERVAL_S, et un 'summary' final. Les détections sont enregistrées en une seule
+    transaction à la fin du lot (ou à son interruption).
     """
-    data = request.json
-    image_base64 = data.get('image', '')
-    audio_base64 = data.get('audio', None) # Peut être null si seul la vidéo est envoyée
-    student_id = data.get('student_id', 'unknown')
-
-    if not image_base64:
-        return jsonify({"error": "No image data provided."}), 400
-
-    # Décoder l'image base64 en tableau numpy OpenCV
+    progress = BatchProgress()
+    rows = []
+    last_progress = time.monotonic()
     try:
-        nparr = np.frombuffer(base64.b64decode(image_base64), np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        if frame is None:
-            raise ValueError("Could not decode image.")
-    except Exception as e:
-        return jsonify({"error": f"Invalid image data: {e}"}), 400
-
-    # Décoder le chunk audio si fourni
-    audio_data_chunk = None
-    if audio_base64:
-        try:
-            # SpeechRecognition.AudioData attend (binary_data, sample_rate, sample_width)
-            # Assurez-vous que le frontend envoie le bon format (ex: 16-bit PCM)
-            audio_bytes = base64.b64decode(audio_base64)
-            audio_data_chunk = visual_audio_detection._recognizer.AudioData(
-                audio_bytes,
-                visual_audio_detection.AUDIO_SAMPLE_RATE,
-                2 # Sample width for 16-bit audio
+        for item in text_batch_pool.analyze(documents, progress):
+            if "error" in item:
+                yield {"type": "error", "index": item["index"], "id": item["id"], "error": item["error"]}
+            else:
+                analysis = item["analysis"]
+                if not analysis["cached"] or analysis["updated"]:
+                    rows.append(_text_detection_row(item["student_id"], analysis))
+                yield {
+                    "type": "result",
+                    "index": item["index"],
+                    "id": item["id"],
+                    "student_id": item["student_id"],
+                    "plagiarism_score": analysis["plagiarism"]["score"],
+                    "plagiarism_flags": analysis["plagiarism"]["flags"],
+                    "ai_content_score": analysis["ai_content"]["score"],
+                    "alert_level": analysis["alert_level"],
+                    "cached": analysis["cached"]
+                }
+            now = time.monotonic()
+            if now - last_progress >= BATCH_PROGRESS_INTERVAL_S:
+                last_progress = now
+                yield dict(type="progress", **progress.snapshot())
+    finally:
+        _insert_text_detections(rows)
+    yield dict(type="summary", rows_written=len(rows), **progress.snapshot())
+
+@app.route('/api/detect/text/batch', methods=['POST'])
+def api_detect_text_batch():
+    """
+    Endpoint API d'analyse textuelle par lots (par exemple tous les devoirs d'une classe).
+    Reçoit {"documents": [{"id", "student_id", "text"}, ...]} en JSON, ou les mêmes objets en
+    NDJSON (application/x-ndjson, un document par ligne, lu au fil de l'eau).
+    Les résultats sont renvoyés en NDJSON au fur et à mesure (événements result / error / progress / summary).
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        documents = _iter_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        documents = data.get('documents') if isinstance(data, dict) else data
+        if not isinstance(documents, list):
+            return jsonify({"error": "No documents provided."}), 400
+
+    def generate():
+        for event in _text_batch_events(documents):
+            yield json.dumps(event) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.cli.command('analyze-texts')
+@click.argument('source', type=click.File('r', encoding='utf-8'), default='-')
+@click.option('--json', 'json_input', is_flag=True, help='Entrée JSON {"documents": [...]} au lieu de NDJSON.')
+def analyze_texts_command(source, json_input):
+    """
+    Analyse un lot de soumissions (NDJSON, un document {id, student_id, text} par ligne, ou '-'
+    pour l'entrée standard). Les résultats sont écrits en NDJSON sur la sortie standard et
+    l'avancement sur la sortie d'erreur.
+    """
+    if json_input:
+        data = json.load(source)
+        documents = data.get('documents', []) if isinstance(data, dict) else data
+    else:
+        documents = _iter_ndjson(source)
+    for event in _text_batch_events(documents):
+        if event["type"] in ("progress", "summary"):
+            click.echo(
+                f"{event['type']}: {event['completed']}/{event['submitted']} analysés, {event['errors']} erreurs, "
+                f"{event['cached']} en cache, {event['docs_per_s']} docs/s", err=True
             )
-        except Exception as e:
-            print(f"AVERTISSEMENT: Erreur lors du décodage du chunk audio: {e}")
-            # Continuer sans audio si erreur
+        else:
+            click.echo(json.dumps(event))
+    text_batch_pool.close()
 
+def _decode_frame(image_buffer):
+    """
+    Décode une image (JPEG/PNG) directement depuis le buffer reçu, à la résolution de travail
+    du pipeline (décodage JPEG à échelle réduite si l'image est plus grande que nécessaire).
+    :return: (frame BGR, échelle image d'origine / frame)
+    """
+    return decode_frame(image_buffer)
+
+def _audio_chunk(audio_bytes):
+    """
+    Chunk audio brut reçu du client (None si absent). Il n'est pas décodé ici : le flux
+    WebM/Opus est décodé en continu dans la session (voir models/audio_stream.py).
+    """
+    return bytes(audio_bytes) if audio_bytes else None
+
+def _ingest_audio(audio_bytes, student_id, exam_id=None):
+    """
+    Transmet un chunk audio reçu seul (canal WebSocket) à la session : il est décodé et analysé à
+    réception, sans attendre la frame suivante (le résultat est repris par la frame suivante).
+    """
+    audio_data_chunk = _audio_chunk(audio_bytes)
+    if audio_data_chunk is None:
+        return
+    if inference_pool is not None:
+        inference_pool.feed_audio(student_id, audio_data_chunk, exam_id)
+    else:
+        visual_audio_detection.ingest_audio(student_id, audio_data_chunk, exam_id)
+
+def _process_realtime_frame(frame, audio_data_chunk, student_id, exam_id=None, source_scale=1.0):
+    """
+    Traite une frame (et son chunk audio) pour une session et enregistre l'alerte éventuelle.
+    Partagé par l'endpoint HTTP et le canal WebSocket.
+    :return: Dictionnaire de résultats de détection.
+    """
     # Appeler la fonction de traitement globale du module visuel/audio
-    results = visual_audio_detection.process_realtime_data(frame, student_id, audio_data_chunk)
+    if inference_pool is not None:
+        results = inference_pool.process(frame, student_id, audio_data_chunk, exam_id, source_scale)
+    else:
+        results = visual_audio_detection.process_realtime_data(frame, student_id, audio_data_chunk, exam_id, source_scale)
 
     # Déterminer le niveau d'alerte pour le log
     alert_level = 'low'
     if results['overall_alert']:
-        if results['identity_verified'] == False or results['multiple_faces_detected'] or results['suspect_objects_detected'] or (results['unexpected_voice_detected'] and visual_audio_detection._unexpected_voice_counter >= visual_audio_detection.UNEXPECTED_VOICE_CONSECUTIVE_ALERTS):
+        if results['identity_verified'] == False or results['multiple_faces_detected'] or results['suspect_objects_detected'] or (results['unexpected_voice_detected'] and results['unexpected_voice_count'] >= visual_audio_detection.UNEXPECTED_VOICE_CONSECUTIVE_ALERTS):
             alert_level = 'high'
         else:
             alert_level = 'medium'
@@ -182,8 +319,183 @@ def api_detect_realtime():
             )
             conn.commit()
 
+    return results
+
+def _upload_buffer(file_storage):
+    """
+    Contenu d'un fichier multipart sans copie supplémentaire quand Werkzeug l'a gardé en mémoire.
+    """
+    stream = file_storage.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return stream.read()
+
+def _read_realtime_payload():
+    """
+    Extrait (image, audio, student_id, exam_id) de la requête temps réel. Formats acceptés :
+    - multipart/form-data : parties 'image' (JPEG) et 'audio' (optionnelle), champs student_id / exam_id ;
+    - corps brut image/jpeg : student_id / exam_id en paramètres d'URL ;
+    - JSON (ancien format) : image et audio encodés en base64.
+    Les images et l'audio sont retournés sous forme de buffers binaires (bytes ou memoryview).
+    """
+    if request.mimetype == 'multipart/form-data':
+        image_file = request.files.get('image')
+        audio_file = request.files.get('audio')
+        return (
+            _upload_buffer(image_file) if image_file else None,
+            _upload_buffer(audio_file) if audio_file else None,
+            request.form.get('student_id', 'unknown'),
+            request.form.get('exam_id', None)
+        )
+    if request.mimetype in ('image/jpeg', 'image/png', 'application/octet-stream'):
+        return (
+            request.get_data(cache=False),
+            None,
+            request.args.get('student_id', 'unknown'),
+            request.args.get('exam_id', None)
+        )
+
+    data = request.get_json(silent=True) or {}
+    image_base64 = data.get('image', '')
+    audio_base64 = data.get('audio', None) # Peut être null si seul la vidéo est envoyée
+    return (
+        base64.b64decode(image_base64) if image_base64 else None,
+        base64.b64decode(audio_base64) if audio_base64 else None,
+        data.get('student_id', 'unknown'),
+        data.get('exam_id', None)
+    )
+
+@app.route('/api/detect/realtime', methods=['POST'])
+def api_detect_realtime():
+    """
+    Endpoint API pour le traitement en temps réel des frames vidéo et des chunks audio.
+    Reçoit une frame JPEG binaire (multipart ou corps image/jpeg) et un chunk audio optionnel,
+    ou l'ancien format JSON avec image et audio encodés en base64.
+    """
+    try:
+        image_buffer, audio_bytes, student_id, exam_id = _read_realtime_payload()
+    except Exception as e:
+        return jsonify({"error": f"Invalid request payload: {e}"}), 400
+
+    if not image_buffer:
+        return jsonify({"error": "No image data provided."}), 400
+
+    # Décoder l'image directement depuis le buffer de la requête
+    try:
+        frame, source_scale = _decode_frame(image_buffer)
+    except Exception as e:
+        return jsonify({"error": f"Invalid image data: {e}"}), 400
+
+    try:
+        results = _process_realtime_frame(frame, _audio_chunk(audio_bytes), student_id, exam_id, source_scale)
+    except (WorkerCrashed, TimeoutError, FutureTimeoutError) as e:
+        # Processus d'inférence arrêté ou saturé : le client peut réessayer ; les autres erreurs restent des 500
+        return jsonify({"error": f"Inference unavailable: {e}"}), 503
+
     return jsonify(results)
 
+# --- Canal WebSocket de Surveillance d'Examen ---
+# Messages client -> serveur :
+#   binaires : 1 octet de type (WS_FRAME_MESSAGE ou WS_AUDIO_MESSAGE) suivi du JPEG ou du chunk audio ;
+#   texte JSON : commandes de contrôle, ex. {"type": "reset"}.
+# Messages serveur -> client (texte JSON) : {"type": "result", "results": {...}} ou {"type": "error", "error": "..."}.
+WS_FRAME_MESSAGE = 0x01
+WS_AUDIO_MESSAGE = 0x02
+
+class ExamStream:
+    """
+    Tampon d'une connexion WebSocket entre la réception et le traitement.
+    Politique "la dernière frame gagne" : si le serveur est plus lent que le client, une frame
+    reçue remplace celle qui attend encore, au lieu de s'accumuler dans une file. L'audio ne passe
+    pas par ce tampon : il est transmis à la session dès sa réception (voir _ingest_audio).
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.latest_frame = None
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.closed = False
+
+    def push_frame(self, image_bytes):
+        with self.condition:
+            self.frames_received += 1
+            if self.latest_frame is not None:
+                self.frames_dropped += 1
+            self.latest_frame = image_bytes
+            self.condition.notify()
+
+    def take(self):
+        """
+        Attend la prochaine frame à traiter.
+        :return: image_bytes, ou None si la connexion est fermée.
+        """
+        with self.condition:
+            while self.latest_frame is None and not self.closed:
+                self.condition.wait()
+            image_bytes, self.latest_frame = self.latest_frame, None
+            return image_bytes
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+def _exam_stream_worker(ws, stream, student_id, exam_id):
+    """Traite les frames d'une connexion WebSocket au fil de l'eau et renvoie les résultats."""
+    while True:
+        image_bytes = stream.take()
+        if image_bytes is None:
+            break
+        try:
+            frame, source_scale = _decode_frame(image_bytes)
+            results = _process_realtime_frame(frame, None, student_id, exam_id, source_scale)
+            results["stream"] = {"frames_received": stream.frames_received, "frames_dropped": stream.frames_dropped}
+            message = {"type": "result", "results": results}
+        except Exception as e:
+            message = {"type": "error", "error": str(e)}
+        try:
+            ws.send(json.dumps(message))
+        except Exception:
+            break # Connexion fermée par le client
+
+if sock is not None:
+    @sock.route('/ws/exam')
+    def ws_exam(ws):
+        """
+        Canal WebSocket bidirectionnel pour une session d'examen (student_id / exam_id en paramètres d'URL) :
+        les frames et l'audio montent en binaire, les résultats descendent dès qu'ils sont prêts.
+        """
+        student_id = request.args.get('student_id', 'unknown')
+        exam_id = request.args.get('exam_id', None)
+        stream = ExamStream()
+        worker = threading.Thread(target=_exam_stream_worker, args=(ws, stream, student_id, exam_id), daemon=True)
+        worker.start()
+        try:
+            while True:
+                message = ws.receive()
+                if message is None:
+                    break
+                if isinstance(message, (bytes, bytearray)):
+                    if len(message) < 2:
+                        continue
+                    if message[0] == WS_FRAME_MESSAGE:
+                        stream.push_frame(memoryview(message)[1:])
+                    elif message[0] == WS_AUDIO_MESSAGE:
+                        _ingest_audio(bytes(message[1:]), student_id, exam_id)
+                else:
+                    control = json.loads(message)
+                    if control.get('type') == 'reset':
+                        if inference_pool is not None:
+                            inference_pool.reset(student_id, exam_id)
+                        else:
+                            visual_audio_detection.reset_visual_module_state(student_id, exam_id)
+        except Exception as e:
+            print(f"Connexion WebSocket de {student_id} fermée: {e}")
+        finally:
+            stream.close()
+            worker.join(timeout=5)
+
 @app.route('/api/proactive/ask', methods=['POST'])
 def api_proactive_ask():
     """
@@ -214,13 +526,27 @@ def api_educator_alerts():
             alert['details'] = json.loads(alert['details'])
     return jsonify(alerts_list)
 
+@app.route('/api/realtime/stats', methods=['GET'])
+def api_realtime_stats():
+    """
+    Endpoint API de supervision du pipeline temps réel (sessions, taille des lots YOLO, files d'attente).
+    """
+    if inference_pool is not None:
+        return jsonify(inference_pool.stats())
+    return jsonify(visual_audio_detection.get_realtime_stats())
+
 @app.route('/api/reset_visual_audio_state', methods=['POST'])
 def api_reset_visual_audio_state():
     """
     Endpoint API pour réinitialiser l'état du module visuel/audio.
     À appeler au début d'un nouvel examen pour réinitialiser les compteurs.
+    Si un student_id (et éventuellement un exam_id) est fourni, seule sa session est réinitialisée.
     """
-    visual_audio_detection.reset_visual_module_state()
+    data = request.get_json(silent=True) or {}
+    if inference_pool is not None:
+        inference_pool.reset(data.get('student_id'), data.get('exam_id'))
+    else:
+        visual_audio_detection.reset_visual_module_state(data.get('student_id'), data.get('exam_id'))
     return jsonify({"status": "Visual and audio module state reset successfully."})
 
 
@@ -234,4 +560,6 @@ if __name__ == '__main__':
         cv2.imwrite(KNOWN_STUDENT_FACE_PATH, dummy_image)
         print(f"Création d'une image placeholder pour l'enrôlement : {KNOWN_STUDENT_FACE_PATH}")
 
+    # SIGTERM (arrêt du service) termine proprement l'interpréteur : les fonctions atexit libèrent le pool d'inférence
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(debug=True, host='0.0.0.0', port=5000) # Host 0.0.0.0 pour accès depuis d'autres machines si besoin
@@ -0,0 +1,266 @@
+# models/audio_stream.py
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+from models.voice_activity import VAD_SAMPLE_RATE
+
+# --- Paramètres du Flux Audio des Sessions ---
+AUDIO_DECODER = os.environ.get('SIPA_AUDIO_DECODER', 'ffmpeg') # Exécutable utilisé pour décoder WebM/Opus en PCM
+AUDIO_RING_SECONDS = float(os.environ.get('SIPA_AUDIO_RING_SECONDS', 10)) # Audio décodé conservé par session
+AUDIO_WINDOW_S = 1.0 # Durée d'une fenêtre d'analyse
+AUDIO_HOP_S = 0.5 # Pas entre deux fenêtres d'analyse (fenêtres glissantes, recouvrement de 50 %)
+AUDIO_MAX_WINDOWS_PER_CALL = 4 # En cas de retard, seules les fenêtres les plus récentes sont analysées
+AUDIO_MAX_PENDING_CHUNKS = 32 # Chunks compressés en attente d'écriture vers le décodeur (au-delà ils sont abandonnés)
+RAW_PCM_SAMPLE_RATE = 44100 # Fréquence supposée d'un chunk PCM 16 bits brut (ancien format, sans conteneur)
+PCM_READ_BYTES = 4096
+
+# Signatures des conteneurs audio reconnus en début de flux (EBML = WebM/Matroska)
+CONTAINER_MAGICS = (b'\x1a\x45\xdf\xa3', b'OggS', b'RIFF')
+
+
+def _decoder_available():
+    return shutil.which(AUDIO_DECODER) is not None
+
+
+class PcmRingBuffer:
+    """
+    Tampon circulaire de taille fixe d'échantillons PCM (int16). Les positions sont absolues
+    (nombre total d'échantillons écrits depuis la création), ce qui permet de lire une fenêtre
+    glissante tant qu'elle n'a pas été écrasée.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=np.int16)
+        self.total_written = 0
+        self.lock = threading.Lock()
+
+    def write(self, samples: np.ndarray):
+        # Au-delà de la capacité seuls les derniers échantillons sont gardés, mais la position du flux avance de tout l'écrit
+        written = len(samples)
+        samples = samples[-self.capacity:]
+        with self.lock:
+            start = (self.total_written + written - len(samples)) % self.capacity
+            first = min(len(samples), self.capacity - start)
+            self.buffer[start:start + first] = samples[:first]
+            self.buffer[:len(samples) - first] = samples[first:]
+            self.total_written += written
+
+    def read(self, end: int, length: int):
+        """
+        Échantillons [end - length, end) en float32 dans [-1, 1].
+        :return: np.array, ou None si la fenêtre n'est plus (ou pas encore) dans le tampon.
+        """
+        with self.lock:
+            if end > self.total_written or end - length < max(0, self.total_written - self.capacity):
+                return None
+            indices = np.arange(end - length, end) % self.capacity
+            return self.buffer[indices].astype(np.float32) / 32768.0
+
+    def clear(self):
+        with self.lock:
+            self.total_written = 0
+
+
+class StreamingAudioDecoder:
+    """
+    Décodeur continu d'un flux audio compressé (WebM/Opus de MediaRecorder) : un processus
+    ffmpeg par session reçoit les chunks sur son entrée standard et conserve l'état du conteneur
+    et du codec d'un chunk à l'autre ; le PCM mono 16 bits produit est écrit dans le tampon
+    circulaire de la session. Un thread écrit les chunks vers ffmpeg, un autre lit le PCM et
+    appelle `on_samples()` après chaque écriture dans le tampon.
+    """
+
+    def __init__(self, ring: PcmRingBuffer, sample_rate: int = VAD_SAMPLE_RATE, on_samples=None):
+        self.ring = ring
+        self.sample_rate = sample_rate
+        self.on_samples = on_samples
+        self.process = None
+        self._chunks = None
+        self.dropped_chunks = 0
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [AUDIO_DECODER, '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0',
+             '-f', 's16le', '-ac', '1', '-ar', str(self.sample_rate), 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._chunks = queue.Queue(maxsize=AUDIO_MAX_PENDING_CHUNKS)
+        threading.Thread(target=self._write_loop, args=(self.process, self._chunks), name="sipa-audio-in", daemon=True).start()
+        threading.Thread(target=self._read_loop, args=(self.process,), name="sipa-audio-out", daemon=True).start()
+
+    def feed(self, chunk: bytes):
+        """Transmet un chunk compressé au décodeur (sans bloquer ; abandonné si le décodeur est saturé)."""
+        try:
+            self._chunks.put_nowait(chunk)
+        except queue.Full:
+            self.dropped_chunks += 1
+
+    def close(self):
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            self._chunks.put_nowait(None) # Fin du flux : ffmpeg termine le décodage puis s'arrête
+        except queue.Full:
+            process.kill()
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    @staticmethod
+    def _write_loop(process, chunks):
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            try:
+                process.stdin.write(chunk)
+                process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                break
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+
+    def _read_loop(self, process):
+        pending = b''
+        while True:
+            data = process.stdout.read1(PCM_READ_BYTES)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % 2
+            pending = data[usable:]
+            self.ring.write(np.frombuffer(data[:usable], dtype='<i2'))
+            if self.on_samples is not None:
+                try:
+                    self.on_samples()
+                except Exception as e:
+                    print(f"Erreur de traitement audio: {e}")
+
+
+class SessionAudioStream:
+    """
+    Audio d'une session d'examen : les chunks reçus du navigateur sont décodés en continu dans un
+    tampon circulaire de AUDIO_RING_SECONDS (mémoire bornée par session), et l'analyse porte sur
+    des fenêtres glissantes de ce tampon, au rythme de l'audio reçu et non des frames vidéo.
+    Un chunk PCM 16 bits sans conteneur (ancien format) est rééchantillonné et écrit directement.
+    `on_samples` (optionnel) est appelé dès que de nouveaux échantillons sont dans le tampon :
+    depuis `feed` pour le PCM brut, depuis le thread de lecture du décodeur pour l'audio compressé.
+    """
+
+    def __init__(self, sample_rate: int = VAD_SAMPLE_RATE, ring_seconds: float = AUDIO_RING_SECONDS,
+                 window_s: float = AUDIO_WINDOW_S, hop_s: float = AUDIO_HOP_S):
+        self.sample_rate = sample_rate
+        self.window = int(window_s * sample_rate)
+        self.hop = int(hop_s * sample_rate)
+        self.ring = PcmRingBuffer(int(ring_seconds * sample_rate))
+        self.decoder = None
+        self.on_samples = None
+        self.compressed = False # Vrai dès qu'un en-tête de conteneur a été reçu (les chunks suivants en sont la suite)
+        self.next_window_end = self.window # Position (absolue) de fin de la prochaine fenêtre à analyser
+        self.chunks_received = 0
+        self.windows_analyzed = 0
+        self.windows_skipped = 0
+
+    @property
+    def started(self):
+        """Vrai dès qu'un chunk audio a été reçu pour la session."""
+        return self.chunks_received > 0
+
+    def feed(self, chunk: bytes):
+        """Ajoute un chunk audio reçu du client (WebM/Ogg/WAV compressé, ou PCM 16 bits brut)."""
+        if not chunk:
+            return
+        chunk = bytes(chunk)
+        self.chunks_received += 1
+        if chunk.startswith(CONTAINER_MAGICS):
+            # Un nouvel en-tête de conteneur = nouvel enregistrement côté client : nouveau décodeur
+            self.compressed = True
+            self._restart_decoder()
+        if not self.compressed:
+            self._write_raw_pcm(chunk)
+        elif self.decoder is not None:
+            self.decoder.feed(chunk)
+
+    def _restart_decoder(self):
+        if self.decoder is not None:
+            self.decoder.close()
+            self.decoder = None
+        if not _decoder_available():
+            print(f"AVERTISSEMENT: Décodeur audio '{AUDIO_DECODER}' introuvable, l'audio compressé est ignoré.")
+            return
+        self.decoder = StreamingAudioDecoder(self.ring, self.sample_rate, self._notify_samples)
+        self.decoder.start()
+
+    def _write_raw_pcm(self, chunk: bytes):
+        samples = np.frombuffer(chunk[:len(chunk) - len(chunk) % 2], dtype='<i2')
+        if RAW_PCM_SAMPLE_RATE != self.sample_rate and len(samples):
+            count = int(len(samples) * self.sample_rate / RAW_PCM_SAMPLE_RATE)
+            positions = np.linspace(0, len(samples) - 1, count)
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+        self.ring.write(samples)
+        self._notify_samples()
+
+    def _notify_samples(self):
+        if self.on_samples is not None:
+            self.on_samples()
+
+    def take_windows(self, max_windows: int = AUDIO_MAX_WINDOWS_PER_CALL):
+        """
+        Fenêtres glissantes complètes décodées depuis le dernier appel.
+        :return: Liste de np.array float32 (une par fenêtre), de la plus ancienne à la plus récente.
+        """
+        available = self.ring.total_written
+        ready = (available - self.next_window_end) // self.hop + 1 if available >= self.next_window_end else 0
+        if ready > max_windows:
+            # En retard : on saute directement aux fenêtres les plus récentes
+            self.windows_skipped += ready - max_windows
+            self.next_window_end += (ready - max_windows) * self.hop
+            ready = max_windows
+        windows = []
+        for _ in range(ready):
+            window = self.ring.read(self.next_window_end, self.window)
+            self.next_window_end += self.hop
+            if window is not None:
+                windows.append(window)
+        self.windows_analyzed += len(windows)
+        return windows
+
+    def memory_estimate(self):
+        """Estimation (octets) de la mémoire retenue par le flux audio."""
+        return self.ring.buffer.nbytes + AUDIO_MAX_PENDING_CHUNKS * 16 * 1024
+
+    def reset(self):
+        self.close()
+        self.ring.clear()
+        self.compressed = False
+        self.next_window_end = self.window
+        self.chunks_received = 0
+
+    def close(self):
+        if self.decoder is not None:
+            self.decoder.close()
+            self.decoder = None
+
+    def stats(self):
+        return {
+            "chunks_received": self.chunks_received,
+            "decoded_seconds": self.ring.total_written / self.sample_rate,
+            "windows_analyzed": self.windows_analyzed,
+            "windows_skipped": self.windows_skipped,
+            "decoder_running": self.decoder is not None and self.decoder.running,
+            "dropped_chunks": self.decoder.dropped_chunks if self.decoder is not None else 0,
+        }
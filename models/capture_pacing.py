@@ -0,0 +1,49 @@
+# models/capture_pacing.py
+import os
+
+from models.frame_preparation import FRAME_MAX_SIDE
+
+# --- Paramètres du Rythme de Capture du Client ---
+# Chaque réponse temps réel indique au navigateur quand capturer la frame suivante, à quelle
+# largeur et avec quelle qualité JPEG. Une image plus large que FRAME_MAX_SIDE serait de toute
+# façon réduite au décodage : c'est la largeur maximale demandée.
+PACING_ALERT_INTERVAL_MS = int(os.environ.get('SIPA_PACING_ALERT_INTERVAL_MS', 500)) # Session en alerte : pleine fidélité
+PACING_BASE_INTERVAL_MS = int(os.environ.get('SIPA_PACING_BASE_INTERVAL_MS', 1000)) # Rythme normal
+PACING_CALM_INTERVAL_MS = int(os.environ.get('SIPA_PACING_CALM_INTERVAL_MS', 3000)) # Session calme
+PACING_MAX_INTERVAL_MS = int(os.environ.get('SIPA_PACING_MAX_INTERVAL_MS', 6000)) # Plafond sous forte charge
+PACING_CALM_AFTER_S = float(os.environ.get('SIPA_PACING_CALM_AFTER_S', 30)) # Délai sans alerte avant de passer au rythme calme
+PACING_CALM_WIDTH = 480 # Largeur demandée à une session calme
+PACING_MIN_WIDTH = 240
+PACING_JPEG_QUALITY = {"alert": 0.85, "normal": 0.8, "calm": 0.7}
+PACING_MIN_JPEG_QUALITY = 0.5
+PACING_QUALITY_STEP_PER_TIER = 0.05 # Qualité JPEG retirée par niveau de dégradation du processus
+
+
+def pacing_hints(node_tier: int, detail_scale: float = 1.0, alert_active: bool = False, calm: bool = False,
+                 shed: bool = False):
+    """
+    Consignes de capture pour la prochaine frame d'une session.
+    Une session en alerte reçoit toujours la pleine fidélité ; sinon l'intervalle s'allonge avec
+    le calme de la session et avec la charge du processus, et la largeur suit la réduction de
+    résolution appliquée par les niveaux de qualité (models/load_shedding.py).
+    :param node_tier: Niveau de qualité du processus (0 = pleine qualité).
+    :param detail_scale: Facteur de résolution du niveau de la session.
+    :param shed: Vrai si la frame n'a pas été analysée (processus saturé) : rythme minimal.
+    :return: Dict {interval_ms, width, jpeg_quality}.
+    """
+    if shed:
+        return {"interval_ms": PACING_MAX_INTERVAL_MS, "width": PACING_CALM_WIDTH,
+                "jpeg_quality": PACING_MIN_JPEG_QUALITY}
+    if alert_active:
+        return {"interval_ms": PACING_ALERT_INTERVAL_MS, "width": FRAME_MAX_SIDE,
+                "jpeg_quality": PACING_JPEG_QUALITY["alert"]}
+
+    mode = "calm" if calm else "normal"
+    interval_ms = (PACING_CALM_INTERVAL_MS if calm else PACING_BASE_INTERVAL_MS) * (1 + node_tier)
+    width = (PACING_CALM_WIDTH if calm else FRAME_MAX_SIDE) * detail_scale
+    quality = PACING_JPEG_QUALITY[mode] - PACING_QUALITY_STEP_PER_TIER * node_tier
+    return {
+        "interval_ms": int(min(interval_ms, PACING_MAX_INTERVAL_MS)),
+        "width": int(max(width, PACING_MIN_WIDTH)),
+        "jpeg_quality": round(max(quality, PACING_MIN_JPEG_QUALITY), 2),
+    }
@@ -0,0 +1,82 @@
+# models/detector_scheduling.py
+import time
+
+# --- Cadence des Détecteurs ---
+# period : le détecteur tourne une frame sur `period` (1 = chaque frame).
+# priority : ordre d'exécution dans une frame (0 = le plus prioritaire).
+# Entre deux exécutions, le dernier résultat du détecteur est reporté dans la réponse.
+# Un détecteur dont le dernier résultat signale une alerte en cours repasse à chaque frame.
+DETECTOR_SCHEDULE = {
+    "head_pose":      {"period": 1,  "priority": 0},
+    "multiple_faces": {"period": 1,  "priority": 1},
+    "audio":          {"period": 1,  "priority": 2},
+    "objects":        {"period": 3,  "priority": 3},
+    "identity":       {"period": 10, "priority": 4},
+}
+
+
+class DetectorScheduler:
+    """
+    Planification des détecteurs d'une session : décide quels détecteurs tournent sur la frame
+    courante et conserve le dernier résultat de chacun pour le reporter sur les frames suivantes.
+    """
+
+    def __init__(self, schedule: dict = None):
+        self.schedule = schedule or DETECTOR_SCHEDULE
+        self.reset()
+
+    def reset(self):
+        self.frame_index = -1
+        self._last_run_frame = {} # Dict: {detector: index de la dernière frame exécutée}
+        self._last_run_time = {}  # Dict: {detector: instant (monotonic) de la dernière exécution}
+        self._last_output = {}    # Dict: {detector: dict de résultats}
+        self._alert_pending = {}  # Dict: {detector: bool}
+        self.run_counts = {name: 0 for name in self.schedule}
+
+    def next_frame(self):
+        """
+        Passe à la frame suivante.
+        :return: Liste des détecteurs à exécuter sur cette frame, par priorité croissante.
+        """
+        self.frame_index += 1
+        due = [name for name in self.schedule if self.is_due(name)]
+        return sorted(due, key=lambda name: self.schedule[name]["priority"])
+
+    def is_due(self, name: str):
+        """Vrai si le détecteur doit tourner sur la frame courante."""
+        last_run = self._last_run_frame.get(name)
+        if last_run is None or self._alert_pending.get(name):
+            return True
+        return self.frame_index - last_run >= self.schedule[name]["period"]
+
+    def record(self, name: str, output: dict, alert_pending: bool):
+        """
+        Enregistre le résultat d'un détecteur exécuté sur la frame courante.
+        :param alert_pending: Vrai si ce résultat signale une alerte en cours (le détecteur est alors
+                              promu à chaque frame jusqu'à ce qu'elle retombe).
+        """
+        self._last_run_frame[name] = self.frame_index
+        self._last_run_time[name] = time.monotonic()
+        self._last_output[name] = output
+        self._alert_pending[name] = alert_pending
+        self.run_counts[name] = self.run_counts.get(name, 0) + 1
+
+    def alert_pending(self):
+        """Vrai si le dernier résultat d'au moins un détecteur signale une alerte en cours (ou en train de se confirmer)."""
+        return any(self._alert_pending.values())
+
+    def seconds_since_run(self, name: str):
+        """Secondes écoulées depuis la dernière exécution du détecteur (infini s'il n'a jamais tourné)."""
+        last_run = self._last_run_time.get(name)
+        return float('inf') if last_run is None else time.monotonic() - last_run
+
+    def carried_output(self, name: str):
+        """Dernier résultat connu du détecteur (dict vide s'il n'a jamais tourné)."""
+        return self._last_output.get(name, {})
+
+    def stats(self):
+        frames = self.frame_index + 1
+        return {
+            "frames": frames,
+            "run_ratio": {name: (count / frames if frames else 0.0) for name, count in self.run_counts.items()},
+        }
@@ -0,0 +1,137 @@
+# models/face_search.py
+import os
+import threading
+
+import numpy as np
+
+# --- Paramètres de la Recherche 1:N dans la Cohorte ---
+FACE_SEARCH_TOP_K = int(os.environ.get('SIPA_FACE_SEARCH_TOP_K', 3)) # Nombre d'identités les plus proches retournées
+FACE_SEARCH_ANN_MIN_COHORT = int(os.environ.get('SIPA_FACE_SEARCH_ANN_MIN', 5000)) # Taille de cohorte à partir de laquelle l'index approché est utilisé
+FACE_SEARCH_NPROBE = int(os.environ.get('SIPA_FACE_SEARCH_NPROBE', 8)) # Nombre de listes (cellules) explorées par requête dans l'index approché
+KMEANS_ITERATIONS = 10 # Itérations de k-means pour construire les cellules de l'index approché
+KMEANS_SEED = 0
+
+
+def _squared_distances(vectors: np.ndarray, query: np.ndarray):
+    """Distances euclidiennes au carré entre une requête (dim,) et chaque ligne de `vectors` (n, dim)."""
+    diff = vectors - query
+    return np.einsum('ij,ij->i', diff, diff)
+
+
+def _top_k(distances: np.ndarray, k: int):
+    """Indices des k plus petites distances, triés (argpartition : O(n) au lieu d'un tri complet)."""
+    k = min(k, distances.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k < distances.shape[0]:
+        candidates = np.argpartition(distances, k - 1)[:k]
+    else:
+        candidates = np.arange(distances.shape[0])
+    return candidates[np.argsort(distances[candidates])]
+
+
+def kmeans(vectors: np.ndarray, num_clusters: int, iterations: int = KMEANS_ITERATIONS, seed: int = KMEANS_SEED):
+    """
+    K-means simple (numpy) pour découper la cohorte en cellules.
+    :return: (centroïdes (num_clusters, dim), np.array de l'indice de cellule de chaque vecteur)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], num_clusters, replace=False)].copy()
+    vector_norms = np.einsum('ij,ij->i', vectors, vectors)[:, None]
+    for _ in range(iterations):
+        # |v - c|² = |v|² - 2 v.c + |c|², calculé en un produit matriciel
+        distances = vector_norms - 2.0 * vectors @ centroids.T + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+        assignments = distances.argmin(axis=1)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+    return centroids, assignments
+
+
+class CohortFaceIndex:
+    """
+    Recherche 1:N d'un encodage facial parmi tous les étudiants enrôlés (détection d'une personne
+    qui passe l'examen à la place d'un autre étudiant de la cohorte).
+    - Petite cohorte : distances exactes, calcul vectorisé sur la matrice des encodages, puis top-k.
+    - Grande cohorte : index approché par cellules (IVF) construit par k-means ; seules les
+      `nprobe` cellules les plus proches de la requête sont comparées exactement.
+    L'index est reconstruit à la demande quand les encodages du stockage changent.
+    """
+
+    def __init__(self, store, top_k: int = FACE_SEARCH_TOP_K, ann_min_cohort: int = FACE_SEARCH_ANN_MIN_COHORT,
+                 nprobe: int = FACE_SEARCH_NPROBE):
+        self.store = store
+        self.top_k = top_k
+        self.ann_min_cohort = ann_min_cohort
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._version = None
+        # (student_ids, matrice, centroïdes ou None pour la recherche exacte, indices des lignes de chaque cellule)
+        # remplacé d'un bloc pour que les recherches concurrentes voient un index cohérent
+        self._index = ([], None, None, [])
+        self.searches = 0
+
+    def _ensure_current(self):
+        # Enrôlements faits par un autre processus (inférence, analyse par lots) : un stat de l'index suffit s'il n'a pas changé
+        self.store.refresh()
+        version, ids, matrix = self.store.snapshot()
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            centroids, cells = None, []
+            if self.ann_min_cohort and len(ids) >= self.ann_min_cohort:
+                num_clusters = max(1, int(np.sqrt(len(ids))))
+                centroids, assignments = kmeans(matrix, num_clusters)
+                order = np.argsort(assignments, kind='stable')
+                bounds = np.searchsorted(assignments[order], np.arange(num_clusters + 1))
+                cells = [order[bounds[c]:bounds[c + 1]] for c in range(num_clusters)]
+                print(f"Index de recherche faciale approché construit ({len(ids)} encodages, {num_clusters} cellules).")
+            self._index = (ids, matrix, centroids, cells)
+            self._version = version
+
+    def search(self, encoding: np.ndarray, k: int = None, exclude: str = None):
+        """
+        Identités enrôlées les plus proches d'un encodage.
+        :param encoding: Encodage facial (128 dimensions).
+        :param k: Nombre de résultats (FACE_SEARCH_TOP_K par défaut).
+        :param exclude: student_id à exclure des résultats (ex: l'étudiant censé passer l'examen).
+        :return: Liste de (student_id, distance), par distance croissante.
+        """
+        self._ensure_current()
+        ids, matrix, centroids, cells = self._index
+        if not ids:
+            return []
+        k = self.top_k if k is None else k
+        query = np.asarray(encoding, dtype=np.float32).reshape(-1)
+        self.searches += 1
+
+        if centroids is None:
+            rows = None
+            distances = _squared_distances(matrix, query)
+        else:
+            probed = _top_k(_squared_distances(centroids, query), self.nprobe)
+            rows = np.concatenate([cells[c] for c in probed])
+            distances = _squared_distances(matrix[rows], query)
+
+        # Un résultat de plus pour pouvoir écarter l'identité exclue
+        best = _top_k(distances, k + (1 if exclude is not None else 0))
+        results = []
+        for position in best:
+            student_id = ids[position if rows is None else rows[position]]
+            if student_id == exclude:
+                continue
+            results.append((student_id, float(np.sqrt(distances[position]))))
+        return results[:k]
+
+    def stats(self):
+        ids, _, centroids, cells = self._index
+        return {
+            "cohort_size": len(ids),
+            "approximate": centroids is not None,
+            "cells": len(cells),
+            "searches": self.searches,
+        }
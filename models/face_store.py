@@ -0,0 +1,173 @@
+# models/face_store.py
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from models.file_lock import FileLock
+
+# --- Paramètres du Stockage des Encodages Faciaux ---
+FACE_STORE_DIR = os.environ.get('SIPA_FACE_STORE_DIR', 'face_store') # Dossier du stockage (relatif au dossier de lancement)
+ENCODING_DIM = 128 # Dimension des encodages dlib
+
+MATRIX_FILE = 'encodings.f32' # Matrice float32 (une ligne par encodage), en ajout seul
+INDEX_FILE = 'index.json' # Index des lignes : student_id, hash de l'image source, taille/mtime du fichier source
+LOCK_FILE = '.lock'
+
+
+def file_sha256(path: str):
+    """Hash SHA-256 du contenu d'un fichier."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FaceEncodingStore:
+    """
+    Stockage disque des encodages faciaux enrôlés.
+    Les encodages sont ajoutés à la fin d'une matrice float32 ouverte en memory-map, et un index
+    JSON associe chaque ligne à un student_id et au hash de l'image source. Au démarrage, seule la
+    matrice est projetée en mémoire : une image n'est ré-encodée que si elle est nouvelle ou a changé.
+    Si un étudiant est ré-enrôlé, sa nouvelle ligne remplace l'ancienne (qui reste dans le fichier).
+    La matrice des encodages actifs (un par étudiant) sert aux comparaisons vectorisées.
+    """
+
+    def __init__(self, directory: str = FACE_STORE_DIR, dim: int = ENCODING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._rows = [] # Index : une entrée par ligne de la matrice
+        self._row_of_student = {} # Dict: {student_id: ligne active}
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._active_ids = []
+        self._active_matrix = np.zeros((0, dim), dtype=np.float32)
+        self._index_mtime = None
+        self.version = 0 # Incrémenté à chaque changement des encodages actifs (invalide les index dérivés)
+        self.refresh()
+
+    @property
+    def matrix_path(self):
+        return os.path.join(self.directory, MATRIX_FILE)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def refresh(self):
+        """Recharge l'index et la projection de la matrice si un autre processus les a modifiés."""
+        with self._lock:
+            try:
+                mtime = os.stat(self.index_path).st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime == self._index_mtime:
+                return
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            rows = index.get('rows', [])
+            # Des lignes au-delà de l'index (ajout interrompu) sont ignorées
+            matrix = np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(len(rows), self.dim)) if rows else np.zeros((0, self.dim), dtype=np.float32)
+            self._rows = rows
+            self._matrix = matrix
+            self._index_mtime = mtime
+            self._rebuild_active()
+
+    def _rebuild_active(self):
+        self._row_of_student = {}
+        for row, entry in enumerate(self._rows):
+            self._row_of_student[entry['student_id']] = row
+        self._active_ids = list(self._row_of_student.keys())
+        active_rows = np.fromiter(self._row_of_student.values(), dtype=np.int64, count=len(self._row_of_student))
+        self._active_matrix = np.asarray(self._matrix[active_rows], dtype=np.float32)
+        self.version += 1
+
+    def __len__(self):
+        return len(self._active_ids)
+
+    def __contains__(self, student_id):
+        return student_id in self._row_of_student
+
+    def get(self, student_id: str):
+        """Encodage actif de l'étudiant (np.array float32), ou None s'il n'est pas enrôlé."""
+        row = self._row_of_student.get(student_id)
+        if row is None:
+            return None
+        return np.asarray(self._matrix[row])
+
+    def is_current(self, student_id: str, image_path: str):
+        """
+        Vrai si l'encodage actif de l'étudiant provient déjà de cette image (même contenu).
+        La taille et la date de modification évitent de relire l'image quand elle n'a pas bougé.
+        """
+        row = self._row_of_student.get(student_id)
+        if row is None:
+            return False
+        entry = self._rows[row]
+        stat = os.stat(image_path)
+        if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+            return True
+        return entry.get('image_hash') == file_sha256(image_path)
+
+    def add(self, student_id: str, encoding: np.ndarray, image_path: str = None):
+        """Ajoute (ou remplace) l'encodage d'un étudiant (voir add_many)."""
+        self.add_many([(student_id, encoding, image_path)])
+
+    def add_many(self, enrollments):
+        """
+        Ajoute (ou remplace) les encodages de plusieurs étudiants en une seule écriture. L'écriture
+        est en ajout seul : les lignes sont écrites dans la matrice avant la mise à jour atomique de
+        l'index, publié une seule fois pour tout le lot.
+        :param enrollments: Itérable de (student_id, encodage, chemin de l'image source ou None).
+        """
+        vectors, entries = [], []
+        for student_id, encoding, image_path in enrollments:
+            vectors.append(np.asarray(encoding, dtype=np.float32).reshape(self.dim))
+            entry = {'student_id': student_id}
+            if image_path is not None:
+                stat = os.stat(image_path)
+                entry.update(image_hash=file_sha256(image_path), source=image_path, size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            entries.append(entry)
+        if not entries:
+            return
+
+        with self._lock, self._file_lock():
+            self.refresh()
+            rows = self._rows + entries
+            with open(self.matrix_path, 'r+b' if os.path.exists(self.matrix_path) else 'wb') as f:
+                # Écrire à la position attendue (écrase une éventuelle ligne partielle d'un ajout interrompu)
+                f.seek(len(self._rows) * self.dim * 4)
+                f.write(np.stack(vectors).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim, 'rows': rows}, f)
+            os.replace(tmp_path, self.index_path)
+            self._index_mtime = None
+            self.refresh()
+
+    def snapshot(self):
+        """
+        Vue cohérente des encodages actifs, pour construire un index de recherche.
+        :return: (version, liste des student_id, matrice float32 des encodages dans le même ordre)
+        """
+        with self._lock:
+            return self.version, self._active_ids, self._active_matrix
+
+    def distances(self, encoding: np.ndarray):
+        """
+        Distances euclidiennes entre un encodage et tous les encodages actifs (calcul matriciel).
+        :return: (liste des student_id, np.array des distances) dans le même ordre.
+        """
+        vector = np.asarray(encoding, dtype=np.float32).reshape(1, self.dim)
+        return self._active_ids, np.linalg.norm(self._active_matrix - vector, axis=1)
+
+    def _file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return FileLock(os.path.join(self.directory, LOCK_FILE))
+
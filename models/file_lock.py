@@ -0,0 +1,24 @@
+# models/file_lock.py
+try:
+    import fcntl # Verrou inter-processus (POSIX) pour les écritures concurrentes de plusieurs processus
+except ImportError:
+    fcntl = None
+
+
+class FileLock:
+    """Verrou exclusif sur un fichier (sans effet si fcntl n'est pas disponible)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
@@ -0,0 +1,79 @@
+# models/frame_gate.py
+import cv2
+import numpy as np
+
+# --- Paramètres du Filtre de Changement de Scène ---
+GATE_SIGNATURE_SIZE = (64, 48) # Taille (largeur, hauteur) de la copie réduite en niveaux de gris
+GATE_GRID = (8, 6) # Découpage (colonnes, lignes) de la signature en blocs comparés séparément
+GATE_BLOCK_DIFF_THRESHOLD = 8.0 # Écart moyen (niveaux de gris) d'un bloc au-delà duquel la scène a changé
+GATE_MAX_CONSECUTIVE_SKIPS = 5 # Au-delà, la frame est analysée même si la scène n'a pas changé
+
+
+class FrameChangeGate:
+    """
+    Filtre peu coûteux placé devant le pipeline : compare une copie réduite en niveaux de gris de
+    la frame à celle de la dernière frame analysée. Si aucun bloc de l'image n'a changé au-delà du
+    seuil, la frame peut être ignorée et les résultats en cache de la session réutilisés.
+    La comparaison par blocs (et non sur l'image entière) garde sensible un changement local,
+    comme un téléphone qui apparaît dans un coin du cadre.
+    """
+
+    def __init__(self, threshold: float = GATE_BLOCK_DIFF_THRESHOLD,
+                 max_consecutive_skips: int = GATE_MAX_CONSECUTIVE_SKIPS,
+                 signature_size: tuple = GATE_SIGNATURE_SIZE, grid: tuple = GATE_GRID):
+        self.threshold = threshold
+        self.max_consecutive_skips = max_consecutive_skips
+        self.signature_size = signature_size
+        self.grid = grid
+        self.reset()
+
+    def reset(self):
+        self.reference = None
+        self.consecutive_skips = 0
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self.last_change = None
+
+    def signature(self, frame: np.ndarray):
+        """Copie réduite en niveaux de gris (float32) de la frame (BGR, ou déjà en niveaux de gris)."""
+        small = cv2.resize(frame, self.signature_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.float32)
+
+    def block_change(self, signature: np.ndarray):
+        """Plus grand écart moyen absolu, par bloc, entre la signature et la référence."""
+        cols, rows = self.grid
+        height, width = signature.shape
+        diff = np.abs(signature - self.reference)
+        blocks = diff.reshape(rows, height // rows, cols, width // cols)
+        return float(blocks.mean(axis=(1, 3)).max())
+
+    def should_skip(self, frame: np.ndarray, force_process: bool = False):
+        """
+        Décide si la frame peut être ignorée. Une frame analysée devient la nouvelle référence.
+        :param force_process: Si vrai, la frame est analysée quel que soit le changement (ex: alerte en cours).
+        :return: True si la frame peut être ignorée.
+        """
+        self.frames_seen += 1
+        signature = self.signature(frame)
+
+        if self.reference is not None:
+            self.last_change = self.block_change(signature)
+            if (not force_process and self.last_change < self.threshold
+                    and self.consecutive_skips < self.max_consecutive_skips):
+                self.consecutive_skips += 1
+                self.frames_skipped += 1
+                return True
+
+        self.reference = signature
+        self.consecutive_skips = 0
+        return False
+
+    def stats(self):
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_skipped": self.frames_skipped,
+            "skip_rate": self.frames_skipped / self.frames_seen if self.frames_seen else 0.0,
+            "last_change": self.last_change,
+        }
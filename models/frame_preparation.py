@@ -0,0 +1,156 @@
+# models/frame_preparation.py
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# --- Paramètres de Préparation des Frames ---
+# Tailles exprimées en plus grand côté (pixels) ; une image plus petite n'est jamais agrandie.
+FRAME_MAX_SIDE = int(os.environ.get('SIPA_FRAME_MAX_SIDE', 640)) # Résolution de travail après décodage
+DETECTOR_INPUT_SIDES = {
+    "face_detection": int(os.environ.get('SIPA_FACE_DETECTION_SIDE', 320)), # MediaPipe FaceDetection (courte portée)
+    "objects": int(os.environ.get('SIPA_OBJECTS_SIDE', 640)), # Détecteur d'objets (redimensionné ensuite à son imgsz)
+    "paper": int(os.environ.get('SIPA_PAPER_SIDE', 320)), # Heuristique de contour des feuilles de papier
+    "gate": 160, # Filtre de changement de scène (réduit ensuite à sa signature)
+}
+# La vérification d'identité (dlib) et FaceMesh travaillent sur la frame de travail (ROI du visage)
+
+JPEG_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+# Marqueurs JPEG "Start Of Frame" portant les dimensions de l'image (hors DHT, JPG et DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_dimensions(buffer):
+    """
+    Lit (largeur, hauteur) dans l'en-tête d'un JPEG sans le décoder.
+    :return: (width, height), ou None si le buffer n'est pas un JPEG lisible.
+    """
+    data = memoryview(buffer)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF: # Octet de bourrage
+            i += 1
+            continue
+        if marker in (0x01, 0xD8) or 0xD0 <= marker <= 0xD7: # Marqueurs sans longueur
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + ((data[i + 2] << 8) | data[i + 3])
+    return None
+
+
+def decode_frame(buffer, max_side: int = FRAME_MAX_SIDE):
+    """
+    Décode une image (JPEG/PNG) à la résolution de travail. Pour un JPEG plus grand que
+    nécessaire, le décodeur réduit directement l'échelle (1/2, 1/4 ou 1/8) pendant la
+    décompression, ce qui coûte bien moins qu'un décodage complet suivi d'un redimensionnement.
+    :return: (frame BGR, échelle) où échelle = taille d'origine / taille décodée.
+    """
+    array = np.frombuffer(buffer, np.uint8)
+    dimensions = jpeg_dimensions(buffer)
+    flag, factor = cv2.IMREAD_COLOR, 1
+    if dimensions is not None and max_side:
+        longest = max(dimensions)
+        for candidate, reduced_flag in JPEG_REDUCED_FLAGS:
+            if longest / candidate >= max_side:
+                flag, factor = reduced_flag, candidate
+                break
+    frame = cv2.imdecode(array, flag)
+    if frame is None:
+        raise ValueError("Could not decode image.")
+    scale = float(factor)
+    if max_side and max(frame.shape[:2]) > max_side:
+        frame, extra = resize_to_side(frame, max_side)
+        scale *= extra
+    if dimensions is not None:
+        scale = dimensions[0] / frame.shape[1] # Échelle exacte (les dimensions réduites sont arrondies)
+    return frame, scale
+
+
+def resize_to_side(image: np.ndarray, max_side: int):
+    """
+    Réduit l'image pour que son plus grand côté vaille au plus max_side (jamais d'agrandissement).
+    :return: (image, échelle) où échelle = taille d'entrée / taille de sortie.
+    """
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return image, 1.0
+    ratio = max_side / longest
+    size = (max(1, int(round(width * ratio))), max(1, int(round(height * ratio))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), width / size[0]
+
+
+class PreparedFrame:
+    """
+    Frame préparée une seule fois pour tous les détecteurs : versions RGB et niveaux de gris
+    partagées, et pyramide de copies réduites (mises en cache) aux tailles d'entrée de chaque
+    détecteur. Les coordonnées calculées à un niveau réduit se ramènent à la frame de travail
+    (`to_frame`) ou à l'image d'origine envoyée par le client (`to_source`).
+    `detail_scale` réduit toutes les tailles d'entrée des détecteurs (niveaux de qualité sous charge).
+    """
+
+    def __init__(self, frame: np.ndarray, source_scale: float = 1.0):
+        self.bgr = frame
+        self.height, self.width = frame.shape[:2]
+        self.source_scale = source_scale # Taille de l'image d'origine / taille de la frame de travail
+        self.detail_scale = 1.0
+        self._levels = {}
+        self._lock = threading.RLock() # Les étapes parallèles du pipeline partagent le cache (niveaux construits en cascade)
+
+    def _cached(self, key, build):
+        with self._lock:
+            image = self._levels.get(key)
+            if image is None:
+                image = self._levels[key] = build()
+            return image
+
+    @property
+    def rgb(self):
+        return self._cached(("rgb", None), lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB))
+
+    @property
+    def gray(self):
+        return self._cached(("gray", None), lambda: cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY))
+
+    def level(self, color: str, max_side: int):
+        """
+        Copie réduite de la frame (plus grand côté <= max_side), calculée une fois par frame.
+        Chaque niveau est réduit depuis le plus proche niveau déjà calculé de la même couleur.
+        :param color: 'bgr', 'rgb' ou 'gray'.
+        """
+        if max_side is None or max(self.height, self.width) <= max_side:
+            return getattr(self, color)
+        def build():
+            source = getattr(self, color)
+            with self._lock:
+                larger = [side for (c, side) in self._levels if c == color and side is not None and side > max_side]
+            if larger:
+                source = self._levels[(color, min(larger))]
+            return resize_to_side(source, max_side)[0]
+        return self._cached((color, max_side), build)
+
+    def for_detector(self, detector: str, color: str = "bgr"):
+        """Copie de la frame à la taille d'entrée configurée pour un détecteur (DETECTOR_INPUT_SIDES)."""
+        side = DETECTOR_INPUT_SIDES.get(detector)
+        if side is not None and self.detail_scale != 1.0:
+            side = int(side * self.detail_scale)
+        return self.level(color, side)
+
+    def to_frame(self, box, image: np.ndarray):
+        """Ramène une boîte (top, right, bottom, left) calculée sur `image` aux coordonnées de la frame de travail."""
+        factor = self.width / image.shape[1]
+        return tuple(int(round(v * factor)) for v in box)
+
+    def to_source(self, box):
+        """Ramène une boîte (top, right, bottom, left) de la frame de travail aux coordonnées de l'image d'origine."""
+        return tuple(int(round(v * self.source_scale)) for v in box)
@@ -0,0 +1,202 @@
+# models/head_pose.py
+import math
+import time
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# --- Paramètres de l'Estimation de la Pose de la Tête ---
+# Points 3D d'un visage générique (nez, coins des yeux, coins de la bouche, menton) et indices
+# des landmarks FaceMesh correspondants
+HEAD_MODEL_POINTS = np.array([
+    (0.0, 0.0, 0.0),
+    (-225.0, 170.0, -135.0),
+    (225.0, 170.0, -135.0),
+    (-150.0, -150.0, -125.0),
+    (150.0, -150.0, -125.0),
+    (0.0, -330.0, -65.0)
+], dtype=np.float64)
+POSE_LANDMARK_IDS = (1, 33, 263, 61, 291, 199)
+DIST_COEFFS = np.zeros((4, 1)) # Pas de distorsion de l'objectif
+
+# Seuils d'un mouvement de tête anormal (angles relatifs à un visage de face, voir rotation_matrices_to_euler)
+HEAD_PITCH_THRESHOLD = 20 # Degrés (haut/bas)
+HEAD_YAW_THRESHOLD = 20   # Degrés (gauche/droite)
+HEAD_ROLL_THRESHOLD = 15  # Degrés (inclinaison latérale)
+
+# Filtre "One Euro" : lissage fort quand la tête est immobile (supprime le bruit des landmarks),
+# faible quand elle bouge vite (pas de retard sur un vrai mouvement)
+POSE_FILTER_MIN_CUTOFF_HZ = 1.0 # Fréquence de coupure au repos
+POSE_FILTER_BETA = 0.05 # Augmentation de la coupure avec la vitesse angulaire (deg/s)
+POSE_FILTER_DERIVATIVE_CUTOFF_HZ = 1.0
+POSE_MAX_WARM_START_JUMP_DEG = 45.0 # Au-delà, le départ à chaud est considéré comme divergé : résolution à froid
+
+
+@lru_cache(maxsize=16)
+def camera_matrix(image_width: int, image_height: int):
+    """Matrice intrinsèque approchée (focale = largeur de l'image), mise en cache par résolution."""
+    matrix = np.array([
+        [image_width, 0, image_width / 2],
+        [0, image_width, image_height / 2],
+        [0, 0, 1]
+    ], dtype=np.float64)
+    matrix.setflags(write=False)
+    return matrix
+
+
+def landmarks_to_image_points(face_landmarks, image_width: int, image_height: int):
+    """Points 2D (pixels) des landmarks utilisés pour la pose. :return: np.array (6, 2)."""
+    return np.array([
+        (face_landmarks.landmark[i].x * image_width, face_landmarks.landmark[i].y * image_height)
+        for i in POSE_LANDMARK_IDS
+    ], dtype=np.float64)
+
+
+def rotation_matrices_to_euler(rmats: np.ndarray):
+    """
+    Angles d'Euler (pitch, yaw, roll) en degrés d'un lot de matrices de rotation.
+    Le modèle 3D a l'axe Y vers le haut et l'image vers le bas : un visage de face correspond à une
+    rotation de 180° autour de X. Le pitch est donc exprimé relativement à cette pose (0° de face),
+    et non autour de ±180° où le moindre bruit le ferait basculer d'un signe à l'autre.
+    :param rmats: np.array (n, 3, 3).
+    :return: np.array (n, 3).
+    """
+    sy = np.sqrt(rmats[:, 0, 0] ** 2 + rmats[:, 1, 0] ** 2)
+    singular = sy < 1e-6
+    pitch = np.where(singular, np.arctan2(-rmats[:, 1, 2], rmats[:, 1, 1]), np.arctan2(rmats[:, 2, 1], rmats[:, 2, 2]))
+    yaw = np.arctan2(-rmats[:, 2, 0], sy)
+    roll = np.where(singular, 0.0, np.arctan2(rmats[:, 1, 0], rmats[:, 0, 0]))
+    euler = np.degrees(np.stack([pitch, yaw, roll], axis=1))
+    euler[:, 0] = _wrap_degrees(euler[:, 0] + 180.0)
+    return euler
+
+
+def rotation_vectors_to_matrices(rvecs: np.ndarray):
+    """
+    Formule de Rodrigues sur un lot de vecteurs de rotation.
+    :param rvecs: np.array (n, 3).
+    :return: np.array (n, 3, 3).
+    """
+    theta = np.linalg.norm(rvecs, axis=1)
+    safe = np.where(theta < 1e-12, 1.0, theta)
+    kx, ky, kz = (rvecs / safe[:, None]).T
+    zero = np.zeros_like(kx)
+    k = np.stack([
+        np.stack([zero, -kz, ky], axis=1),
+        np.stack([kz, zero, -kx], axis=1),
+        np.stack([-ky, kx, zero], axis=1)
+    ], axis=1)
+    sin, cos = np.sin(theta)[:, None, None], np.cos(theta)[:, None, None]
+    return np.eye(3)[None] + sin * k + (1 - cos) * (k @ k)
+
+
+def solve_head_pose(image_points: np.ndarray, image_width: int, image_height: int, rvec=None, tvec=None):
+    """
+    Résout la pose (PnP) du modèle de visage. Si une pose précédente est fournie, elle sert de
+    point de départ à l'optimisation (convergence en quelques itérations entre deux frames proches).
+    :return: (success: bool, rvec, tvec)
+    """
+    intrinsics = camera_matrix(image_width, image_height)
+    if rvec is not None and tvec is not None:
+        return cv2.solvePnP(HEAD_MODEL_POINTS, image_points, intrinsics, DIST_COEFFS,
+                            rvec=rvec.copy(), tvec=tvec.copy(), useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+    return cv2.solvePnP(HEAD_MODEL_POINTS, image_points, intrinsics, DIST_COEFFS, flags=cv2.SOLVEPNP_ITERATIVE)
+
+
+def estimate_head_poses_batch(image_points: np.ndarray, image_width: int, image_height: int, sequential: bool = True):
+    """
+    Poses de tête d'un lot de jeux de landmarks (rejeu hors ligne d'un enregistrement).
+    :param image_points: np.array (n, 6, 2) des points 2D (voir landmarks_to_image_points).
+    :param sequential: Si vrai, les jeux sont des frames consécutives : chaque résolution part de la précédente.
+    :return: np.array (n, 3) des (pitch, yaw, roll) en degrés (NaN si la résolution a échoué).
+    """
+    image_points = np.asarray(image_points, dtype=np.float64)
+    rvecs = np.full((len(image_points), 3), np.nan)
+    rvec = tvec = None
+    for i, points in enumerate(image_points):
+        success, new_rvec, new_tvec = solve_head_pose(points, image_width, image_height, rvec, tvec)
+        if success:
+            rvecs[i] = new_rvec.ravel()
+            if sequential:
+                rvec, tvec = new_rvec, new_tvec
+    euler = np.full((len(image_points), 3), np.nan)
+    solved = ~np.isnan(rvecs[:, 0])
+    if solved.any():
+        euler[solved] = rotation_matrices_to_euler(rotation_vectors_to_matrices(rvecs[solved]))
+    return euler
+
+
+def _smoothing_factor(cutoff_hz, dt):
+    tau = 1.0 / (2 * math.pi * cutoff_hz)
+    return 1.0 / (1.0 + tau / dt)
+
+
+def _wrap_degrees(angles):
+    """Angles ramenés dans [-180, 180) (écart le plus court entre deux angles)."""
+    return (angles + 180.0) % 360.0 - 180.0
+
+
+class HeadPoseTracker:
+    """
+    Suivi de la pose de la tête d'une session : PnP démarré à chaud depuis la pose de la frame
+    précédente, et angles lissés par un filtre One Euro (vectorisé sur pitch/yaw/roll) pour que
+    les seuils de mouvement ne réagissent pas au bruit des landmarks.
+    """
+
+    def __init__(self, min_cutoff: float = POSE_FILTER_MIN_CUTOFF_HZ, beta: float = POSE_FILTER_BETA,
+                 derivative_cutoff: float = POSE_FILTER_DERIVATIVE_CUTOFF_HZ):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.derivative_cutoff = derivative_cutoff
+        self.reset()
+
+    def reset(self):
+        """Oublie la pose précédente (visage perdu) : la prochaine résolution repart à froid."""
+        self.rvec = None
+        self.tvec = None
+        self.frame_size = None
+        self.smoothed = None # np.array (pitch, yaw, roll)
+        self.derivative = np.zeros(3)
+        self.last_time = None
+        self.warm_starts = 0
+        self.cold_starts = 0
+
+    def _solve(self, image_points, image_width, image_height):
+        if self.rvec is not None and self.frame_size == (image_width, image_height):
+            success, rvec, tvec = solve_head_pose(image_points, image_width, image_height, self.rvec, self.tvec)
+            # Un départ à chaud qui diverge (tête derrière la caméra, rotation aberrante) est refait à froid
+            if success and tvec[2, 0] > 0 and np.degrees(np.linalg.norm(rvec - self.rvec)) < POSE_MAX_WARM_START_JUMP_DEG:
+                self.warm_starts += 1
+                return success, rvec, tvec
+        self.cold_starts += 1
+        return solve_head_pose(image_points, image_width, image_height)
+
+    def update(self, image_points: np.ndarray, image_width: int, image_height: int, now: float = None):
+        """
+        Estime la pose de la frame courante.
+        :param image_points: np.array (6, 2) des points 2D (voir landmarks_to_image_points).
+        :return: ((pitch, yaw, roll) lissés, (pitch, yaw, roll) bruts) en degrés, ou (None, None) si la résolution échoue.
+        """
+        now = time.monotonic() if now is None else now
+        success, rvec, tvec = self._solve(image_points, image_width, image_height)
+        if not success:
+            self.rvec = self.tvec = None
+            return None, None
+        self.rvec, self.tvec, self.frame_size = rvec, tvec, (image_width, image_height)
+        raw = rotation_matrices_to_euler(cv2.Rodrigues(rvec)[0][None])[0]
+
+        if self.smoothed is None:
+            self.smoothed = raw
+        else:
+            dt = max(now - self.last_time, 1e-3)
+            # Écart circulaire : un angle qui franchit ±180° ne doit pas devenir un tour complet
+            delta = _wrap_degrees(raw - self.smoothed)
+            self.derivative += _smoothing_factor(self.derivative_cutoff, dt) * (delta / dt - self.derivative)
+            cutoff = self.min_cutoff + self.beta * np.abs(self.derivative)
+            self.smoothed = _wrap_degrees(self.smoothed + _smoothing_factor(cutoff, dt) * delta)
+        self.last_time = now
+        return tuple(float(a) for a in self.smoothed), tuple(float(a) for a in raw)
+
+    def stats(self):
+        return {"warm_starts": self.warm_starts, "cold_starts": self.cold_starts}
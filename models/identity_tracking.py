@@ -0,0 +1,111 @@
+# models/identity_tracking.py
+import time
+
+# --- Paramètres du Suivi d'Identité ---
+IDENTITY_REVERIFY_INTERVAL_S = 10.0 # Re-vérification complète (encodage dlib) au moins toutes les N secondes
+IDENTITY_MIN_TRACK_IOU = 0.3 # En dessous de ce recouvrement entre deux frames, la boîte a "sauté" : on re-vérifie
+IDENTITY_CONFIDENCE_HALF_LIFE_S = 30.0 # Demi-vie de la confiance d'un résultat réutilisé sans re-vérification
+
+
+def box_iou(box_a, box_b):
+    """
+    Recouvrement (intersection / union) de deux boîtes (top, right, bottom, left).
+    """
+    top = max(box_a[0], box_b[0])
+    right = min(box_a[1], box_b[1])
+    bottom = min(box_a[2], box_b[2])
+    left = max(box_a[3], box_b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    area_a = (box_a[1] - box_a[3]) * (box_a[2] - box_a[0])
+    area_b = (box_b[1] - box_b[3]) * (box_b[2] - box_b[0])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class IdentityTracker:
+    """
+    Suivi de l'identité vérifiée d'une session. Le visage principal est suivi de frame en frame
+    par sa boîte ; tant que la piste n'est pas rompue, le dernier résultat de verify_identity est
+    réutilisé (avec une confiance qui décroît) au lieu de ré-encoder le visage.
+    Une re-vérification complète est demandée quand :
+    - aucun résultat n'est encore connu ou la piste est perdue (plus de visage),
+    - la boîte du visage principal saute entre deux frames,
+    - le nombre de visages change,
+    - l'intervalle de re-vérification est écoulé.
+    """
+
+    def __init__(self, reverify_interval: float = IDENTITY_REVERIFY_INTERVAL_S,
+                 min_track_iou: float = IDENTITY_MIN_TRACK_IOU,
+                 confidence_half_life: float = IDENTITY_CONFIDENCE_HALF_LIFE_S):
+        self.reverify_interval = reverify_interval
+        self.min_track_iou = min_track_iou
+        self.confidence_half_life = confidence_half_life
+        self.reset()
+
+    def reset(self):
+        self.last_result = None # (est_verifie, score_confiance, message)
+        self.verified_at = None
+        self.last_box = None
+        self.last_face_count = 0
+        self.pending_reason = None # Rupture de piste observée depuis la dernière vérification complète
+        self.impersonation_candidates = [] # Résultat de la recherche 1:N associé à la dernière vérification
+        self.full_verifications = 0
+        self.cached_verifications = 0
+
+    def observe(self, face_boxes: list):
+        """
+        Met à jour la piste (boîte principale et nombre de visages) avec une frame.
+        Peut être appelé sur des frames où la vérification ne tourne pas : une rupture de piste est
+        mémorisée jusqu'à la prochaine vérification complète.
+        :param face_boxes: Boîtes de la frame (visage principal en premier).
+        :return: Raison de la rupture en attente (str), ou None si la piste est intacte.
+        """
+        current_box = face_boxes[0] if face_boxes else None
+        previous_box, previous_count = self.last_box, self.last_face_count
+        self.last_box, self.last_face_count = current_box, len(face_boxes)
+
+        reason = None
+        if current_box is None or previous_box is None:
+            reason = "track_lost"
+        elif len(face_boxes) != previous_count:
+            reason = "face_count_changed"
+        elif box_iou(previous_box, current_box) < self.min_track_iou:
+            reason = "box_jump"
+        if self.pending_reason is None:
+            self.pending_reason = reason
+        return self.pending_reason
+
+    def reverify_reason(self, face_boxes: list, now: float = None):
+        """
+        Indique si la frame courante exige une vérification complète, et pourquoi.
+        :param face_boxes: Boîtes de la frame (visage principal en premier).
+        :return: Raison (str) de la re-vérification, ou None si le résultat suivi peut être réutilisé.
+        """
+        now = time.monotonic() if now is None else now
+        self.observe(face_boxes)
+        if self.last_result is None:
+            return "initial"
+        if self.pending_reason is not None:
+            return self.pending_reason
+        if now - self.verified_at >= self.reverify_interval:
+            return "interval"
+        return None
+
+    def record(self, result, impersonation_candidates: list = None, now: float = None):
+        """Enregistre le résultat d'une vérification complète (et de la recherche 1:N éventuelle)."""
+        self.last_result = result
+        self.impersonation_candidates = impersonation_candidates or []
+        self.verified_at = time.monotonic() if now is None else now
+        self.pending_reason = None
+        self.full_verifications += 1
+
+    def cached_result(self, now: float = None):
+        """
+        Dernier résultat vérifié, avec une confiance atténuée selon son âge.
+        :return: (est_verifie: bool, score_confiance: float, message: str)
+        """
+        now = time.monotonic() if now is None else now
+        is_verified, score, message = self.last_result
+        age = now - self.verified_at
+        self.cached_verifications += 1
+        return is_verified, score * 0.5 ** (age / self.confidence_half_life), f"{message} (suivi, vérifié il y a {age:.0f}s)"
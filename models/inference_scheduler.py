@@ -0,0 +1,146 @@
+# models/inference_scheduler.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SchedulerOverloaded(RuntimeError):
+    """La file d'attente du scheduler est pleine."""
+
+
+class BatchInferenceScheduler:
+    """
+    Regroupe les requêtes d'inférence de plusieurs sessions en micro-lots.
+    Un thread unique attend la première requête, puis collecte les suivantes pendant au plus
+    `max_wait_ms` (ou jusqu'à `max_batch_size` requêtes) et appelle `infer_batch` une seule fois
+    sur le lot. Chaque appelant récupère son propre résultat via un Future.
+    Comme seul ce thread appelle le modèle, le modèle partagé n'a pas besoin d'être thread-safe.
+    """
+
+    def __init__(self, infer_batch, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 max_queue_depth: int = 64, name: str = "batch-inference"):
+        """
+        :param infer_batch: Fonction (list d'entrées) -> list de résultats, dans le même ordre.
+        :param max_batch_size: Taille maximale d'un lot.
+        :param max_wait_ms: Attente maximale (ms) après la première requête d'un lot.
+        :param max_queue_depth: Nombre maximal de requêtes en attente avant refus (SchedulerOverloaded).
+        """
+        self.infer_batch = infer_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_depth)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches_run = 0
+        self.items_processed = 0
+        self.items_rejected = 0
+        self.total_queue_wait_s = 0.0
+        self.total_inference_s = 0.0
+        self.batch_size_histogram = {}
+
+    def submit(self, item):
+        """
+        Place une entrée dans la file.
+        :return: Future dont le résultat est celui de `infer_batch` pour cette entrée.
+        :raises SchedulerOverloaded: si la file est pleine.
+        """
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future, time.monotonic()))
+        except queue.Full:
+            with self._stats_lock:
+                self.items_rejected += 1
+            raise SchedulerOverloaded(f"File d'inférence '{self.name}' pleine ({self._queue.maxsize} requêtes).")
+        return future
+
+    def infer(self, item, timeout: float = None):
+        """Soumet une entrée et attend son résultat."""
+        return self.submit(item).result(timeout=timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        """Statistiques de débit et de latence du scheduler."""
+        with self._stats_lock:
+            batches = self.batches_run or 1
+            items = self.items_processed or 1
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_queue_depth": self._queue.maxsize,
+                "queue_depth": self._queue.qsize(),
+                "batches_run": self.batches_run,
+                "items_processed": self.items_processed,
+                "items_rejected": self.items_rejected,
+                "avg_batch_size": self.items_processed / batches,
+                "avg_queue_wait_ms": 1000.0 * self.total_queue_wait_s / items,
+                "avg_batch_inference_ms": 1000.0 * self.total_inference_s / batches,
+                "batch_size_histogram": dict(self.batch_size_histogram),
+            }
+
+    def shutdown(self):
+        """Arrête le thread après le traitement des requêtes déjà en file."""
+        thread = self._thread
+        if thread is not None:
+            self._queue.put((None, None, None))
+            thread.join()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first[1] is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry[1] is None:
+                # Demande d'arrêt : on termine ce lot puis on s'arrête
+                self._queue.put(entry)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+            items = [entry[0] for entry in batch]
+            started = time.monotonic()
+            try:
+                outputs = self.infer_batch(items)
+                if len(outputs) != len(items):
+                    raise RuntimeError(f"infer_batch a retourné {len(outputs)} résultats pour {len(items)} entrées.")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), output in zip(batch, outputs):
+                    future.set_result(output)
+            finished = time.monotonic()
+
+            with self._stats_lock:
+                self.batches_run += 1
+                self.items_processed += len(batch)
+                self.total_queue_wait_s += sum(started - entry[2] for entry in batch)
+                self.total_inference_s += finished - started
+                self.batch_size_histogram[len(batch)] = self.batch_size_histogram.get(len(batch), 0) + 1
+        self._thread = None
@@ -0,0 +1,287 @@
+# models/inference_workers.py
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# --- Paramètres des Processus d'Inférence ---
+INFERENCE_WORKERS = int(os.environ.get('SIPA_INFERENCE_WORKERS', 0)) # 0 = pipeline exécuté dans le thread Flask
+FRAME_SLOTS = int(os.environ.get('SIPA_FRAME_SLOTS', 32)) # Nombre de frames pouvant être en vol simultanément
+FRAME_SLOT_BYTES = int(os.environ.get('SIPA_FRAME_SLOT_BYTES', 1920 * 1080 * 3)) # Taille max d'une frame décodée
+WORKER_RESULT_TIMEOUT_S = 30.0 # Attente max du résultat d'une frame
+SUPERVISOR_INTERVAL_S = 1.0 # Période de vérification des processus (redémarrage en cas de crash)
+
+
+class WorkerCrashed(RuntimeError):
+    """Le processus d'inférence chargé de la requête s'est arrêté avant de répondre."""
+
+
+class SharedFrameRing:
+    """
+    Anneau de slots en mémoire partagée pour transmettre les frames décodées aux processus
+    d'inférence sans les sérialiser : seul l'indice du slot (et la forme de la frame) passe par
+    la file de messages. Les slots libres sont gérés côté serveur web uniquement.
+    """
+
+    def __init__(self, num_slots: int = FRAME_SLOTS, slot_bytes: int = FRAME_SLOT_BYTES):
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=num_slots * slot_bytes)
+        self._free = queue.Queue()
+        for slot in range(num_slots):
+            self._free.put(slot)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def acquire(self, timeout: float = None):
+        """Réserve un slot libre (attend si tous sont en vol)."""
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Aucun slot de frame libre : les processus d'inférence sont saturés.")
+
+    def release(self, slot: int):
+        self._free.put(slot)
+
+    def free_slots(self):
+        return self._free.qsize()
+
+    def write(self, slot: int, frame: np.ndarray):
+        """Copie la frame dans le slot. :return: forme de la frame (à transmettre avec l'indice du slot)."""
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame trop grande pour un slot ({frame.nbytes} > {self.slot_bytes} octets).")
+        view = frame_view(self.shm, slot, self.slot_bytes, frame.shape)
+        view[...] = frame
+        return frame.shape
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def frame_view(shm, slot: int, slot_bytes: int, shape: tuple):
+    """Vue numpy (sans copie) sur la frame stockée dans un slot."""
+    return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+
+
+def _worker_main(worker_id: int, shm_name: str, slot_bytes: int, requests, results, known_faces: dict):
+    """
+    Boucle d'un processus d'inférence : charge les modèles une fois, puis traite les commandes
+    (request_id, commande, arguments) de sa file jusqu'à recevoir None.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    from models import visual_audio_detection # Chargement des modèles, une fois par processus
+    visual_audio_detection.load_known_faces(known_faces or {})
+    visual_audio_detection.get_object_detector()
+    print(f"Processus d'inférence {worker_id} prêt (pid {os.getpid()}).")
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, command, args = message
+        try:
+            if command == "process":
+                slot, shape, student_id, audio_data_chunk, exam_id, source_scale = args
+                frame = frame_view(shm, slot, slot_bytes, shape)
+                output = visual_audio_detection.process_realtime_data(frame, student_id, audio_data_chunk, exam_id, source_scale)
+                del frame
+            elif command == "audio":
+                output = visual_audio_detection.ingest_audio(*args)
+            elif command == "reset":
+                output = visual_audio_detection.reset_visual_module_state(*args)
+            elif command == "stats":
+                output = visual_audio_detection.get_realtime_stats()
+            else:
+                raise ValueError(f"Commande inconnue: {command}")
+            results.put((request_id, True, output))
+        except Exception as e:
+            results.put((request_id, False, f"{type(e).__name__}: {e}"))
+    shm.close()
+
+
+class InferenceWorkerPool:
+    """
+    Pool de processus d'inférence dédiés. Le serveur web écrit chaque frame décodée dans un slot
+    de l'anneau en mémoire partagée et envoie (slot, session) au processus chargé de la session ;
+    le résultat revient par une file commune. Une session est toujours traitée par le même
+    processus, qui conserve son état (compteurs, détecteurs MediaPipe, suivi d'identité).
+    Un superviseur redémarre les processus arrêtés ; les requêtes en vol échouent avec WorkerCrashed.
+    """
+
+    def __init__(self, num_workers: int = INFERENCE_WORKERS, known_faces: dict = None,
+                 num_slots: int = FRAME_SLOTS, slot_bytes: int = FRAME_SLOT_BYTES):
+        self.num_workers = max(1, num_workers)
+        self.known_faces = known_faces or {}
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self._mp = multiprocessing.get_context("spawn")
+        self._workers = {} # Dict: {worker_id: (Process, file de requêtes)}
+        self._pending = {} # Dict: {request_id: (Future, worker_id, slot ou None)}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._running = False
+        self.restarts = 0
+        self.ring = None
+        self._results = None
+
+    def start(self):
+        self.ring = SharedFrameRing(self.num_slots, self.slot_bytes)
+        self._results = self._mp.Queue()
+        self._running = True
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        threading.Thread(target=self._dispatch_results, name="sipa-inference-results", daemon=True).start()
+        threading.Thread(target=self._supervise, name="sipa-inference-supervisor", daemon=True).start()
+        print(f"{self.num_workers} processus d'inférence démarrés ({self.num_slots} slots de frame partagés).")
+
+    def shutdown(self):
+        """Arrête les processus et libère l'anneau en mémoire partagée (sans effet si le pool est déjà arrêté)."""
+        with self._lock:
+            if self.ring is None:
+                return
+            self._running = False
+            workers = list(self._workers.values())
+        for process, requests in workers:
+            requests.put(None)
+        for process, _ in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._fail_pending(lambda worker_id: True, "Pool d'inférence arrêté.")
+        self.ring.close()
+        self.ring = None
+
+    def worker_for(self, student_id: str, exam_id: str = None):
+        """Processus attitré d'une session (hachage stable de la clé de session)."""
+        key = f"{student_id}:{exam_id}" if exam_id else student_id
+        return zlib.crc32(key.encode("utf-8")) % self.num_workers
+
+    def process(self, frame: np.ndarray, student_id: str, audio_data_chunk=None, exam_id: str = None,
+                source_scale: float = 1.0, timeout: float = WORKER_RESULT_TIMEOUT_S):
+        """
+        Traite une frame dans le processus attitré de la session (équivalent de process_realtime_data).
+        :return: Dictionnaire de résultats de détection.
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        slot = self.ring.acquire(timeout=timeout)
+        try:
+            shape = self.ring.write(slot, frame)
+        except Exception:
+            self.ring.release(slot)
+            raise
+        worker_id = self.worker_for(student_id, exam_id)
+        future = self._submit(worker_id, "process", (slot, shape, student_id, audio_data_chunk, exam_id, source_scale), slot)
+        return future.result(timeout=timeout)
+
+    def feed_audio(self, student_id: str, audio_data_chunk: bytes, exam_id: str = None):
+        """
+        Transmet un chunk audio au processus attitré de la session (équivalent de ingest_audio),
+        sans attendre : il y est décodé et analysé indépendamment des frames.
+        """
+        self._submit(self.worker_for(student_id, exam_id), "audio", (student_id, audio_data_chunk, exam_id))
+
+    def reset(self, student_id: str = None, exam_id: str = None, timeout: float = WORKER_RESULT_TIMEOUT_S):
+        """Réinitialise une session (dans son processus) ou toutes les sessions de tous les processus."""
+        worker_ids = range(self.num_workers) if student_id is None else [self.worker_for(student_id, exam_id)]
+        futures = [self._submit(worker_id, "reset", (student_id, exam_id)) for worker_id in worker_ids]
+        for future in futures:
+            future.result(timeout=timeout)
+
+    def stats(self, timeout: float = 5.0):
+        """Statistiques du pool et, pour chaque processus vivant, celles de son pipeline temps réel."""
+        with self._lock:
+            alive = {worker_id: process.is_alive() for worker_id, (process, _) in self._workers.items()}
+            pending = len(self._pending)
+        futures = {worker_id: self._submit(worker_id, "stats", ()) for worker_id, is_alive in alive.items() if is_alive}
+        workers = {}
+        for worker_id, future in futures.items():
+            try:
+                workers[worker_id] = future.result(timeout=timeout)
+            except Exception as e:
+                workers[worker_id] = {"error": str(e)}
+        return {
+            "num_workers": self.num_workers,
+            "workers_alive": sum(alive.values()),
+            "restarts": self.restarts,
+            "pending_requests": pending,
+            "free_frame_slots": self.ring.free_slots(),
+            "frame_slots": self.num_slots,
+            "workers": workers,
+        }
+
+    def _spawn(self, worker_id: int):
+        requests = self._mp.Queue()
+        process = self._mp.Process(
+            target=_worker_main,
+            args=(worker_id, self.ring.name, self.slot_bytes, requests, self._results, self.known_faces),
+            name=f"sipa-inference-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        with self._lock:
+            self._workers[worker_id] = (process, requests)
+
+    def _submit(self, worker_id: int, command: str, args: tuple, slot: int = None):
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = (future, worker_id, slot)
+            _, requests = self._workers[worker_id]
+        requests.put((request_id, command, args))
+        return future
+
+    def _complete(self, request_id: int):
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return None
+        future, _, slot = entry
+        ring = self.ring
+        if slot is not None and ring is not None: # Anneau déjà libéré si le pool s'arrête
+            ring.release(slot)
+        return future
+
+    def _dispatch_results(self):
+        while self._running:
+            try:
+                request_id, ok, output = self._results.get(timeout=SUPERVISOR_INTERVAL_S)
+            except queue.Empty:
+                continue
+            future = self._complete(request_id)
+            if future is None:
+                continue # Requête déjà échouée (processus redémarré entre-temps)
+            if ok:
+                future.set_result(output)
+            else:
+                future.set_exception(RuntimeError(output))
+
+    def _fail_pending(self, predicate, message: str):
+        with self._lock:
+            request_ids = [rid for rid, (_, worker_id, _) in self._pending.items() if predicate(worker_id)]
+        for request_id in request_ids:
+            future = self._complete(request_id)
+            if future is not None:
+                future.set_exception(WorkerCrashed(message))
+
+    def _supervise(self):
+        while self._running:
+            time.sleep(SUPERVISOR_INTERVAL_S)
+            with self._lock:
+                dead = [(worker_id, process) for worker_id, (process, _) in self._workers.items() if not process.is_alive()]
+            for worker_id, process in dead:
+                if not self._running:
+                    break
+                print(f"AVERTISSEMENT: Processus d'inférence {worker_id} arrêté (code {process.exitcode}), redémarrage.")
+                self._fail_pending(lambda wid: wid == worker_id, f"Processus d'inférence {worker_id} arrêté.")
+                self._spawn(worker_id)
+                self.restarts += 1
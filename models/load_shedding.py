@@ -0,0 +1,133 @@
+# models/load_shedding.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Niveaux de Qualité du Pipeline Temps Réel ---
+# Sous charge, les sessions descendent d'un niveau à la fois ; chaque niveau ajoute une économie
+# à celles du précédent. `disabled` : détecteurs suspendus (hors vérifications garanties) ;
+# `detail_scale` : facteur appliqué aux tailles d'entrée des détecteurs (frame_preparation).
+QUALITY_TIERS = [
+    {"name": "full",               "disabled": (),                      "detail_scale": 1.0},
+    {"name": "no_objects",         "disabled": ("objects",),            "detail_scale": 1.0},
+    {"name": "reduced_resolution", "disabled": ("objects",),            "detail_scale": 0.5},
+    {"name": "minimal",            "disabled": ("objects", "identity"), "detail_scale": 0.5},
+]
+
+# Niveau minimal garanti : un détecteur suspendu tourne tout de même au moins une fois par intervalle
+# (la pose de la tête, le comptage des visages et l'audio ne sont jamais suspendus)
+GUARANTEED_CHECK_INTERVAL_S = {
+    "identity": 30.0,
+    "objects": 15.0,
+}
+
+# Contrôle d'admission (par processus) : latence lissée (EWMA) et requêtes en cours
+SHED_LATENCY_HIGH_MS = float(os.environ.get('SIPA_SHED_LATENCY_HIGH_MS', 400)) # Au-delà, on dégrade d'un niveau
+SHED_LATENCY_LOW_MS = float(os.environ.get('SIPA_SHED_LATENCY_LOW_MS', 150)) # En dessous, on remonte d'un niveau
+SHED_INFLIGHT_HIGH = int(os.environ.get('SIPA_SHED_INFLIGHT_HIGH', 8)) # Requêtes simultanées au-delà desquelles on dégrade
+SHED_INFLIGHT_REJECT = int(os.environ.get('SIPA_SHED_INFLIGHT_REJECT', 32)) # Au-delà, la frame n'est pas analysée
+SHED_LATENCY_EWMA_ALPHA = 0.2
+SHED_TIER_HOLD_S = 5.0 # Durée minimale entre deux changements de niveau (hystérésis)
+
+
+class AdmissionController:
+    """
+    Contrôle d'admission autour du traitement des frames : mesure les requêtes en cours et la
+    latence récente (moyenne mobile exponentielle) et en déduit le niveau de qualité cible du
+    processus. Le niveau ne change que d'un cran à la fois et pas plus d'une fois par
+    SHED_TIER_HOLD_S ; les seuils haut et bas distincts évitent les oscillations.
+    """
+
+    def __init__(self, tiers: list = None, latency_high_ms: float = SHED_LATENCY_HIGH_MS,
+                 latency_low_ms: float = SHED_LATENCY_LOW_MS, inflight_high: int = SHED_INFLIGHT_HIGH,
+                 inflight_reject: int = SHED_INFLIGHT_REJECT, hold_s: float = SHED_TIER_HOLD_S):
+        self.tiers = tiers or QUALITY_TIERS
+        self.latency_high_ms = latency_high_ms
+        self.latency_low_ms = latency_low_ms
+        self.inflight_high = inflight_high
+        self.inflight_reject = inflight_reject
+        self.hold_s = hold_s
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency_ms = 0.0
+        self.tier = 0
+        self.changed_at = 0.0
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def max_tier(self):
+        return len(self.tiers) - 1
+
+    def should_reject(self):
+        """Vrai si la charge est telle que la frame doit être ignorée (résultats en cache renvoyés)."""
+        return self.in_flight > self.inflight_reject
+
+    @contextmanager
+    def track(self):
+        """Encadre le traitement d'une frame : compte la requête en cours et mesure sa latence."""
+        with self._lock:
+            self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield self
+        finally:
+            elapsed_ms = (time.monotonic() - started) * 1000.0
+            with self._lock:
+                self.in_flight -= 1
+                self.latency_ms += SHED_LATENCY_EWMA_ALPHA * (elapsed_ms - self.latency_ms)
+                self._update_tier()
+
+    def record_rejection(self):
+        with self._lock:
+            self.rejected += 1
+
+    def _update_tier(self):
+        # Doit être appelé sous self._lock
+        self.admitted += 1
+        now = time.monotonic()
+        if now - self.changed_at < self.hold_s:
+            return
+        overloaded = self.latency_ms > self.latency_high_ms or self.in_flight > self.inflight_high
+        relaxed = self.latency_ms < self.latency_low_ms and self.in_flight <= self.inflight_high // 2
+        if overloaded and self.tier < self.max_tier:
+            self.tier += 1
+            self.changed_at = now
+            print(f"AVERTISSEMENT: Charge élevée (latence {self.latency_ms:.0f} ms, {self.in_flight} en cours), "
+                  f"qualité abaissée au niveau {self.tier_name(self.tier)}.")
+        elif relaxed and self.tier > 0:
+            self.tier -= 1
+            self.changed_at = now
+            print(f"Charge revenue à la normale, qualité remontée au niveau {self.tier_name(self.tier)}.")
+
+    def tier_name(self, tier: int):
+        return self.tiers[tier]["name"]
+
+    def session_tier(self, current: int, alert_active: bool):
+        """
+        Prochain niveau d'une session : se rapproche d'un cran du niveau cible du processus.
+        Une session en alerte ne descend pas sous la résolution complète (niveau 1 au plus).
+        """
+        target = min(self.tier, 1) if alert_active else self.tier
+        if current < target:
+            return current + 1
+        if current > target:
+            return current - 1
+        return current
+
+    def disabled_detectors(self, tier: int):
+        return self.tiers[tier]["disabled"]
+
+    def detail_scale(self, tier: int):
+        return self.tiers[tier]["detail_scale"]
+
+    def stats(self):
+        return {
+            "tier": self.tier,
+            "tier_name": self.tier_name(self.tier),
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency_ms, 1),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
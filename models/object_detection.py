@@ -0,0 +1,238 @@
+# models/object_detection.py
+import ast
+import os
+
+import cv2
+import numpy as np
+
+# --- Paramètres du Détecteur d'Objets ---
+OBJECT_BACKEND = os.environ.get('SIPA_OBJECT_BACKEND', 'ultralytics') # 'ultralytics', 'onnx' ou 'openvino'
+OBJECT_MODEL = os.environ.get('SIPA_OBJECT_MODEL', 'yolov8n.pt') # Poids PyTorch (source des exports ONNX/OpenVINO)
+OBJECT_IMGSZ = int(os.environ.get('SIPA_OBJECT_IMGSZ', 640)) # Taille d'entrée du modèle (multiple de 32)
+OBJECT_INT8 = os.environ.get('SIPA_OBJECT_INT8', '0') == '1' # Quantification INT8 des graphes exportés
+OBJECT_CONF_THRESHOLD = float(os.environ.get('SIPA_OBJECT_CONF', 0.25)) # Score minimal d'une détection
+OBJECT_IOU_THRESHOLD = 0.45 # Seuil de recouvrement de la suppression des non-maxima
+LETTERBOX_COLOR = 114 # Couleur de remplissage du redimensionnement avec bandes (convention YOLO)
+
+
+class ObjectDetectorBackend:
+    """
+    Moteur d'inférence du détecteur d'objets. Chaque moteur ne renvoie que les détections des
+    classes surveillées (`target_classes`) : les autres classes du modèle sont ignorées dès le
+    post-traitement.
+    """
+    name = "base"
+
+    def __init__(self, target_classes: list, imgsz: int = OBJECT_IMGSZ, conf_threshold: float = OBJECT_CONF_THRESHOLD):
+        self.target_classes = list(target_classes)
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.class_names = {} # Dict: {indice de classe: nom}
+        self.target_ids = []
+
+    def _set_class_names(self, class_names: dict):
+        self.class_names = {int(k): v for k, v in class_names.items()}
+        self.target_ids = sorted(i for i, name in self.class_names.items() if name in self.target_classes)
+        missing = set(self.target_classes) - {self.class_names[i] for i in self.target_ids}
+        if missing:
+            print(f"AVERTISSEMENT: Classes surveillées absentes du modèle d'objets: {sorted(missing)}")
+
+    def detect_batch(self, frames: list):
+        """
+        :param frames: Liste de frames BGR (np.array).
+        :return: Pour chaque frame, la liste des noms de classes surveillées détectées (une entrée par objet).
+        """
+        raise NotImplementedError
+
+    def info(self):
+        return {"backend": self.name, "imgsz": self.imgsz, "target_classes": self.target_classes}
+
+
+class UltralyticsBackend(ObjectDetectorBackend):
+    """Modèle PyTorch via ultralytics (chemin historique, utilisé aussi en repli)."""
+    name = "ultralytics"
+
+    def __init__(self, target_classes: list, model_path: str = OBJECT_MODEL, **kwargs):
+        super().__init__(target_classes, **kwargs)
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self._set_class_names(self.model.names)
+
+    def detect_batch(self, frames: list):
+        # `classes` restreint la suppression des non-maxima et les sorties aux classes surveillées
+        results = self.model(frames, imgsz=self.imgsz, conf=self.conf_threshold, classes=self.target_ids, verbose=False)
+        return [[self.class_names[int(c)] for c in r.boxes.cls] for r in results]
+
+
+def letterbox(frame: np.ndarray, size: int):
+    """
+    Redimensionne la frame (rapport conservé) dans un carré size x size, complété par des bandes.
+    :return: Image carrée BGR (np.array uint8).
+    """
+    height, width = frame.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR) if (new_w, new_h) != (width, height) else frame
+    canvas = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+def preprocess_batch(frames: list, size: int):
+    """Lot NCHW float32 (RGB, valeurs dans [0, 1]) à partir de frames BGR."""
+    return cv2.dnn.blobFromImages([letterbox(frame, size) for frame in frames], scalefactor=1 / 255.0, swapRB=True)
+
+
+def postprocess_yolo(output: np.ndarray, target_ids: list, class_names: dict, conf_threshold: float,
+                     iou_threshold: float = OBJECT_IOU_THRESHOLD):
+    """
+    Décode la sortie brute d'un graphe YOLOv8 exporté, de forme (lot, 4 + nb_classes, nb_ancres),
+    en ne lisant que les lignes de score des classes surveillées.
+    :return: Pour chaque image du lot, la liste des noms de classes détectées.
+    """
+    if not target_ids:
+        return [[] for _ in output]
+    detections = []
+    target_rows = np.asarray(target_ids, dtype=np.int64) + 4
+    for prediction in output:
+        scores = prediction[target_rows] # (nb_classes_surveillées, nb_ancres)
+        best = scores.argmax(axis=0)
+        confidence = scores[best, np.arange(scores.shape[1])]
+        keep = confidence >= conf_threshold
+        names = []
+        if keep.any():
+            cx, cy, w, h = prediction[:4, keep]
+            boxes = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+            classes = best[keep]
+            kept_conf = confidence[keep]
+            # Suppression des non-maxima par classe (comme ultralytics, agnostic=False)
+            for target_index in np.unique(classes):
+                mask = classes == target_index
+                indices = cv2.dnn.NMSBoxes(boxes[mask].tolist(), kept_conf[mask].tolist(), conf_threshold, iou_threshold)
+                names.extend([class_names[target_ids[target_index]]] * len(np.asarray(indices).reshape(-1)))
+        detections.append(names)
+    return detections
+
+
+def _export_model(model_path: str, export_format: str, imgsz: int, int8: bool):
+    """Exporte les poids PyTorch avec ultralytics (une seule fois, le fichier exporté est réutilisé)."""
+    from ultralytics import YOLO
+    print(f"Export du modèle d'objets {model_path} au format {export_format} (imgsz={imgsz}, int8={int8})...")
+    kwargs = {"format": export_format, "imgsz": imgsz, "dynamic": True}
+    if int8 and export_format == "openvino":
+        kwargs["int8"] = True # Quantification post-entraînement avec calibration (NNCF)
+    return YOLO(model_path).export(**kwargs)
+
+
+class OnnxRuntimeBackend(ObjectDetectorBackend):
+    """
+    Graphe ONNX exécuté par ONNX Runtime (CPU). Le graphe est exporté depuis les poids PyTorch au
+    premier lancement ; en INT8, une copie quantifiée dynamiquement est produite à côté.
+    """
+    name = "onnx"
+
+    def __init__(self, target_classes: list, model_path: str = OBJECT_MODEL, int8: bool = OBJECT_INT8, **kwargs):
+        super().__init__(target_classes, **kwargs)
+        import onnxruntime as ort
+        onnx_path = model_path if model_path.endswith('.onnx') else os.path.splitext(model_path)[0] + '.onnx'
+        if not os.path.exists(onnx_path):
+            onnx_path = _export_model(model_path, "onnx", self.imgsz, int8)
+        if int8:
+            onnx_path = self._quantized(onnx_path)
+        self.int8 = int8
+        self.session = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = isinstance(model_input.shape[0], int) # Graphe exporté sans lot dynamique
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self._set_class_names(ast.literal_eval(metadata["names"]))
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+
+    @staticmethod
+    def _quantized(onnx_path: str):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        int8_path = os.path.splitext(onnx_path)[0] + '.int8.onnx'
+        if not os.path.exists(int8_path):
+            import onnx
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QUInt8)
+            # Conserver les métadonnées de l'export (noms des classes) dans le graphe quantifié
+            source, quantized = onnx.load(onnx_path), onnx.load(int8_path)
+            onnx.helper.set_model_props(quantized, {p.key: p.value for p in source.metadata_props})
+            onnx.save(quantized, int8_path)
+        return int8_path
+
+    def _run(self, blob: np.ndarray):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def detect_batch(self, frames: list):
+        blob = preprocess_batch(frames, self.imgsz)
+        if self.fixed_batch:
+            output = np.concatenate([self._run(blob[i:i + 1]) for i in range(len(frames))])
+        else:
+            output = self._run(blob)
+        return postprocess_yolo(output, self.target_ids, self.class_names, self.conf_threshold)
+
+    def info(self):
+        return dict(super().info(), int8=self.int8)
+
+
+class OpenVinoBackend(ObjectDetectorBackend):
+    """Graphe OpenVINO IR compilé pour le CPU (exporté depuis les poids PyTorch, INT8 optionnel)."""
+    name = "openvino"
+
+    def __init__(self, target_classes: list, model_path: str = OBJECT_MODEL, int8: bool = OBJECT_INT8, **kwargs):
+        super().__init__(target_classes, **kwargs)
+        import openvino as ov
+        import yaml
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        export_dir = os.path.join(os.path.dirname(model_path), f"{stem}{'_int8' if int8 else ''}_openvino_model")
+        if not os.path.isdir(export_dir):
+            export_dir = _export_model(model_path, "openvino", self.imgsz, int8)
+        self.int8 = int8
+        core = ov.Core()
+        self.model = core.compile_model(os.path.join(export_dir, f"{stem}.xml"), "CPU",
+                                        {"PERFORMANCE_HINT": "THROUGHPUT"})
+        self.fixed_batch = not self.model.input(0).get_partial_shape()[0].is_dynamic
+        with open(os.path.join(export_dir, "metadata.yaml"), encoding="utf-8") as f:
+            self._set_class_names(yaml.safe_load(f)["names"])
+
+    def _run(self, blob: np.ndarray):
+        return self.model(blob)[self.model.output(0)]
+
+    def detect_batch(self, frames: list):
+        blob = preprocess_batch(frames, self.imgsz)
+        if self.fixed_batch:
+            output = np.concatenate([self._run(blob[i:i + 1]) for i in range(len(frames))])
+        else:
+            output = self._run(blob)
+        return postprocess_yolo(output, self.target_ids, self.class_names, self.conf_threshold)
+
+    def info(self):
+        return dict(super().info(), int8=self.int8)
+
+
+OBJECT_BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxRuntimeBackend,
+    "openvino": OpenVinoBackend,
+}
+
+
+def create_object_detector(target_classes: list, backend: str = OBJECT_BACKEND, model_path: str = OBJECT_MODEL):
+    """
+    Crée le moteur de détection d'objets configuré. En cas d'échec (dépendance absente, export
+    impossible), repli sur le modèle ultralytics.
+    :return: ObjectDetectorBackend, ou None si aucun moteur n'a pu être chargé.
+    """
+    candidates = [backend] if backend == "ultralytics" else [backend, "ultralytics"]
+    for name in candidates:
+        try:
+            detector = OBJECT_BACKENDS[name](target_classes, model_path=model_path)
+            print(f"Détecteur d'objets chargé avec succès (moteur {name}, imgsz={detector.imgsz}).")
+            return detector
+        except Exception as e:
+            print(f"AVERTISSEMENT: Erreur lors du chargement du moteur de détection d'objets '{name}': {e}.")
+    print("AVERTISSEMENT: Aucun moteur de détection d'objets disponible. La détection d'objets sera limitée.")
+    return None
@@ -0,0 +1,398 @@
+# models/passage_index.py
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from models.file_lock import FileLock
+from models.plagiarism_index import PLAGIARISM_INDEX_DIR, ngram_hashes
+
+# --- Paramètres de l'Index des Passages ---
+PASSAGE_INDEX_DIR = os.path.join(PLAGIARISM_INDEX_DIR, 'passages') # Segments de l'index inversé des n-grammes
+PASSAGE_NGRAM_WORDS = 5 # Mots par n-gramme indexé
+PASSAGE_MIN_WORDS = int(os.environ.get('SIPA_PASSAGE_MIN_WORDS', 12)) # Longueur minimale d'un passage signalé
+PASSAGE_MAX_GAP_WORDS = 3 # Mots différents tolérés à l'intérieur d'un passage (mot remplacé, faute corrigée)
+PASSAGE_MAX_POSTINGS_PER_NGRAM = 64 # N-grammes plus fréquents ignorés (formules toutes faites, énoncé commun)
+PASSAGE_MAX_REPORTED = 10 # Passages retournés par soumission (les plus longs)
+PASSAGE_MERGE_FACTOR = 4 # Segments de taille comparable fusionnés ensemble (fusion par paliers)
+PASSAGE_PENDING_MAX_POSTINGS = 32768 # Taille du journal des ajouts récents au-delà de laquelle il devient un segment
+
+MANIFEST_FILE = 'manifest.json' # Segments actifs (nom et nombre de documents) et journal des ajouts en cours
+KEYS_SUFFIX = '.keys' # Hash des n-grammes (uint64, triés)
+POSTINGS_SUFFIX = '.postings' # (document_id, position du n-gramme) en uint32, dans l'ordre des hash
+DOCUMENTS_SUFFIX = '.docs' # Identifiants des documents du segment (uint32)
+PENDING_SUFFIX = '.log' # Journal des ajouts : par document, (document_id, n) puis n hash uint64 et n positions uint32
+LOCK_FILE = '.lock'
+
+
+def _lookup(keys: np.ndarray, postings: np.ndarray, hashes: np.ndarray, max_postings: int):
+    """
+    Postings d'un lot de hash dans des tableaux triés par hash (recherche dichotomique vectorisée).
+    :return: (indices dans `hashes`, np.array (n, 2) des postings correspondants).
+    """
+    low = np.searchsorted(keys, hashes, side='left')
+    high = np.searchsorted(keys, hashes, side='right')
+    counts = high - low
+    found = (counts > 0) & (counts <= max_postings)
+    counts, low = counts[found], low[found]
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2), dtype=np.uint32)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    rows = np.repeat(low, counts) + (np.arange(total) - starts)
+    return np.repeat(np.flatnonzero(found), counts), np.asarray(postings[rows])
+
+
+class _Segment:
+    """Segment immuable de l'index, projeté en mémoire (memory-map) sans être chargé."""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.keys_path = os.path.join(directory, name + KEYS_SUFFIX)
+        self.postings_path = os.path.join(directory, name + POSTINGS_SUFFIX)
+        size = os.path.getsize(self.keys_path) // 8
+        self.keys = np.memmap(self.keys_path, dtype=np.uint64, mode='r', shape=(size,))
+        self.postings = np.memmap(self.postings_path, dtype=np.uint32, mode='r', shape=(size, 2))
+        self.documents = np.fromfile(os.path.join(directory, name + DOCUMENTS_SUFFIX), dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, hashes: np.ndarray, max_postings: int = PASSAGE_MAX_POSTINGS_PER_NGRAM):
+        return _lookup(self.keys, self.postings, hashes, max_postings)
+
+
+class _PendingLog:
+    """
+    Journal des documents ajoutés depuis le dernier segment, en ajout seul : chaque processus le
+    relit au fil de l'eau (seuls les octets nouveaux) et le garde trié en mémoire pour les requêtes.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.path = os.path.join(directory, name + PENDING_SUFFIX)
+        self.offset = 0 # Octets du journal déjà lus (enregistrements complets uniquement)
+        self.documents = []
+        self._keys, self._positions = [], []
+        self._sorted = (np.zeros(0, dtype=np.uint64), np.zeros((0, 2), dtype=np.uint32))
+        self.postings_count = 0
+
+    def __len__(self):
+        return self.postings_count
+
+    def read_new(self):
+        """Lit les enregistrements ajoutés depuis la dernière lecture. :return: Identifiants des nouveaux documents."""
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [] # Journal pas encore créé, ou déjà converti en segment : relu après le manifeste
+        added, position = [], 0
+        while len(data) - position >= 8:
+            document_id, count = np.frombuffer(data, dtype=np.uint32, count=2, offset=position)
+            size = 8 + int(count) * 12
+            if len(data) - position < size:
+                break # Enregistrement en cours d'écriture par un autre processus
+            keys = np.frombuffer(data, dtype=np.uint64, count=int(count), offset=position + 8)
+            positions = np.frombuffer(data, dtype=np.uint32, count=int(count), offset=position + 8 + int(count) * 8)
+            self._keys.append(keys)
+            self._positions.append(np.stack([np.full(int(count), document_id, dtype=np.uint32), positions], axis=1))
+            added.append(int(document_id))
+            position += size
+        if added:
+            self.offset += position
+            self.documents += added
+            self.postings_count += sum(len(keys) for keys in self._keys[-len(added):])
+            keys = np.concatenate(self._keys)
+            order = np.argsort(keys, kind='stable')
+            self._sorted = (keys[order], np.concatenate(self._positions)[order])
+        return added
+
+    def sorted_arrays(self):
+        """:return: (hash triés, postings dans le même ordre) de tout le journal."""
+        return self._sorted
+
+    def lookup(self, hashes: np.ndarray, max_postings: int = PASSAGE_MAX_POSTINGS_PER_NGRAM):
+        keys, postings = self._sorted
+        return _lookup(keys, postings, hashes, max_postings)
+
+
+def _sync_write(path: str, data: bytes, mode: str = 'wb'):
+    with open(path, mode) as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_segment(directory: str, keys: np.ndarray, postings: np.ndarray, documents: np.ndarray):
+    """Écrit un segment (hash triés, postings, documents) ; il n'est visible qu'une fois ajouté au manifeste."""
+    name = f"seg-{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+    for suffix, array in ((KEYS_SUFFIX, keys), (POSTINGS_SUFFIX, postings), (DOCUMENTS_SUFFIX, documents)):
+        _sync_write(os.path.join(directory, name + suffix), np.ascontiguousarray(array).tobytes())
+    return name
+
+
+def _remove_files(directory: str, name: str, suffixes=(KEYS_SUFFIX, POSTINGS_SUFFIX, DOCUMENTS_SUFFIX)):
+    for suffix in suffixes:
+        try:
+            os.remove(os.path.join(directory, name + suffix))
+        except FileNotFoundError:
+            pass
+
+
+class PassageIndex:
+    """
+    Index inversé persistant des n-grammes de mots des soumissions passées : pour chaque hash de
+    n-gramme, les (document, position) où il apparaît. L'index est formé de segments immuables
+    (tableaux triés projetés en mémoire : les processus du serveur partagent les pages via le
+    cache du système, sans charger l'index) et d'un journal des ajouts récents. Chaque ajout est
+    écrit à la fin du journal ; au-delà de PASSAGE_PENDING_MAX_POSTINGS le journal devient un
+    segment, et un thread de fond fusionne les segments de taille comparable (par paliers de
+    PASSAGE_MERGE_FACTOR), si bien qu'une requête ne consulte qu'un nombre logarithmique de
+    segments. Le manifeste ne change qu'à ces occasions et ne liste que les segments : un ajout
+    coûte une écriture de taille fixe, quelle que soit la taille de l'index.
+    Une requête retrouve les n-grammes communs avec chaque document et les aligne en passages :
+    des n-grammes consécutifs sur une même diagonale (même décalage source / soumission) forment
+    un passage recopié.
+    """
+
+    def __init__(self, directory: str = PASSAGE_INDEX_DIR, ngram_words: int = PASSAGE_NGRAM_WORDS,
+                 pending_max_postings: int = PASSAGE_PENDING_MAX_POSTINGS):
+        self.directory = directory
+        self.ngram_words = ngram_words
+        self.pending_max_postings = pending_max_postings
+        self._lock = threading.RLock()
+        self._segments = ()
+        self._pending = None
+        self._documents = set() # Ne fait que grandir : une fusion regroupe des documents déjà connus
+        self._manifest_mtime = None
+        self._merging = False
+        self.merges = 0
+        self.refresh()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, document_id):
+        return document_id in self._documents
+
+    def refresh(self):
+        """
+        Relit les ajouts récents du journal, et rouvre les segments si le manifeste a changé
+        (conversion du journal ou fusion, par ce processus ou un autre).
+        """
+        with self._lock:
+            try:
+                mtime = os.stat(self.manifest_path).st_mtime_ns
+                if mtime != self._manifest_mtime:
+                    with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                        manifest = json.load(f)
+                    opened = {segment.name: segment for segment in self._segments}
+                    segments = tuple(
+                        opened.get(entry['name']) or _Segment(self.directory, entry['name'])
+                        for entry in manifest['segments']
+                    )
+                    for segment in segments:
+                        if segment.name not in opened:
+                            self._documents.update(segment.documents.tolist())
+                    self._segments = segments
+                    if self._pending is None or self._pending.name != manifest['pending']:
+                        self._pending = _PendingLog(self.directory, manifest['pending'])
+                    self._manifest_mtime = mtime
+            except FileNotFoundError:
+                return # Pas encore d'index, ou segment supprimé par une fusion concurrente : relu au prochain appel
+            self._documents.update(self._pending.read_new())
+
+    def _write_manifest(self, segments, pending: str):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'ngram_words': self.ngram_words, 'pending': pending,
+                       'segments': [{'name': s.name, 'documents': len(s.documents)} for s in segments]}, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = None
+
+    def _ensure_manifest(self):
+        # Doit être appelé sous le verrou de fichier
+        if not os.path.exists(self.manifest_path):
+            self._write_manifest((), f"pending-{time.time_ns()}-{os.getpid()}")
+        self.refresh()
+
+    def add(self, document_id: int, tokens: list, hashes: np.ndarray = None):
+        """
+        Indexe les n-grammes d'un document (ignoré s'il est déjà indexé).
+        :param tokens: Mots normalisés du document (voir models/text_normalization.py).
+        :param hashes: Hashes des n-grammes des mots s'ils sont déjà calculés (voir ngram_hashes) ; `tokens` n'est alors pas relu.
+        """
+        if document_id is None or document_id in self._documents:
+            return
+        if hashes is None:
+            hashes = ngram_hashes(tokens, self.ngram_words) if len(tokens) >= self.ngram_words else np.zeros(0, dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        record = (np.array([document_id, len(hashes)], dtype=np.uint32).tobytes() + hashes.astype(np.uint64).tobytes()
+                  + np.arange(len(hashes), dtype=np.uint32).tobytes())
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, FileLock(os.path.join(self.directory, LOCK_FILE)):
+            self._ensure_manifest()
+            if document_id in self._documents:
+                return
+            _sync_write(self._pending.path, record, mode='ab')
+            self.refresh()
+            if len(self._pending) >= self.pending_max_postings:
+                self._flush_pending()
+        self._maybe_merge()
+
+    def _flush_pending(self):
+        # Doit être appelé sous le verrou de fichier, journal entièrement relu
+        pending = self._pending
+        keys, postings = pending.sorted_arrays()
+        name = _write_segment(self.directory, keys, postings, np.array(pending.documents, dtype=np.uint32))
+        self._write_manifest(self._segments + (_Segment(self.directory, name),), f"pending-{time.time_ns()}-{os.getpid()}")
+        self.refresh()
+        _remove_files(self.directory, pending.name, (PENDING_SUFFIX,))
+
+    def _merge_candidates(self):
+        """Segments du plus petit palier de taille qui en compte au moins PASSAGE_MERGE_FACTOR."""
+        tiers = {}
+        for segment in self._segments:
+            tier = int(math.log(max(len(segment), 1), PASSAGE_MERGE_FACTOR))
+            tiers.setdefault(tier, []).append(segment)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= PASSAGE_MERGE_FACTOR:
+                return tiers[tier]
+        return None
+
+    def _maybe_merge(self):
+        with self._lock:
+            if self._merging or self._merge_candidates() is None:
+                return
+            self._merging = True
+        threading.Thread(target=self._merge_loop, name="sipa-passage-merge", daemon=True).start()
+
+    def _merge_loop(self):
+        try:
+            while True:
+                with self._lock:
+                    self.refresh()
+                    selected = self._merge_candidates()
+                if selected is None:
+                    return
+                self._merge(selected)
+        except Exception as e:
+            print(f"AVERTISSEMENT: Échec de la fusion des segments de l'index des passages: {e}")
+        finally:
+            with self._lock:
+                self._merging = False
+
+    def _merge(self, selected):
+        keys = np.concatenate([np.asarray(s.keys) for s in selected])
+        postings = np.concatenate([np.asarray(s.postings) for s in selected])
+        order = np.argsort(keys, kind='stable')
+        documents = np.sort(np.concatenate([s.documents for s in selected]))
+        name = _write_segment(self.directory, keys[order], postings[order], documents)
+        selected_names = {s.name for s in selected}
+
+        with self._lock, FileLock(os.path.join(self.directory, LOCK_FILE)):
+            self.refresh()
+            current = {s.name for s in self._segments}
+            if not selected_names <= current:
+                # Un autre processus a déjà fusionné ces segments
+                _remove_files(self.directory, name)
+                return
+            merged = _Segment(self.directory, name)
+            self._write_manifest(tuple(s for s in self._segments if s.name not in selected_names) + (merged,),
+                                 self._pending.name)
+            self.refresh()
+            self.merges += 1
+        # Les processus qui projettent encore les anciens fichiers gardent un accès valide (POSIX)
+        for segment_name in selected_names:
+            _remove_files(self.directory, segment_name)
+
+    def query(self, tokens: list, exclude_documents=(), min_words: int = PASSAGE_MIN_WORDS,
+              max_gap_words: int = PASSAGE_MAX_GAP_WORDS, limit: int = PASSAGE_MAX_REPORTED, min_document_id: int = 0):
+        """
+        Passages d'un texte identiques à des passages de documents indexés.
+        :param tokens: Mots normalisés du texte.
+        :param exclude_documents: Documents à ignorer (versions précédentes du même étudiant).
+        :param min_document_id: Seuls les documents d'identifiant supérieur ou égal sont considérés (ajouts récents).
+        :return: Liste (plus longs d'abord) de dicts {document_id, start, end, source_start, source_end, words},
+                 positions en mots (fin exclue) dans le texte et dans le document source.
+        """
+        if len(tokens) < self.ngram_words:
+            return []
+        return self.query_hashes(ngram_hashes(tokens, self.ngram_words), exclude_documents, min_words,
+                                 max_gap_words, limit, min_document_id)
+
+    def query_hashes(self, hashes: np.ndarray, exclude_documents=(), min_words: int = PASSAGE_MIN_WORDS,
+                     max_gap_words: int = PASSAGE_MAX_GAP_WORDS, limit: int = PASSAGE_MAX_REPORTED, min_document_id: int = 0):
+        """
+        Comme query, à partir des hashes des n-grammes du texte déjà calculés (voir ngram_hashes).
+        """
+        if len(hashes) == 0:
+            return []
+        self.refresh()
+        segments = self._segments + ((self._pending,) if self._pending is not None else ())
+
+        matched_positions, matched_postings = [], []
+        for segment in segments:
+            positions, postings = segment.lookup(hashes)
+            matched_positions.append(positions)
+            matched_postings.append(postings)
+        if not segments:
+            return []
+        positions = np.concatenate(matched_positions)
+        postings = np.concatenate(matched_postings)
+        if min_document_id:
+            keep = postings[:, 0] >= min_document_id
+            positions, postings = positions[keep], postings[keep]
+        if exclude_documents:
+            keep = ~np.isin(postings[:, 0], np.fromiter(exclude_documents, dtype=np.int64))
+            positions, postings = positions[keep], postings[keep]
+        if len(positions) == 0:
+            return []
+
+        # Alignement : tri par (document, diagonale, position), puis découpage en suites de n-grammes rapprochés
+        documents = postings[:, 0].astype(np.int64)
+        diagonals = postings[:, 1].astype(np.int64) - positions
+        order = np.lexsort((positions, diagonals, documents))
+        documents, diagonals, positions = documents[order], diagonals[order], positions[order]
+        breaks = np.flatnonzero(
+            (np.diff(documents) != 0) | (np.diff(diagonals) != 0) |
+            (np.diff(positions) > self.ngram_words + max_gap_words)
+        ) + 1
+        run_starts = np.concatenate([[0], breaks])
+        run_ends = np.concatenate([breaks, [len(positions)]]) - 1
+        starts = positions[run_starts]
+        ends = positions[run_ends] + self.ngram_words
+        lengths = ends - starts
+        long_enough = np.flatnonzero(lengths >= min_words)
+        longest = long_enough[np.argsort(-lengths[long_enough], kind='stable')][:limit]
+        return [
+            {
+                "document_id": int(documents[run_starts[i]]),
+                "start": int(starts[i]),
+                "end": int(ends[i]),
+                "source_start": int(starts[i] + diagonals[run_starts[i]]),
+                "source_end": int(ends[i] + diagonals[run_starts[i]]),
+                "words": int(lengths[i]),
+            }
+            for i in longest
+        ]
+
+    def stats(self):
+        return {
+            "segments": len(self._segments),
+            "postings": sum(len(s) for s in self._segments) + (len(self._pending) if self._pending is not None else 0),
+            "pending_documents": len(self._pending.documents) if self._pending is not None else 0,
+            "documents": len(self._documents),
+            "merges": self.merges,
+        }
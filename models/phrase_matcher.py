@@ -0,0 +1,160 @@
+# models/phrase_matcher.py
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+from models.text_normalization import iter_normalized_chars, normalize_phrase
+
+# --- Paramètres de la Recherche de Formules Types ---
+AI_PHRASES_FILE = os.environ.get('SIPA_AI_PHRASES_FILE', os.path.join(os.path.dirname(__file__), 'ai_phrases.txt'))
+PHRASE_RELOAD_CHECK_S = 2.0 # Intervalle minimal entre deux vérifications de modification du fichier
+
+
+def load_phrases(path: str):
+    """Formules d'un fichier texte : une par ligne, lignes vides et commentaires (#) ignorés."""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    phrases = [line.strip() for line in content.splitlines()]
+    return [p for p in phrases if p and not p.startswith('#')], content
+
+
+class PhraseAutomaton:
+    """
+    Automate d'Aho-Corasick sur les formes normalisées d'une liste de formules (voir
+    models/text_normalization.py) : toutes les occurrences de toutes les formules sont trouvées
+    en un seul passage sur le texte, quel que soit le nombre de formules. Les formules sont
+    bornées par des espaces, elles ne correspondent donc qu'à des mots entiers.
+    """
+
+    def __init__(self, phrases: list):
+        self.phrases = []
+        self._lengths = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        seen = set()
+        for phrase in phrases:
+            pattern = normalize_phrase(phrase)
+            if not pattern.strip() or pattern in seen:
+                continue
+            seen.add(pattern)
+            self._insert(pattern, len(self.phrases))
+            self.phrases.append(phrase)
+            self._lengths.append(len(pattern))
+        self._build_failure_links()
+
+    def _insert(self, pattern: str, phrase_id: int):
+        node = 0
+        for char in pattern:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = self._goto[node][char] = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = child
+        self._output[node] += (phrase_id,)
+
+    def _build_failure_links(self):
+        # Parcours en largeur : le lien d'échec d'un nœud pointe vers le plus long suffixe qui est aussi un préfixe
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] += self._output[self._fail[child]]
+                queue.append(child)
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def search(self, text: str):
+        """
+        Occurrences des formules dans un texte.
+        :return: Liste de (indice de la formule, début, fin) en caractères du texte d'origine (fin exclue).
+        """
+        goto, fail, output, lengths = self._goto, self._fail, self._output, self._lengths
+        node = 0
+        offsets = []
+        hits = []
+        for index, (char, position) in enumerate(iter_normalized_chars(text)):
+            offsets.append(position)
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for phrase_id in output[node]:
+                # La forme normalisée commence et finit par une espace : on rapporte les lettres
+                hits.append((phrase_id, offsets[index - lengths[phrase_id] + 2], offsets[index - 1] + 1))
+        return hits
+
+
+class PhraseMatcher:
+    """
+    Recherche des formules d'un fichier, rechargé quand il est modifié : le nouvel automate est
+    construit à part puis remplace l'ancien d'un bloc, sans interrompre les recherches en cours.
+    `version` identifie le contenu du fichier chargé.
+    """
+
+    def __init__(self, path: str = AI_PHRASES_FILE):
+        self.path = path
+        self._state = (PhraseAutomaton([]), None, "") # (automate, (mtime, taille) du fichier, version)
+        self._reload_lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        with self._reload_lock:
+            self._reload()
+
+    def _reload(self):
+        # Doit être appelé sous self._reload_lock
+        try:
+            stat = os.stat(self.path)
+            phrases, content = load_phrases(self.path)
+        except OSError as e:
+            print(f"AVERTISSEMENT: Impossible de charger les formules types depuis {self.path}: {e}")
+            return
+        automaton = PhraseAutomaton(phrases)
+        version = hashlib.sha1(content.encode('utf-8')).hexdigest()[:12]
+        self._state = (automaton, (stat.st_mtime_ns, stat.st_size), version)
+        print(f"{len(automaton)} formules types chargées depuis {self.path}.")
+
+    def _check_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < PHRASE_RELOAD_CHECK_S:
+            return
+        self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        if (stat.st_mtime_ns, stat.st_size) == self._state[1]:
+            return
+        if self._reload_lock.acquire(blocking=False): # Un seul thread reconstruit, les autres gardent l'ancien automate
+            try:
+                self._reload()
+            finally:
+                self._reload_lock.release()
+
+    @property
+    def version(self):
+        self._check_reload()
+        return self._state[2]
+
+    def matches(self, text: str):
+        """
+        Occurrences des formules dans un texte (après normalisation Unicode, accents et casse).
+        :return: Liste de dicts {phrase, start, end}, positions en caractères du texte d'origine.
+        """
+        self._check_reload()
+        automaton = self._state[0]
+        return [
+            {"phrase": automaton.phrases[phrase_id], "start": start, "end": end}
+            for phrase_id, start, end in automaton.search(text)
+        ]
+
+    def stats(self):
+        automaton, _, version = self._state
+        return {"phrases": len(automaton), "version": version}
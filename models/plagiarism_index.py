@@ -0,0 +1,313 @@
+# models/plagiarism_index.py
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from models.file_lock import FileLock
+from models.text_normalization import words
+
+# --- Paramètres de l'Index de Plagiat (MinHash / LSH) ---
+PLAGIARISM_INDEX_DIR = os.environ.get('SIPA_PLAGIARISM_INDEX_DIR', 'plagiarism_index') # Dossier de l'index (relatif au dossier de lancement)
+PLAGIARISM_SHINGLE_WORDS = int(os.environ.get('SIPA_PLAGIARISM_SHINGLE_WORDS', 5)) # Mots par shingle
+PLAGIARISM_NUM_PERM = int(os.environ.get('SIPA_PLAGIARISM_NUM_PERM', 128)) # Taille des signatures MinHash
+PLAGIARISM_BANDS = int(os.environ.get('SIPA_PLAGIARISM_BANDS', 32)) # Bandes LSH (seuil de détection ~ (1/bandes)^(bandes/num_perm))
+PLAGIARISM_MIN_SIMILARITY = float(os.environ.get('SIPA_PLAGIARISM_MIN_SIMILARITY', 0.3)) # Jaccard estimé minimal d'une source signalée
+PLAGIARISM_TOP_K = 5 # Sources candidates retournées par soumission
+LSH_PENDING_MAX = 1024 # Documents récents cherchés linéairement avant fusion dans les tables triées
+MINHASH_SEED = 1 # Graine des permutations (fixe : les signatures stockées doivent rester comparables)
+MINHASH_CHUNK = 4096 # Shingles hachés par bloc (mémoire bornée à num_perm x bloc)
+MERSENNE_PRIME = (1 << 61) - 1
+HASH_MULTIPLIER = np.uint64(1099511628211) # Combinaison de hash (premier FNV 64 bits)
+
+SIGNATURES_FILE = 'signatures.u32' # Matrice uint32 (une signature par document), en ajout seul
+DOCUMENTS_FILE = 'documents.jsonl' # Métadonnées des documents, une ligne JSON par document, en ajout seul
+META_FILE = 'meta.json' # Paramètres avec lesquels les signatures ont été calculées
+LOCK_FILE = '.lock'
+
+
+def ngram_hashes(tokens: list, size: int):
+    """
+    Hash 64 bits de chaque suite de `size` mots consécutifs, dans l'ordre du texte (le hash
+    d'indice i couvre les mots i à i + size - 1). Un texte plus court que `size` mots forme un seul n-gramme.
+    :return: np.array uint64.
+    """
+    if not tokens:
+        return np.zeros(0, dtype=np.uint64)
+    vocabulary = {}
+    word_ids = [vocabulary.setdefault(w, len(vocabulary)) for w in tokens]
+    vocabulary_hashes = np.array([zlib.crc32(w.encode('utf-8')) for w in vocabulary], dtype=np.uint64)
+    word_hashes = vocabulary_hashes[word_ids]
+    size = min(size, len(word_hashes))
+    count = len(word_hashes) - size + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        combined = combined * HASH_MULTIPLIER + word_hashes[offset:offset + count]
+    # Mélange final (murmur3)
+    combined ^= combined >> np.uint64(33)
+    combined *= np.uint64(0xFF51AFD7ED558CCD)
+    combined ^= combined >> np.uint64(33)
+    return combined
+
+
+def shingle_hashes(tokens: list, size: int = PLAGIARISM_SHINGLE_WORDS):
+    """
+    Hash 32 bits des shingles distincts (suites de `size` mots consécutifs) d'un texte.
+    :return: np.array uint32 trié.
+    """
+    return np.unique((ngram_hashes(tokens, size) >> np.uint64(32)).astype(np.uint32))
+
+
+def band_keys(signatures: np.ndarray, bands: int):
+    """
+    Clé de chaque bande LSH d'un lot de signatures : deux documents partagent un bucket dans une
+    bande si les lignes de la bande de leurs signatures sont identiques.
+    :param signatures: np.array uint32 (n, num_perm).
+    :return: np.array uint64 (n, bands).
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    keys = np.zeros((count, bands), dtype=np.uint64)
+    for start in range(0, count, 65536):
+        block = np.asarray(signatures[start:start + 65536, :bands * rows], dtype=np.uint64).reshape(-1, bands, rows)
+        block_keys = np.zeros(block.shape[:2], dtype=np.uint64)
+        for row in range(rows):
+            block_keys = block_keys * HASH_MULTIPLIER + block[:, :, row]
+        keys[start:start + len(block)] = block_keys
+    return keys
+
+
+class MinHasher:
+    """Signatures MinHash : minimum de `num_perm` hachages universels (a*x + b mod p) des shingles."""
+
+    def __init__(self, num_perm: int = PLAGIARISM_NUM_PERM, seed: int = MINHASH_SEED):
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 2 ** 32, size=(num_perm, 1), dtype=np.uint64)
+        self.b = rng.randint(0, 2 ** 32, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, hashes: np.ndarray):
+        """:return: np.array uint32 (num_perm,) ; toutes les valeurs au maximum si le texte n'a aucun shingle."""
+        signature = np.full(self.num_perm, 0xFFFFFFFF, dtype=np.uint64)
+        values = hashes.astype(np.uint64)
+        for start in range(0, len(values), MINHASH_CHUNK):
+            # a, x < 2^32 : a*x + b tient dans 64 bits sans débordement
+            permuted = (self.a * values[None, start:start + MINHASH_CHUNK] + self.b) % np.uint64(MERSENNE_PRIME)
+            np.minimum(signature, (permuted & np.uint64(0xFFFFFFFF)).min(axis=1), out=signature)
+        return signature.astype(np.uint32)
+
+
+class TextFingerprint:
+    """Empreinte d'une soumission : hash du texte normalisé et signature MinHash de ses shingles."""
+
+    def __init__(self, text_hash: str, signature: np.ndarray, word_count: int):
+        self.text_hash = text_hash
+        self.signature = signature
+        self.word_count = word_count
+
+
+class PlagiarismIndex:
+    """
+    Index persistant des soumissions passées pour la recherche de plagiat.
+    Chaque soumission est réduite à une signature MinHash de ses shingles de mots, dont la
+    similarité (part de valeurs égales) estime la similarité de Jaccard des textes. Les signatures
+    sont découpées en bandes ; pour chaque bande, les clés de tous les documents sont gardées dans
+    un tableau trié, si bien qu'une requête ne compare la soumission qu'aux documents partageant
+    un bucket (recherche dichotomique par bande) et jamais à tout le corpus. Les documents récents
+    sont cherchés linéairement jusqu'à LSH_PENDING_MAX, puis fusionnés dans les tables triées.
+    Sur disque, les signatures et les métadonnées sont en ajout seul ; plusieurs processus
+    partagent l'index (verrou de fichier pour les écritures, relecture incrémentale des ajouts).
+    """
+
+    def __init__(self, directory: str = PLAGIARISM_INDEX_DIR, num_perm: int = PLAGIARISM_NUM_PERM,
+                 bands: int = PLAGIARISM_BANDS, shingle_words: int = PLAGIARISM_SHINGLE_WORDS):
+        self.directory = directory
+        self.num_perm, self.bands, self.shingle_words = self._load_params(num_perm, bands, shingle_words)
+        self.hasher = MinHasher(self.num_perm)
+        self._lock = threading.RLock()
+        self._documents = []
+        self._by_content = {} # Dict: {(student_id, text_hash): document_id} (resoumissions identiques)
+        self._by_student = {} # Dict: {student_id: set des document_id}
+        self._documents_offset = 0 # Octets du fichier de métadonnées déjà lus
+        self._signatures = np.zeros((0, self.num_perm), dtype=np.uint32)
+        self._sorted_keys = np.zeros((self.bands, 0), dtype=np.uint64)
+        self._sorted_rows = np.zeros((self.bands, 0), dtype=np.int64)
+        self._pending_keys = np.zeros((0, self.bands), dtype=np.uint64)
+        self.version = 0 # Incrémenté à chaque ajout de documents (invalide les résultats mis en cache)
+        self.refresh()
+
+    @property
+    def signatures_path(self):
+        return os.path.join(self.directory, SIGNATURES_FILE)
+
+    @property
+    def documents_path(self):
+        return os.path.join(self.directory, DOCUMENTS_FILE)
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.directory, META_FILE)
+
+    def _load_params(self, num_perm, bands, shingle_words):
+        """Les paramètres enregistrés avec l'index l'emportent : les signatures doivent rester comparables."""
+        params = {'num_perm': num_perm, 'bands': bands, 'shingle_words': shingle_words, 'seed': MINHASH_SEED}
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return num_perm, bands, shingle_words
+        if stored != params:
+            print(f"AVERTISSEMENT: Index de plagiat créé avec d'autres paramètres ({stored}), ils sont conservés.")
+        return stored['num_perm'], stored['bands'], stored['shingle_words']
+
+    def __len__(self):
+        return len(self._documents)
+
+    def document(self, document_id: int):
+        """Métadonnées d'un document indexé (student_id, text_hash, words, created_at), ou None s'il n'est pas encore relu."""
+        documents = self._documents
+        return documents[document_id] if document_id < len(documents) else None
+
+    def documents_of(self, student_id: str):
+        """Identifiants des documents indexés d'un étudiant."""
+        return self._by_student.get(student_id, set())
+
+    def featurize(self, text: str, tokens: list = None):
+        """
+        Empreinte d'un texte (sans l'ajouter à l'index).
+        :param tokens: Mots normalisés du texte s'ils sont déjà calculés (voir models/text_normalization.py).
+        """
+        tokens = words(text) if tokens is None else tokens
+        text_hash = hashlib.sha1(' '.join(tokens).encode('utf-8')).hexdigest()
+        signature = self.hasher.signature(shingle_hashes(tokens, self.shingle_words))
+        return TextFingerprint(text_hash, signature, len(tokens))
+
+    def refresh(self):
+        """Intègre les documents ajoutés depuis la dernière lecture (par ce processus ou un autre)."""
+        with self._lock:
+            try:
+                size = os.path.getsize(self.documents_path)
+            except FileNotFoundError:
+                return
+            if size <= self._documents_offset:
+                return
+            with open(self.documents_path, 'rb') as f:
+                f.seek(self._documents_offset)
+                data = f.read(size - self._documents_offset)
+            complete = data[:data.rfind(b'\n') + 1] # Une ligne incomplète (ajout en cours) sera lue plus tard
+            new_documents = [json.loads(line) for line in complete.splitlines() if line.strip()]
+            self._documents_offset += len(complete)
+            if not new_documents:
+                return
+            start = len(self._documents)
+            self._documents.extend(new_documents) # En place : les lectures concurrentes n'indexent que des documents déjà présents
+            for document in new_documents:
+                self._by_content[(document['student_id'], document['text_hash'])] = document['document_id']
+                self._by_student.setdefault(document['student_id'], set()).add(document['document_id'])
+            self._signatures = np.memmap(self.signatures_path, dtype=np.uint32, mode='r',
+                                         shape=(len(self._documents), self.num_perm))
+            self._index_rows(start)
+            self.version += 1
+
+    def _index_rows(self, start: int):
+        # Doit être appelé sous self._lock
+        self._pending_keys = np.concatenate([self._pending_keys, band_keys(self._signatures[start:], self.bands)])
+        if len(self._pending_keys) < LSH_PENDING_MAX:
+            return
+        indexed = self._sorted_keys.shape[1]
+        new_rows = np.broadcast_to(np.arange(indexed, indexed + len(self._pending_keys)), (self.bands, len(self._pending_keys)))
+        keys = np.concatenate([self._sorted_keys, self._pending_keys.T], axis=1)
+        rows = np.concatenate([self._sorted_rows, new_rows], axis=1)
+        order = np.argsort(keys, axis=1, kind='stable')
+        self._sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self._sorted_rows = np.take_along_axis(rows, order, axis=1)
+        self._pending_keys = np.zeros((0, self.bands), dtype=np.uint64)
+
+    def query(self, fingerprint: TextFingerprint, exclude_student_id: str = None, k: int = PLAGIARISM_TOP_K,
+              min_similarity: float = PLAGIARISM_MIN_SIMILARITY, min_document_id: int = 0, exclude_documents=()):
+        """
+        Documents indexés les plus proches d'une empreinte.
+        :param exclude_student_id: Les documents de cet étudiant sont ignorés (ses propres versions précédentes).
+        :param min_document_id: Seuls les documents d'identifiant supérieur ou égal sont considérés (ajouts récents).
+        :param exclude_documents: Documents à ignorer (ex: la soumission elle-même, déjà indexée).
+        :return: Liste (similarité décroissante) de dicts {document_id, student_id, similarity}.
+        """
+        if fingerprint.word_count == 0:
+            return []
+        self.refresh()
+        with self._lock:
+            documents, signatures = self._documents, self._signatures
+            sorted_keys, sorted_rows, pending_keys = self._sorted_keys, self._sorted_rows, self._pending_keys
+
+        keys = band_keys(fingerprint.signature[None], self.bands)[0]
+        candidates = []
+        for band in range(self.bands):
+            low = np.searchsorted(sorted_keys[band], keys[band], side='left')
+            high = np.searchsorted(sorted_keys[band], keys[band], side='right')
+            if high > low:
+                candidates.append(sorted_rows[band, low:high])
+        if len(pending_keys):
+            candidates.append(sorted_keys.shape[1] + np.flatnonzero((pending_keys == keys).any(axis=1)))
+        if not candidates:
+            return []
+        rows = np.unique(np.concatenate(candidates))
+        rows = rows[rows >= min_document_id]
+        if exclude_documents:
+            rows = rows[~np.isin(rows, np.fromiter(exclude_documents, dtype=np.int64))]
+        if exclude_student_id is not None:
+            rows = rows[np.array([documents[row]['student_id'] != exclude_student_id for row in rows], dtype=bool)]
+        if len(rows) == 0:
+            return []
+
+        similarities = (np.asarray(signatures[rows]) == fingerprint.signature).mean(axis=1)
+        order = np.argsort(-similarities, kind='stable')[:k]
+        return [
+            {"document_id": int(rows[i]), "student_id": documents[rows[i]]['student_id'], "similarity": float(similarities[i])}
+            for i in order if similarities[i] >= min_similarity
+        ]
+
+    def add(self, fingerprint: TextFingerprint, student_id: str):
+        """
+        Ajoute une soumission à l'index (une resoumission identique du même étudiant n'est pas dupliquée).
+        :return: document_id de la soumission, ou None pour un texte sans mots.
+        """
+        if fingerprint.word_count == 0:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, FileLock(os.path.join(self.directory, LOCK_FILE)):
+            self.refresh()
+            existing = self._by_content.get((student_id, fingerprint.text_hash))
+            if existing is not None:
+                return existing
+            if not os.path.exists(self.meta_path):
+                with open(self.meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'num_perm': self.num_perm, 'bands': self.bands,
+                               'shingle_words': self.shingle_words, 'seed': MINHASH_SEED}, f)
+
+            document_id = len(self._documents)
+            with open(self.signatures_path, 'r+b' if os.path.exists(self.signatures_path) else 'wb') as f:
+                # Écrire à la position attendue (écrase une éventuelle ligne partielle d'un ajout interrompu)
+                f.seek(document_id * self.num_perm * 4)
+                f.write(fingerprint.signature.astype(np.uint32).tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            document = {'document_id': document_id, 'student_id': student_id, 'text_hash': fingerprint.text_hash,
+                        'words': fingerprint.word_count, 'created_at': time.time()}
+            with open(self.documents_path, 'ab') as f:
+                f.truncate(self._documents_offset) # Ligne incomplète d'un ajout interrompu
+                f.write((json.dumps(document) + '\n').encode('utf-8'))
+            self.refresh()
+            return document_id
+
+    def stats(self):
+        return {
+            "documents": len(self._documents),
+            "pending": len(self._pending_keys),
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+        }
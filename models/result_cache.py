@@ -0,0 +1,125 @@
+# models/result_cache.py
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# --- Paramètres du Cache des Résultats d'Analyse Textuelle ---
+TEXT_CACHE_MAX_MB = float(os.environ.get('SIPA_TEXT_CACHE_MAX_MB', 64)) # Taille maximale du cache en mémoire (par processus)
+TEXT_CACHE_PERSIST = os.environ.get('SIPA_TEXT_CACHE_PERSIST', '1') == '1' # Conserver aussi les résultats dans la base SQLite
+CACHE_TABLE = 'text_result_cache'
+
+
+def content_key(text: str, student_id: str = None):
+    """
+    Clé d'un résultat : hash du texte (déjà normalisé) et de son auteur, dont dépend la recherche
+    de plagiat (ses propres soumissions ne sont pas des sources).
+    """
+    return hashlib.sha256(f"{student_id}\0{text}".encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache des résultats d'analyse adressé par contenu. En mémoire, les résultats sont gardés
+    sérialisés (JSON) dans un LRU borné en octets ; ils peuvent aussi être conservés dans une
+    table SQLite, partagée par les processus et conservée entre deux démarrages.
+    Chaque lecture et écriture porte la version de l'analyse (algorithmes, formules types) : un
+    changement de version invalide tout le cache. Les résultats peuvent être complétés et réécrits
+    par l'appelant (voir models/text_detection.py:analyze_text).
+    """
+
+    def __init__(self, max_bytes: int = int(TEXT_CACHE_MAX_MB * 1024 * 1024)):
+        self.max_bytes = max_bytes
+        self.database = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # Dict: {clé: résultat JSON}, du moins au plus récemment utilisé
+        self._bytes = 0
+        self._version = None
+        self._purged_version = None # Version pour laquelle les résultats périmés ont été retirés de la base
+        self.hits = 0
+        self.database_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def attach_database(self, path: str):
+        """Conserve aussi les résultats dans la base SQLite `path` (table créée si besoin)."""
+        with sqlite3.connect(path) as conn:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS {CACHE_TABLE} (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    result TEXT NOT NULL, -- JSON string of the analysis results
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+        self.database = path
+
+    def _check_version(self, version: str):
+        # Doit être appelé sous self._lock
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _store(self, key: str, payload: str):
+        # Doit être appelé sous self._lock
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = payload
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key: str, version: str):
+        """:return: Résultat mis en cache pour cette clé et cette version, ou None."""
+        with self._lock:
+            self._check_version(version)
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+
+        if self.database is not None:
+            with sqlite3.connect(self.database) as conn:
+                row = conn.execute(f"SELECT result FROM {CACHE_TABLE} WHERE key = ? AND version = ?", (key, version)).fetchone()
+            if row is not None:
+                with self._lock:
+                    self._check_version(version)
+                    self._store(key, row[0])
+                    self.database_hits += 1
+                return json.loads(row[0])
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, version: str, result: dict):
+        payload = json.dumps(result)
+        with self._lock:
+            self._check_version(version)
+            self._store(key, payload)
+        if self.database is not None:
+            with sqlite3.connect(self.database) as conn:
+                conn.execute(f"INSERT OR REPLACE INTO {CACHE_TABLE} (key, version, result) VALUES (?, ?, ?)", (key, version, payload))
+                if version != self._purged_version:
+                    # Résultats d'une version précédente : retirés une fois par processus et par changement de version
+                    conn.execute(f"DELETE FROM {CACHE_TABLE} WHERE version != ?", (version,))
+                    self._purged_version = version
+                conn.commit()
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "database_hits": self.database_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,244 @@
+# models/session_state.py
+import threading
+import time
+from collections import OrderedDict, deque
+
+from models.audio_stream import SessionAudioStream
+from models.detector_scheduling import DetectorScheduler
+from models.frame_gate import FrameChangeGate
+from models.head_pose import HeadPoseTracker
+from models.identity_tracking import IdentityTracker
+from models.voice_activity import VoiceActivityDetector
+
+# --- Paramètres du Registre de Sessions ---
+SESSION_IDLE_TIMEOUT_S = 300 # Une session sans frame depuis ce délai est libérée
+MAX_SESSIONS = 200 # Nombre maximal de sessions d'examen actives par processus (éviction LRU au-delà)
+MAX_SESSIONS_MEMORY_MB = 4096 # Budget mémoire estimé pour l'ensemble des sessions (éviction LRU au-delà)
+POSE_HISTORY_LENGTH = 30 # Nombre de poses de tête conservées par session
+
+SESSION_BASE_MEMORY_BYTES = 64 * 1024 # Estimation de l'état Python d'une session (compteurs, historique)
+DETECTOR_MEMORY_BYTES = 40 * 1024 * 1024 # Estimation d'un jeu de graphes MediaPipe (FaceMesh + FaceDetection)
+
+
+class SessionClosed(RuntimeError):
+    """La session a été terminée (éviction, fin d'examen) : ses détecteurs ne sont plus disponibles."""
+
+
+def session_key(student_id: str, exam_id: str = None):
+    """
+    Construit la clé de session à partir de l'ID étudiant et, si fourni, de l'ID d'examen.
+    """
+    if exam_id:
+        return f"{student_id}:{exam_id}"
+    return student_id
+
+
+class ExamSession:
+    """
+    État de surveillance d'un étudiant pour un examen : compteurs, historique de pose et
+    détecteurs réservés à la session. Les frames d'une même session sont traitées sous `lock`
+    pour que les compteurs restent cohérents si le client envoie plusieurs requêtes en parallèle.
+    La fermeture prend aussi `lock` : une frame en cours se termine sur des détecteurs valides, et
+    une session fermée refuse d'en recréer (`closed`). L'analyse audio, déclenchée à la réception de
+    l'audio et non des frames, est sérialisée par `audio_lock`.
+    """
+
+    def __init__(self, student_id: str, exam_id: str = None):
+        self.student_id = student_id
+        self.exam_id = exam_id
+        self.key = session_key(student_id, exam_id)
+        self.lock = threading.RLock()
+        self.closed = False
+        self.created_at = time.monotonic()
+        self.last_seen = self.created_at
+
+        # Planification des détecteurs et derniers résultats reportés
+        self.scheduler = DetectorScheduler()
+        self.frame_gate = FrameChangeGate()
+        self.last_results = None # Résultats de la dernière frame, renvoyés si la frame suivante est ignorée
+        self.quality_tier = 0 # Niveau de qualité courant (voir models/load_shedding.py)
+        self.last_alert_at = self.created_at # Dernière frame en alerte (rythme de capture du client)
+
+        # Visuel
+        self.identity = IdentityTracker()
+        self.head_pose = HeadPoseTracker()
+        self.face_mesh_roi = None # ((x0, y0, x1, y1), taille du visage) : ROI stabilisé de FaceMesh
+        self.last_head_pose = None
+        self.abnormal_movement_counter = 0
+        self.pose_history = deque(maxlen=POSE_HISTORY_LENGTH)
+
+        # Audio
+        self.audio_lock = threading.RLock() # Flux audio, détecteur d'activité vocale et compteur de voix
+        self.audio = SessionAudioStream() # Décodage continu des chunks du navigateur (tampon circulaire)
+        self.voice_activity = VoiceActivityDetector()
+        self.unexpected_voice_counter = 0
+        self.last_voice_result = (False, "Aucune activité vocale.") # Reporté tant qu'aucune nouvelle fenêtre audio n'est décodée
+
+        # Détecteurs (créés à la demande, voir get_detectors)
+        self.detectors = None
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def get_detectors(self, factory):
+        """
+        Retourne les détecteurs de la session, en les créant avec `factory()` au premier appel.
+        :raises SessionClosed: Si la session a été fermée (les graphes ne seraient jamais libérés).
+        """
+        if self.closed:
+            raise SessionClosed(f"Session {self.key} fermée.")
+        if self.detectors is None:
+            self.detectors = factory()
+        return self.detectors
+
+    def reset_counters(self):
+        """Remet à zéro les compteurs et l'historique sans libérer les détecteurs."""
+        self.scheduler.reset()
+        self.frame_gate.reset()
+        self.last_results = None
+        self.quality_tier = 0
+        self.last_alert_at = time.monotonic()
+        self.identity.reset()
+        self.head_pose.reset()
+        self.face_mesh_roi = None
+        self.last_head_pose = None
+        self.abnormal_movement_counter = 0
+        self.pose_history.clear()
+        self.audio.close() # Hors de audio_lock : le thread du décodeur peut être en train d'analyser sa dernière fenêtre
+        with self.audio_lock:
+            self.audio.reset()
+            self.voice_activity.reset()
+            self.unexpected_voice_counter = 0
+            self.last_voice_result = (False, "Aucune activité vocale.")
+
+    def memory_estimate(self):
+        """Estimation (octets) de la mémoire retenue par la session."""
+        size = SESSION_BASE_MEMORY_BYTES + self.audio.memory_estimate()
+        if self.detectors is not None:
+            size += DETECTOR_MEMORY_BYTES
+        return size
+
+    def close(self):
+        """
+        Libère les ressources natives retenues par la session (détecteurs, décodeur audio).
+        Attend la fin de la frame en cours de traitement sur la session.
+        """
+        with self.lock:
+            self.closed = True
+            with self.audio_lock: # Un chunk en cours d'ingestion ne peut plus relancer de décodeur
+                self.audio.close()
+            detectors, self.detectors = self.detectors, None
+        if detectors is not None:
+            detectors.close()
+
+
+class SessionRegistry:
+    """
+    Registre des sessions d'examen actives, indexé par clé de session.
+    Les sessions sont ordonnées de la moins récemment utilisée à la plus récente ; on évince
+    celles inactives depuis `idle_timeout`, puis les plus anciennes tant que le nombre de
+    sessions ou l'estimation mémoire dépasse les limites.
+    """
+
+    def __init__(self, idle_timeout: float = SESSION_IDLE_TIMEOUT_S, max_sessions: int = MAX_SESSIONS,
+                 max_memory_mb: float = MAX_SESSIONS_MEMORY_MB):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self._sessions = OrderedDict() # Dict: {session_key: ExamSession}
+        self._lock = threading.Lock()
+        self.evicted_count = 0
+
+    def get(self, student_id: str, exam_id: str = None):
+        """
+        Retourne la session (créée si nécessaire) et la marque comme la plus récemment utilisée.
+        :return: ExamSession
+        """
+        key = session_key(student_id, exam_id)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = ExamSession(student_id, exam_id)
+                self._sessions[key] = session
+            else:
+                self._sessions.move_to_end(key)
+            session.touch()
+            evicted = self._collect_evictions(keep=key)
+        self._close_all(evicted)
+        return session
+
+    def peek(self, student_id: str, exam_id: str = None):
+        """Retourne la session si elle existe, sans la créer ni la rafraîchir."""
+        with self._lock:
+            return self._sessions.get(session_key(student_id, exam_id))
+
+    def remove(self, student_id: str, exam_id: str = None):
+        """
+        Termine une session et libère ses ressources.
+        :return: True si une session a été supprimée.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_key(student_id, exam_id), None)
+        if session is None:
+            return False
+        self._close_all([session])
+        return True
+
+    def evict_idle(self):
+        """
+        Évince les sessions inactives et applique les limites de taille.
+        :return: Nombre de sessions évincées.
+        """
+        with self._lock:
+            evicted = self._collect_evictions()
+        self._close_all(evicted)
+        return len(evicted)
+
+    def clear(self):
+        """Termine toutes les sessions."""
+        with self._lock:
+            evicted = list(self._sessions.values())
+            self._sessions.clear()
+        self._close_all(evicted)
+
+    def stats(self):
+        """Statistiques du registre (pour supervision)."""
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "memory_estimate_mb": sum(s.memory_estimate() for s in self._sessions.values()) / (1024 * 1024),
+                "evicted_sessions": self.evicted_count,
+                "max_sessions": self.max_sessions,
+                "max_memory_mb": self.max_memory_bytes / (1024 * 1024),
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _collect_evictions(self, keep: str = None):
+        # Doit être appelé sous self._lock. Les sessions retournées sont fermées hors du verrou.
+        evicted = []
+        now = time.monotonic()
+        for key, session in list(self._sessions.items()):
+            if key != keep and now - session.last_seen > self.idle_timeout:
+                evicted.append(self._sessions.pop(key))
+
+        memory = sum(s.memory_estimate() for s in self._sessions.values())
+        while self._sessions and (len(self._sessions) > self.max_sessions or memory > self.max_memory_bytes):
+            oldest_key = next(iter(self._sessions))
+            if oldest_key == keep:
+                break
+            session = self._sessions.pop(oldest_key)
+            memory -= session.memory_estimate()
+            evicted.append(session)
+
+        self.evicted_count += len(evicted)
+        return evicted
+
+    def _close_all(self, sessions):
+        for session in sessions:
+            try:
+                session.close()
+            except Exception as e:
+                print(f"AVERTISSEMENT: Erreur lors de la libération de la session {session.key}: {e}")
@@ -0,0 +1,145 @@
+# models/text_batch.py
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# --- Paramètres de l'Analyse Textuelle par Lots ---
+TEXT_BATCH_WORKERS = int(os.environ.get('SIPA_TEXT_BATCH_WORKERS', os.cpu_count() or 1)) # Processus d'analyse
+BATCH_IN_FLIGHT_PER_WORKER = 4 # Documents soumis à l'avance par processus (lecture d'un flux en mémoire bornée)
+
+
+def _init_worker(database: str = None):
+    from models import text_detection # Chargement des index, une fois par processus
+    if database is not None:
+        text_detection.result_cache.attach_database(database)
+
+
+def _analyze_document(text: str, student_id: str):
+    from models import text_detection
+    return text_detection.analyze_text(text, student_id)
+
+
+def _validation_error(document):
+    if not isinstance(document, dict):
+        return "Document invalide (objet JSON attendu)."
+    if not isinstance(document.get('text'), str) or not document['text'].strip():
+        return "No text content provided."
+    return None
+
+
+class BatchProgress:
+    """Avancement d'un lot : documents soumis, terminés, en erreur, servis par le cache, et débit."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.cached = 0
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "errors": self.errors,
+            "cached": self.cached,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_s": round(self.completed / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+class TextBatchPool:
+    """
+    Analyse de lots de soumissions sur un pool de processus (un par cœur par défaut), créé au
+    premier lot. Chaque processus ouvre les index de plagiat (partagés sur disque) et le cache de
+    résultats. Les documents sont lus au fil de l'eau et les résultats rendus dans l'ordre où ils
+    se terminent ; seuls BATCH_IN_FLIGHT_PER_WORKER documents par processus sont en attente à la
+    fois, un lot arbitrairement long tient donc en mémoire bornée.
+    """
+
+    def __init__(self, workers: int = TEXT_BATCH_WORKERS, database: str = None):
+        self.workers = max(1, workers)
+        self.database = database
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # "spawn" : pas de fork d'un serveur multi-thread (verrous des index copiés dans un état incohérent)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.database,)
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def analyze(self, documents, progress: BatchProgress = None):
+        """
+        Analyse un itérable de documents {id, student_id, text}.
+        :return: Générateur de dicts {index, id, student_id, analysis} (ou {index, id, student_id, error}),
+                 dans l'ordre de fin d'analyse ; `index` est la position du document dans le lot.
+        """
+        progress = progress or BatchProgress()
+        executor = self._get_executor()
+        documents = enumerate(documents)
+        pending = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < self.workers * BATCH_IN_FLIGHT_PER_WORKER:
+                    try:
+                        index, document = next(documents)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    progress.submitted += 1
+                    error = _validation_error(document)
+                    if error is not None:
+                        progress.errors += 1
+                        yield {"index": index, "id": document.get('id') if isinstance(document, dict) else None,
+                               "student_id": None, "error": error}
+                        continue
+                    student_id = document.get('student_id', 'unknown')
+                    future = executor.submit(_analyze_document, document['text'], student_id)
+                    pending[future] = (index, document.get('id'), student_id, executor)
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, document_id, student_id, submitted_to = pending.pop(future)
+                    item = {"index": index, "id": document_id, "student_id": student_id}
+                    try:
+                        item["analysis"] = future.result()
+                        progress.completed += 1
+                        progress.cached += item["analysis"]["cached"]
+                    except BrokenProcessPool as e:
+                        print(f"AVERTISSEMENT: Un processus d'analyse textuelle s'est arrêté: {e}")
+                        self._discard_executor(submitted_to)
+                        executor = self._get_executor()
+                        progress.errors += 1
+                        item["error"] = "Processus d'analyse interrompu."
+                    except Exception as e:
+                        progress.errors += 1
+                        item["error"] = str(e)
+                    yield item
+        finally:
+            # Lot abandonné (client déconnecté) : les documents pas encore commencés sont annulés
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
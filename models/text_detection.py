@@ -1,41 +1,206 @@
 # models/text_detection.py
-import random
+import base64
 import re
 
-def detect_plagiarism(text: str):
+import numpy as np
+
+from models.passage_index import PASSAGE_MAX_REPORTED, PassageIndex
+from models.phrase_matcher import PhraseMatcher
+from models.plagiarism_index import PLAGIARISM_TOP_K, PlagiarismIndex, TextFingerprint, ngram_hashes
+from models.result_cache import ResultCache, content_key
+from models.text_normalization import normalize_submission, tokenize
+
+# Index des soumissions passées (persistants, partagés par les processus du serveur) :
+# signatures MinHash (similarité globale) et n-grammes (passages recopiés)
+plagiarism_index = PlagiarismIndex()
+passage_index = PassageIndex()
+PASSAGE_EXCERPT_CHARS = 80 # Longueur de l'extrait cité dans les drapeaux
+
+# Formules types des modèles de langage (fichier rechargé automatiquement quand il change)
+phrase_matcher = PhraseMatcher()
+AI_PHRASE_SCORE = 0.7 # Score d'une formule ; chaque formule distincte supplémentaire réduit l'écart restant de 70 %
+
+# Cache des résultats d'analyse (clé : texte normalisé + auteur ; version : algorithmes et formules)
+result_cache = ResultCache()
+TEXT_ANALYSIS_VERSION = 3 # À incrémenter quand le calcul des scores ou le contenu du cache change (invalide les résultats en cache)
+
+class TextFeatures:
+    """
+    Empreintes d'une soumission pour la recherche de plagiat : signature MinHash, hashes des
+    n-grammes et, une fois indexée, son identifiant de document. Elles sont conservées avec le
+    résultat en cache, dont la mise à jour ne relit ainsi pas le texte.
+    """
+
+    def __init__(self, fingerprint: TextFingerprint, hashes: np.ndarray, tokens: list = None, spans: list = None,
+                 document_id: int = None):
+        self.fingerprint = fingerprint
+        self.hashes = hashes
+        self.tokens = tokens # Mots normalisés et leurs positions : non conservés en cache (positions recalculées à la demande)
+        self.spans = spans
+        self.document_id = document_id
+
+    @classmethod
+    def from_text(cls, text: str):
+        tokens, spans = tokenize(text)
+        hashes = ngram_hashes(tokens, passage_index.ngram_words) if len(tokens) >= passage_index.ngram_words else np.zeros(0, dtype=np.uint64)
+        return cls(plagiarism_index.featurize(text, tokens), hashes, tokens, spans)
+
+    @classmethod
+    def from_cache(cls, entry: dict):
+        fingerprint = TextFingerprint(entry["text_hash"], np.frombuffer(base64.b64decode(entry["signature"]), dtype=np.uint32),
+                                      entry["word_count"])
+        return cls(fingerprint, np.frombuffer(base64.b64decode(entry["ngram_hashes"]), dtype=np.uint64),
+                   document_id=entry["document_id"])
+
+    def to_cache(self):
+        return {
+            "text_hash": self.fingerprint.text_hash,
+            "signature": base64.b64encode(self.fingerprint.signature.astype(np.uint32).tobytes()).decode('ascii'),
+            "word_count": self.fingerprint.word_count,
+            "ngram_hashes": base64.b64encode(self.hashes.astype(np.uint64).tobytes()).decode('ascii'),
+            "document_id": self.document_id,
+        }
+
+def detect_plagiarism(text: str, student_id: str = None, index_submission: bool = True, since: dict = None,
+                      features: TextFeatures = None):
     """
-    Simule la détection de plagiat sémantique.
-    Pour MVP, simule un score et quelques drapeaux basés sur la longueur ou des mots-clés.
+    Détection de plagiat par similarité avec les soumissions passées : similarité globale
+    (MinHash / LSH, voir models/plagiarism_index.py) et passages recopiés (index des n-grammes,
+    voir models/passage_index.py). Le score est le plus grand de la similarité de Jaccard estimée
+    avec la source la plus proche et de la part du texte couverte par des passages recopiés ;
+    les soumissions du même étudiant ne sont pas considérées comme des sources.
+    :param student_id: Auteur de la soumission.
+    :param index_submission: Si vrai, la soumission est ajoutée aux index après la recherche.
+    :param since: Résultat précédent pour ce texte (voir analyze_text) : seuls les documents indexés
+                  depuis (identifiants >= since["documents"]) sont recherchés, puis fusionnés avec ses sources et passages.
+    :param features: Empreintes du texte si elles sont déjà calculées (voir TextFeatures) ; son identifiant
+                     de document y est renseigné quand la soumission est indexée.
+    :return: Dict {score, flags, sources, passages, documents} ; `documents` est la taille de l'index au moment de la recherche.
     """
-    score = random.uniform(0.0, 0.9) # Score de plagiat simulé
-    flags = []
+    features = TextFeatures.from_text(text) if features is None else features
+    plagiarism_index.refresh()
+    documents = len(plagiarism_index) # Relevé avant la recherche : un document ajouté pendant sera revu à la mise à jour suivante
+    since_document = since["documents"] if since else 0
+    # La soumission elle-même, indexée lors de la première analyse, n'est pas une source
+    own_submission = {features.document_id} if features.document_id is not None else set()
+    sources = plagiarism_index.query(features.fingerprint, exclude_student_id=student_id, min_document_id=since_document,
+                                     exclude_documents=own_submission)
+    own_documents = own_submission | (plagiarism_index.documents_of(student_id) if student_id is not None else set())
+    passages = passage_index.query_hashes(features.hashes, own_documents, min_document_id=since_document)
+    if passages and features.spans is None:
+        features.spans = tokenize(text)[1]
+    passages = [_describe_passage(text, features.spans, passage) for passage in passages]
+    if index_submission:
+        features.document_id = plagiarism_index.add(features.fingerprint, student_id)
+        passage_index.add(features.document_id, features.tokens, features.hashes)
 
-    if len(text) > 200 and random.random() < 0.3: # Simulation: 30% de chance d'un long texte plagié
-        flags.append("Longue section avec forte similarité conceptuelle détectée.")
-        score = max(score, random.uniform(0.5, 0.95))
+    if since:
+        seen_sources = {source["document_id"] for source in sources}
+        sources = sorted(sources + [s for s in since["sources"] if s["document_id"] not in seen_sources],
+                         key=lambda source: -source["similarity"])[:PLAGIARISM_TOP_K]
+        seen_passages = {(p["document_id"], p["start"], p["source_start"]) for p in passages}
+        passages = sorted(passages + [p for p in since["passages"] if (p["document_id"], p["start"], p["source_start"]) not in seen_passages],
+                          key=lambda passage: -passage["words"])[:PASSAGE_MAX_REPORTED]
+
+    score = sources[0]["similarity"] if sources else 0.0
+    if passages:
+        covered = np.zeros(features.fingerprint.word_count, dtype=bool)
+        for passage in passages:
+            covered[passage["start"]:passage["end"]] = True
+        score = max(score, float(covered.mean()))
+    flags = [
+        f"Similarité estimée de {source['similarity']:.0%} avec une soumission antérieure (document {source['document_id']})."
+        for source in sources
+    ]
+    flags += [
+        f"Passage de {passage['words']} mots identique au document {passage['document_id']} "
+        f"(caractères {passage['start_char']}-{passage['end_char']}) : « {passage['excerpt']} »"
+        for passage in passages
+    ]
     if re.search(r'\b(copy|paste|source externe)\b', text, re.IGNORECASE):
         flags.append("Mots-clés suspects de plagiat trouvés.")
-        score = max(score, random.uniform(0.6, 0.8))
 
-    return {"score": score, "flags": flags}
+    return {"score": score, "flags": flags, "sources": sources, "passages": passages, "documents": documents}
+
+def _describe_passage(text: str, spans: list, passage: dict):
+    """Complète un passage (positions en mots) avec ses positions en caractères, un extrait et l'auteur de la source."""
+    start_char, end_char = spans[passage["start"]][0], spans[passage["end"] - 1][1]
+    excerpt = text[start_char:end_char]
+    if len(excerpt) > PASSAGE_EXCERPT_CHARS:
+        excerpt = excerpt[:PASSAGE_EXCERPT_CHARS].rstrip() + "…"
+    source = plagiarism_index.document(passage["document_id"])
+    return dict(passage, start_char=start_char, end_char=end_char, excerpt=excerpt,
+                source_student_id=source["student_id"] if source else None)
 
 def detect_ai_content(text: str):
     """
-    Simule la détection de contenu généré par IA.
-    Pour MVP, simule un score basé sur la présence de phrases types d'IA.
+    Détection de contenu généré par IA par recherche des formules types des modèles de langage
+    (fichier de formules, voir models/phrase_matcher.py), en un seul passage sur le texte.
+    Le score croît avec le nombre de formules distinctes trouvées.
+    :return: Dict {score, matches} où matches liste chaque occurrence {phrase, start, end}.
     """
-    score = random.uniform(0.0, 0.9) # Score IA simulé
-    ai_phrases = [
-        "En tant que grand modèle linguistique",
-        "Je suis un modèle de langage entraîné par Google",
-        "Je n'ai pas d'expériences personnelles",
-        "Mon objectif est de vous aider",
-        "Je suis un programme informatique"
-    ]
+    matches = phrase_matcher.matches(text)
+    distinct = len({match["phrase"] for match in matches})
+    score = 1.0 - (1.0 - AI_PHRASE_SCORE) ** distinct
+    return {"score": score, "matches": matches}
+
+def analysis_version():
+    """
+    Version des algorithmes et du fichier de formules types : un résultat en cache d'une autre
+    version est recalculé entièrement. Les documents indexés depuis un résultat ne l'invalident
+    pas (voir analyze_text).
+    """
+    return f"{TEXT_ANALYSIS_VERSION}:{phrase_matcher.version}"
+
+def _alert_level(plagiarism_score: float, ai_score: float):
+    """Niveau d'alerte global pour le log."""
+    if plagiarism_score > 0.7 or ai_score > 0.7:
+        return 'high'
+    if plagiarism_score > 0.4 or ai_score > 0.4:
+        return 'medium'
+    return 'low'
 
-    for phrase in ai_phrases:
-        if phrase.lower() in text.lower():
-            score = max(score, random.uniform(0.7, 0.99)) # Score élevé si phrase IA détectée
-            break
+def _text_result(plagiarism_result: dict, ai_content_result: dict):
+    return {
+        "plagiarism": plagiarism_result,
+        "ai_content": ai_content_result,
+        "alert_level": _alert_level(plagiarism_result['score'], ai_content_result['score']),
+        "message": f"Détection textuelle: Plagiat={plagiarism_result['score']:.2f}, IA={ai_content_result['score']:.2f}",
+    }
+
+def analyze_text(text: str, student_id: str = None, use_cache: bool = True):
+    """
+    Analyse complète d'une soumission (plagiat et contenu IA) et niveau d'alerte.
+    Un texte déjà analysé pour le même étudiant est servi par le cache : si des documents ont été
+    indexés depuis, seuls ceux-ci sont recherchés, à partir des empreintes conservées avec le résultat,
+    et le résultat en cache est complété (la soumission, déjà indexée, ne l'est pas à nouveau) ; le
+    contenu IA est repris tel quel.
+    :return: Dict {plagiarism, ai_content, alert_level, message, cached, updated} ; `updated` est vrai si
+             un résultat en cache a changé depuis son dernier enregistrement (nouvelles sources).
+    """
+    text = normalize_submission(text)
+    key = content_key(text, student_id)
+    version = analysis_version()
+    if use_cache:
+        cached = result_cache.get(key, version)
+        if cached is not None:
+            features = TextFeatures.from_cache(cached.pop("features"))
+            updated = False
+            plagiarism_index.refresh()
+            if len(plagiarism_index) > cached["plagiarism"]["documents"]:
+                plagiarism_result = detect_plagiarism(text, student_id, index_submission=False, since=cached["plagiarism"],
+                                                      features=features)
+                updated = plagiarism_result["flags"] != cached["plagiarism"]["flags"]
+                cached = _text_result(plagiarism_result, cached["ai_content"])
+                result_cache.put(key, version, dict(cached, features=features.to_cache()))
+            cached["cached"] = True
+            cached["updated"] = updated
+            return cached
 
-    return {"score": score}
\ No newline at end of file
+    features = TextFeatures.from_text(text)
+    result = _text_result(detect_plagiarism(text, student_id, features=features), detect_ai_content(text))
+    if use_cache:
+        result_cache.put(key, version, dict(result, features=features.to_cache()))
+    result["cached"] = False
+    result["updated"] = False
+    return result
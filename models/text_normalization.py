@@ -0,0 +1,71 @@
+# models/text_normalization.py
+import re
+import unicodedata
+from functools import lru_cache
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def fold_text(text: str):
+    """
+    Forme normalisée d'un texte pour les comparaisons : décomposition Unicode (NFKD), accents
+    supprimés et casse repliée ("Élève" -> "eleve", "ﬁn" -> "fin").
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: str):
+    """
+    Mots normalisés d'un texte et leur position dans le texte d'origine.
+    :return: (liste des mots normalisés, liste des (début, fin) en caractères du texte d'origine).
+    """
+    words, spans = [], []
+    for match in WORD_PATTERN.finditer(text):
+        words.append(fold_text(match.group()))
+        spans.append(match.span())
+    return words, spans
+
+
+def words(text: str):
+    """Mots normalisés d'un texte (voir fold_text)."""
+    return WORD_PATTERN.findall(fold_text(text))
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(char: str):
+    """Caractère normalisé (voir fold_text), les caractères hors lettres/chiffres devenant des espaces."""
+    return ''.join(c if c.isalnum() else ' ' for c in fold_text(char))
+
+
+def iter_normalized_chars(text: str):
+    """
+    Parcourt un texte normalisé caractère par caractère : accents supprimés, casse repliée,
+    ponctuation et espaces consécutifs réduits à une seule espace, avec une espace de début et de
+    fin (bornes de mots). Chaque caractère produit est accompagné de sa position dans le texte d'origine.
+    :return: Générateur de (caractère normalisé, position d'origine).
+    """
+    previous = ' '
+    yield ' ', 0
+    for position, char in enumerate(text):
+        for folded in _fold_char(char):
+            if folded == ' ' and previous == ' ':
+                continue
+            previous = folded
+            yield folded, position
+    if previous != ' ':
+        yield ' ', len(text)
+
+
+def normalize_phrase(text: str):
+    """Forme normalisée d'une phrase, identique à celle produite par iter_normalized_chars (sans les positions)."""
+    return ''.join(char for char, _ in iter_normalized_chars(text))
+
+
+def normalize_submission(text: str):
+    """
+    Forme canonique d'une soumission avant analyse : composition Unicode (NFC), fins de ligne
+    unifiées et espaces de début et de fin retirés. Deux envois qui ne diffèrent que par ces
+    détails donnent le même texte (et les mêmes positions dans les résultats).
+    """
+    return unicodedata.normalize('NFC', text.replace('\r\n', '\n').replace('\r', '\n')).strip()
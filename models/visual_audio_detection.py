@@ -3,191 +3,387 @@ import cv2
 import numpy as np
 import face_recognition
 import mediapipe as mp
-from ultralytics import YOLO
 import os
-import math
+import functools
 import random
+import threading
+import time
 import speech_recognition as sr
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 # import pyaudio # Nécessaire pour sr.Microphone, mais pas directement importé ici pour éviter les erreurs d'installation
 
+from models.inference_scheduler import BatchInferenceScheduler, SchedulerOverloaded
+from models.load_shedding import AdmissionController, GUARANTEED_CHECK_INTERVAL_S
+from models.capture_pacing import pacing_hints, PACING_CALM_AFTER_S
+from models.detector_scheduling import DETECTOR_SCHEDULE
+from models.face_search import CohortFaceIndex
+from models.face_store import FaceEncodingStore
+from models.frame_preparation import PreparedFrame
+from models.head_pose import (HEAD_PITCH_THRESHOLD, HEAD_ROLL_THRESHOLD, HEAD_YAW_THRESHOLD,
+                              landmarks_to_image_points, rotation_matrices_to_euler, solve_head_pose)
+from models.object_detection import create_object_detector
+from models.session_state import SessionRegistry
+from models.voice_activity import VAD_SAMPLE_RATE, pcm_to_float
+
 # --- Initialisation des Modules IA ---
 mp_face_mesh = mp.solutions.face_mesh
 mp_face_detection = mp.solutions.face_detection
 mp_drawing = mp.solutions.drawing_utils
 
-# Charger un modèle YOLOv8 pré-entraîné pour la détection d'objets
-try:
-    yolo_model = YOLO('yolov8n.pt')
-    print("Modèle YOLOv8 chargé avec succès pour la détection d'objets.")
-except Exception as e:
-    print(f"AVERTISSEMENT: Erreur lors du chargement du modèle YOLOv8: {e}. La détection d'objets sera limitée.")
-    yolo_model = None
-
-# --- Variables Globales pour le Suivi d'État (simulent un état persistant pour un flux) ---
-# Ces variables sont nécessaires pour que les fonctions puissent suivre l'état entre les appels de frame.
-# Dans une application réelle (Flask/FastAPI), elles seraient gérées par une session ou un état de service.
-
-# Visuel
-_last_head_pose = None
-_abnormal_movement_counter = 0
+# --- Variables Globales ---
+# L'état de suivi entre frames (compteurs, pose précédente, détecteurs) est porté par une
+# ExamSession par étudiant/examen, voir `sessions` plus bas. Seules les ressources réellement
+# partagées par le processus restent globales.
 
 # Audio
 _recognizer = sr.Recognizer()
 _audio_source = None # Sera initialisé avec sr.Microphone
-_unexpected_voice_counter = 0
 
 # --- Paramètres de Détection ---
 # Visuel
-HEAD_PITCH_THRESHOLD = 20 # Degrés (haut/bas)
-HEAD_YAW_THRESHOLD = 20   # Degrés (gauche/droite)
-HEAD_ROLL_THRESHOLD = 15  # Degrés (inclinaison latérale)
 CONSECUTIVE_FRAMES_THRESHOLD = 5 # Nombre de frames consécutives pour confirmer un mouvement anormal
+FACE_MATCH_TOLERANCE = 0.6 # Distance maximale entre encodages pour considérer que c'est la même personne
+FACE_MESH_ROI_MARGIN = 0.5 # Marge ajoutée autour de la boîte du visage (fraction de sa taille) pour le ROI FaceMesh
+FACE_MESH_ROI_INNER_MARGIN = 0.1 # Le ROI ne bouge que si le visage s'approche de son bord à moins de cette fraction de sa taille
+FACE_MESH_ROI_MAX_SCALE_CHANGE = 0.25 # ... ou si la taille du visage varie de plus de cette fraction
 
 TARGET_OBJECTS_YOLO = ['cell phone', 'book', 'laptop'] # Classes d'objets à surveiller avec YOLOv8
 
+# Détecteur d'objets YOLOv8 pré-entraîné, avec le moteur d'inférence configuré
+# (SIPA_OBJECT_BACKEND : ultralytics, onnx ou openvino ; voir models/object_detection.py).
+# Chargé au premier usage : les processus qui importent ce module sans analyser de frames
+# (analyse textuelle par lots, serveur web devant des processus d'inférence) ne le chargent pas.
+object_detector = None
+_object_detector_loaded = False
+_object_detector_lock = threading.Lock()
+
+def get_object_detector():
+    """:return: Le détecteur d'objets partagé (chargé au premier appel), ou None si aucun moteur n'est disponible."""
+    global object_detector, _object_detector_loaded
+    if not _object_detector_loaded:
+        with _object_detector_lock:
+            if not _object_detector_loaded:
+                object_detector = create_object_detector(TARGET_OBJECTS_YOLO)
+                _object_detector_loaded = True
+    return object_detector
+
+# Regroupement des frames de plusieurs sessions en lots YOLO (réglable par variables d'environnement)
+YOLO_BATCHING_ENABLED = os.environ.get('SIPA_YOLO_BATCHING', '1') != '0'
+YOLO_MAX_BATCH_SIZE = int(os.environ.get('SIPA_YOLO_MAX_BATCH', 8)) # Frames max par appel au modèle
+YOLO_MAX_WAIT_MS = float(os.environ.get('SIPA_YOLO_MAX_WAIT_MS', 10)) # Attente max pour compléter un lot
+YOLO_MAX_QUEUE_DEPTH = int(os.environ.get('SIPA_YOLO_MAX_QUEUE', 64)) # Frames max en attente
+
+# Exécution parallèle des détecteurs d'une frame (OpenCV, dlib, MediaPipe et YOLO relâchent le GIL)
+PARALLEL_DETECTORS = os.environ.get('SIPA_PARALLEL_DETECTORS', '0') == '1'
+DETECTOR_THREAD_POOL_SIZE = int(os.environ.get('SIPA_DETECTOR_THREADS', min(8, (os.cpu_count() or 1) + 2)))
+
 # Audio
 AUDIO_CHUNK_SIZE = 1024 # Taille des échantillons audio
 AUDIO_SAMPLE_RATE = 44100 # Fréquence d'échantillonnage (Hz)
 UNEXPECTED_VOICE_CONSECUTIVE_ALERTS = 3 # Nombre d'alertes consécutives pour confirmer une voix inattendue
+# Moteur de détection de voix : 'vad' (local, hors ligne, voir models/voice_activity.py) ou
+# 'google' (reconnaissance vocale dans le cloud, sur option : appel réseau à chaque chunk)
+VOICE_ENGINE = os.environ.get('SIPA_VOICE_ENGINE', 'vad')
+
+# --- Détecteurs MediaPipe et Sessions d'Examen ---
+# Les graphes FaceMesh / FaceDetection sont coûteux à construire (chargement des modèles TFLite,
+# initialisation du graphe) et FaceMesh ne peut suivre les landmarks d'une frame à l'autre que
+# si la même instance est réutilisée. Chaque ExamSession garde donc les siens en vie jusqu'à la
+# fin de l'examen ou son éviction du registre (inactivité, LRU, budget mémoire).
+
+class SessionDetectors:
+    """
+    Graphes MediaPipe associés à une session d'examen.
+    Un graphe MediaPipe n'est pas thread-safe : chaque appel à process() doit se faire sous `lock`.
+    """
 
-# --- Données d'Enrôlement Simulé pour la Reconnaissance Faciale ---
-# En réalité, ces encodages seraient chargés d'une base de données sécurisée.
-KNOWN_FACE_ENCODINGS = {} # Dict: {student_id: face_encoding}
+    def __init__(self):
+        self.face_mesh = mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1, refine_landmarks=True, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+        self.face_detector = mp_face_detection.FaceDetection(min_detection_confidence=0.7)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Libère les ressources natives des graphes."""
+        with self.lock:
+            self.face_mesh.close()
+            self.face_detector.close()
+
+# Registre des sessions d'examen actives (une par étudiant/examen)
+sessions = SessionRegistry()
+
+# Contrôle d'admission du processus : niveaux de qualité sous charge (voir models/load_shedding.py)
+admission = AdmissionController()
+
+def get_session(student_id: str, exam_id: str = None):
+    """
+    Retourne la session d'examen de l'étudiant (créée au premier appel).
+    :param student_id: ID de l'étudiant surveillé.
+    :param exam_id: ID de l'examen (optionnel, permet plusieurs examens par étudiant).
+    :return: ExamSession
+    """
+    session = sessions.get(student_id, exam_id)
+    if session.audio.on_samples is None:
+        # Les fenêtres audio sont analysées dès leur décodage, indépendamment des frames
+        session.audio.on_samples = functools.partial(_analyze_audio_windows, session)
+    return session
+
+# --- Données d'Enrôlement pour la Reconnaissance Faciale ---
+# Les encodages sont persistés sur disque (matrice memory-mappée + index, voir models/face_store.py) :
+# au démarrage seule la matrice est chargée, et seules les images nouvelles ou modifiées sont encodées.
+face_store = FaceEncodingStore()
+# Recherche 1:N dans toute la cohorte enrôlée (détection d'usurpation par un autre étudiant)
+cohort_index = CohortFaceIndex(face_store)
 
 def load_known_faces(known_faces_data: dict):
     """
-    Charge les encodages faciaux connus (simulés) dans la mémoire.
+    Enrôle les visages connus dans le stockage des encodages.
     known_faces_data: un dictionnaire où les clés sont les student_id et les valeurs sont les chemins d'image.
     """
+    face_store.refresh()
+    enrollments = [] # Encodages nouveaux ou modifiés, enregistrés en une seule écriture de l'index
     for student_id, image_path in known_faces_data.items():
         try:
+            if face_store.is_current(student_id, image_path):
+                continue # Encodage déjà à jour pour cette image
             image = face_recognition.load_image_file(image_path)
             face_encodings = face_recognition.face_encodings(image)
             if face_encodings:
-                KNOWN_FACE_ENCODINGS[student_id] = face_encodings[0]
-                print(f"Visage de l'étudiant {student_id} enrôlé.")
+                enrollments.append((student_id, face_encodings[0], image_path))
             else:
                 print(f"Aucun visage détecté dans l'image d'enrôlement pour {student_id}: {image_path}")
         except FileNotFoundError:
             print(f"Erreur: Fichier d'image non trouvé à {image_path} pour {student_id}")
         except Exception as e:
             print(f"Erreur lors de l'enrôlement du visage pour {student_id}: {e}")
+    try:
+        face_store.add_many(enrollments)
+    except Exception as e:
+        print(f"Erreur lors de l'enregistrement des encodages faciaux: {e}")
+        return
+    for student_id, _, _ in enrollments:
+        print(f"Visage de l'étudiant {student_id} enrôlé.")
 
 # --- Fonctions de Détection Visuelle ---
 
-def verify_identity(frame: np.ndarray, student_id_to_verify: str):
+def localize_faces(image_rgb: np.ndarray, session, frame_size: tuple = None):
+    """
+    Étape unique de localisation des visages d'une frame (MediaPipe FaceDetection).
+    Ses boîtes alimentent la vérification d'identité, le comptage des visages et le ROI FaceMesh,
+    ce qui évite le balayage HOG de dlib et deux autres détections sur la frame entière.
+    :param image_rgb: La frame en RGB (np.array), éventuellement réduite pour la détection.
+    :param session: ExamSession dont le graphe FaceDetection est réutilisé.
+    :param frame_size: (largeur, hauteur) de la frame dans laquelle exprimer les boîtes, si
+                       image_rgb en est une copie réduite (les boîtes de MediaPipe sont relatives).
+    :return: Liste de boîtes (top, right, bottom, left) en pixels, la plus grande (visage principal) en premier.
+    """
+    detectors = session.get_detectors(SessionDetectors)
+    with detectors.lock:
+        results = detectors.face_detector.process(image_rgb)
+
+    w, h = frame_size if frame_size is not None else (image_rgb.shape[1], image_rgb.shape[0])
+    face_boxes = []
+    for detection in results.detections or []:
+        bbox = detection.location_data.relative_bounding_box
+        left = max(0, int(bbox.xmin * w))
+        top = max(0, int(bbox.ymin * h))
+        right = min(w, int((bbox.xmin + bbox.width) * w))
+        bottom = min(h, int((bbox.ymin + bbox.height) * h))
+        if right > left and bottom > top:
+            face_boxes.append((top, right, bottom, left))
+
+    face_boxes.sort(key=lambda box: (box[2] - box[0]) * (box[1] - box[3]), reverse=True)
+    return face_boxes
+
+def encode_primary_face(frame: np.ndarray, face_locations: list = None):
+    """
+    Encode le visage principal du cadre.
+    :param frame: Le cadre de l'image (np.array, RGB).
+    :param face_locations: Boîtes issues de localize_faces (visage principal en premier). Si None,
+                           les visages sont recherchés avec le détecteur HOG de dlib (plus lent).
+    :return: Encodage (np.array de 128 valeurs), ou None si aucun visage n'est trouvé.
+    """
+    if face_locations is None:
+        face_locations = face_recognition.face_locations(frame)
+    # Seul le visage principal est encodé : l'encodage dlib est la partie coûteuse
+    face_encodings = face_recognition.face_encodings(frame, face_locations[:1]) if face_locations else []
+    return face_encodings[0] if face_encodings else None
+
+def verify_identity(frame: np.ndarray, student_id_to_verify: str, face_locations: list = None, face_encoding: np.ndarray = None):
     """
     Vérifie l'identité de la personne dans le cadre par rapport à un ID étudiant.
-    :param frame: Le cadre de l'image (np.array).
+    :param frame: Le cadre de l'image (np.array, RGB).
     :param student_id_to_verify: L'ID de l'étudiant à vérifier.
+    :param face_locations: Boîtes issues de localize_faces (visage principal en premier). Si None,
+                           les visages sont recherchés avec le détecteur HOG de dlib (plus lent).
+    :param face_encoding: Encodage du visage principal s'il est déjà calculé (voir encode_primary_face).
     :return: (est_verifie: bool, score_confiance: float, message: str)
     """
-    known_encoding = KNOWN_FACE_ENCODINGS.get(student_id_to_verify)
+    known_encoding = face_store.get(student_id_to_verify)
     if known_encoding is None:
         return False, 0.0, f"ID étudiant '{student_id_to_verify}' non enrôlé."
 
-    face_locations = face_recognition.face_locations(frame)
-    face_encodings = face_recognition.face_encodings(frame, face_locations)
-
-    if not face_encodings:
+    current_face_encoding = face_encoding if face_encoding is not None else encode_primary_face(frame, face_locations)
+    if current_face_encoding is None:
         return False, 0.0, "Aucun visage détecté pour vérification."
 
-    # Pour MVP, on vérifie le premier visage détecté
-    current_face_encoding = face_encodings[0]
-
-    matches = face_recognition.compare_faces([known_encoding], current_face_encoding, tolerance=0.6)
-    face_distance = face_recognition.face_distance([known_encoding], current_face_encoding)[0]
+    face_distance = float(np.linalg.norm(known_encoding - current_face_encoding))
     confidence_score = 1.0 - face_distance
 
-    if matches[0]:
+    if face_distance <= FACE_MATCH_TOLERANCE:
         return True, confidence_score, f"Identité confirmée pour {student_id_to_verify}."
     else:
         return False, confidence_score, "Identité non confirmée."
 
+def search_cohort(face_encoding: np.ndarray, exclude_student_id: str = None, k: int = None):
+    """
+    Recherche 1:N : identités enrôlées les plus proches d'un encodage facial.
+    :param face_encoding: Encodage du visage (voir encode_primary_face).
+    :param exclude_student_id: Étudiant à exclure (celui qui est censé passer l'examen).
+    :param k: Nombre de résultats (FACE_SEARCH_TOP_K par défaut).
+    :return: Liste de dicts {student_id, distance, match}, par distance croissante ; `match` est vrai
+             si la distance est sous le seuil de correspondance.
+    """
+    return [
+        {"student_id": student_id, "distance": distance, "match": distance <= FACE_MATCH_TOLERANCE}
+        for student_id, distance in cohort_index.search(face_encoding, k=k, exclude=exclude_student_id)
+    ]
+
+def verify_identity_tracked(frame: np.ndarray, student_id_to_verify: str, session, face_boxes: list):
+    """
+    Vérification d'identité avec cache par piste : le visage n'est ré-encodé que si le suivi de la
+    session l'exige (piste perdue, saut de boîte, changement du nombre de visages, intervalle écoulé).
+    Quand la vérification échoue, le visage est recherché dans toute la cohorte enrôlée pour
+    savoir s'il appartient à un autre étudiant.
+    :param frame: Le cadre de l'image (np.array, RGB).
+    :param student_id_to_verify: L'ID de l'étudiant à vérifier.
+    :param session: ExamSession portant l'IdentityTracker.
+    :param face_boxes: Boîtes issues de localize_faces pour cette frame.
+    :return: (est_verifie: bool, score_confiance: float, message: str, depuis_cache: bool,
+              candidats_usurpation: list)
+    """
+    tracker = session.identity
+    if tracker.reverify_reason(face_boxes) is None:
+        return (*tracker.cached_result(), True, tracker.impersonation_candidates)
+
+    face_encoding = encode_primary_face(frame, face_boxes)
+    result = verify_identity(frame, student_id_to_verify, face_boxes, face_encoding)
+    candidates = []
+    if not result[0] and face_encoding is not None:
+        candidates = search_cohort(face_encoding, exclude_student_id=student_id_to_verify)
+        if candidates and candidates[0]["match"]:
+            is_verified, score, message = result
+            result = (is_verified, score, f"{message} Visage correspondant à l'étudiant {candidates[0]['student_id']}.")
+    tracker.record(result, candidates)
+    return (*result, False, candidates)
+
 def get_head_pose(face_landmarks, image_width, image_height):
     """
-    Estime la pose de la tête (pitch, yaw, roll) à partir des landmarks du visage.
+    Estime la pose de la tête (pitch, yaw, roll) à partir des landmarks du visage, sans suivi
+    (voir HeadPoseTracker pour l'estimation frame à frame d'une session).
     :param face_landmarks: Objets landmarks de MediaPipe.
     :param image_width: Largeur de l'image.
     :param image_height: Hauteur de l'image.
     :return: (pitch, yaw, roll) en degrés.
     """
-    image_points = np.array([
-        (face_landmarks.landmark[1].x * image_width, face_landmarks.landmark[1].y * image_height),
-        (face_landmarks.landmark[33].x * image_width, face_landmarks.landmark[33].y * image_height),
-        (face_landmarks.landmark[263].x * image_width, face_landmarks.landmark[263].y * image_height),
-        (face_landmarks.landmark[61].x * image_width, face_landmarks.landmark[61].y * image_height),
-        (face_landmarks.landmark[291].x * image_width, face_landmarks.landmark[291].y * image_height),
-        (face_landmarks.landmark[199].x * image_width, face_landmarks.landmark[199].y * image_height)
-    ], dtype="double")
-
-    model_points = np.array([
-        (0.0, 0.0, 0.0),
-        (-225.0, 170.0, -135.0),
-        (225.0, 170.0, -135.0),
-        (-150.0, -150.0, -125.0),
-        (150.0, -150.0, -125.0),
-        (0.0, -330.0, -65.0)
-    ])
-
-    focal_length = image_width
-    center = (image_width/2, image_height/2)
-    camera_matrix = np.array([
-        [focal_length, 0, center[0]],
-        [0, focal_length, center[1]],
-        [0, 0, 1]
-    ], dtype="double")
-
-    dist_coeffs = np.zeros((4,1))
-
-    (success, rotation_vector, translation_vector) = cv2.solvePnP(model_points, image_points, camera_matrix, dist_coeffs, flags=cv2.SOLVEPNP_ITERATIVE)
-
+    image_points = landmarks_to_image_points(face_landmarks, image_width, image_height)
+    success, rotation_vector, translation_vector = solve_head_pose(image_points, image_width, image_height)
     rmat, jac = cv2.Rodrigues(rotation_vector)
+    pitch, yaw, roll = rotation_matrices_to_euler(rmat[None])[0]
+    return float(pitch), float(yaw), float(roll)
 
-    sy = math.sqrt(rmat[0,0] * rmat[0,0] + rmat[1,0] * rmat[1,0])
-    singular = sy < 1e-6
+_Landmark = namedtuple('_Landmark', ['x', 'y'])
 
-    if not singular:
-        x = math.atan2(rmat[2,1], rmat[2,2])
-        y = math.atan2(-rmat[2,0], sy)
-        z = math.atan2(rmat[1,0], rmat[0,0])
-    else:
-        x = math.atan2(-rmat[1,2], rmat[1,1])
-        y = math.atan2(-rmat[2,0], sy)
-        z = 0
+class _RoiLandmarks:
+    """
+    Landmarks FaceMesh calculés sur un ROI, ramenés en coordonnées normalisées de la frame entière
+    (même interface `.landmark[i].x/.y` que les résultats MediaPipe, pour get_head_pose).
+    """
 
-    pitch = math.degrees(x)
-    yaw = math.degrees(y)
-    roll = math.degrees(z)
+    def __init__(self, face_landmarks, x0, y0, roi_width, roi_height, image_width, image_height):
+        self.landmark = [
+            _Landmark((lm.x * roi_width + x0) / image_width, (lm.y * roi_height + y0) / image_height)
+            for lm in face_landmarks.landmark
+        ]
 
-    return pitch, yaw, roll
+def _face_roi(face_box, image_width, image_height, margin=FACE_MESH_ROI_MARGIN):
+    """Élargit une boîte (top, right, bottom, left) de `margin` et la borne à l'image. Retourne (x0, y0, x1, y1)."""
+    top, right, bottom, left = face_box
+    dx = int((right - left) * margin)
+    dy = int((bottom - top) * margin)
+    return max(0, left - dx), max(0, top - dy), min(image_width, right + dx), min(image_height, bottom + dy)
 
-def analyze_head_movement(frame: np.ndarray):
+def _stable_face_roi(session, face_box, image_width, image_height):
+    """
+    ROI FaceMesh de la session, stabilisé : il n'est recalculé (voir _face_roi) que si le visage
+    sort de sa zone intérieure ou change nettement de taille. Sinon l'entrée de FaceMesh reste
+    cadrée au même endroit d'une frame à l'autre et son suivi des landmarks (mode vidéo) reste valide.
+    :return: (x0, y0, x1, y1)
+    """
+    top, right, bottom, left = face_box
+    face_size = max(right - left, bottom - top, 1)
+    if session.face_mesh_roi is not None:
+        (x0, y0, x1, y1), roi_face_size = session.face_mesh_roi
+        inset = int(face_size * FACE_MESH_ROI_INNER_MARGIN)
+        # Un bord du ROI posé sur le bord de l'image ne peut pas reculer : seule l'inclusion compte de ce côté
+        inside = ((left >= x0 + inset or (x0 == 0 and left >= 0)) and (top >= y0 + inset or (y0 == 0 and top >= 0)) and
+                  (right <= x1 - inset or (x1 == image_width and right <= x1)) and
+                  (bottom <= y1 - inset or (y1 == image_height and bottom <= y1)))
+        if inside and abs(face_size - roi_face_size) <= FACE_MESH_ROI_MAX_SCALE_CHANGE * roi_face_size:
+            return x0, y0, x1, y1
+    roi = _face_roi(face_box, image_width, image_height)
+    session.face_mesh_roi = (roi, face_size)
+    return roi
+
+def analyze_head_movement(frame: np.ndarray, session, face_boxes: list = None, image_rgb: np.ndarray = None):
     """
     Analyse les mouvements de la tête pour détecter des comportements anormaux.
     :param frame: Le cadre de l'image (np.array).
+    :param session: ExamSession portant le graphe FaceMesh, le suivi de pose et le compteur.
+    :param face_boxes: Boîtes issues de localize_faces. Si fournies, FaceMesh ne traite que le ROI
+                       du visage principal ; si None, il traite la frame entière.
+    :param image_rgb: Version RGB de la frame si elle est déjà calculée.
     :return: (is_abnormal: bool, message: str, current_pose: dict)
     """
-    global _last_head_pose, _abnormal_movement_counter
+    if face_boxes is not None and not face_boxes:
+        session.abnormal_movement_counter = 0
+        session.head_pose.reset()
+        session.face_mesh_roi = None
+        return False, "Aucun visage détecté pour le suivi de la tête.", {}
+
+    if image_rgb is None:
+        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    h, w = image_rgb.shape[:2]
 
-    image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    with mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1, refine_landmarks=True, min_detection_confidence=0.5, min_tracking_confidence=0.5) as face_mesh_detector:
-        results = face_mesh_detector.process(image_rgb)
+    x0, y0, x1, y1 = (0, 0, w, h) if face_boxes is None else _stable_face_roi(session, face_boxes[0], w, h)
+    roi = np.ascontiguousarray(image_rgb[y0:y1, x0:x1])
+
+    detectors = session.get_detectors(SessionDetectors)
+    with detectors.lock:
+        results = detectors.face_mesh.process(roi)
 
     if not results.multi_face_landmarks:
-        _abnormal_movement_counter = 0
+        session.abnormal_movement_counter = 0
+        session.head_pose.reset()
+        session.face_mesh_roi = None
         return False, "Aucun visage détecté pour le suivi de la tête.", {}
 
-    face_landmarks = results.multi_face_landmarks[0]
-    h, w, _ = frame.shape
-    pitch, yaw, roll = get_head_pose(face_landmarks, w, h)
+    face_landmarks = _RoiLandmarks(results.multi_face_landmarks[0], x0, y0, x1 - x0, y1 - y0, w, h)
+    # Pose suivie (départ à chaud depuis la frame précédente) et lissée : les seuils portent sur
+    # les angles filtrés pour que le compteur reflète un vrai mouvement et non le bruit des landmarks
+    smoothed_pose, raw_pose = session.head_pose.update(landmarks_to_image_points(face_landmarks, w, h), w, h)
+    if smoothed_pose is None:
+        session.abnormal_movement_counter = 0
+        return False, "Estimation de la pose de la tête impossible.", {}
+    pitch, yaw, roll = smoothed_pose
 
-    current_head_pose = {'pitch': pitch, 'yaw': yaw, 'roll': roll}
+    current_head_pose = {'pitch': pitch, 'yaw': yaw, 'roll': roll, 'raw': dict(zip(('pitch', 'yaw', 'roll'), raw_pose))}
 
     is_abnormal = False
     message = "Mouvement normal."
 
-    if _last_head_pose:
+    if session.last_head_pose:
         if abs(yaw) > HEAD_YAW_THRESHOLD:
             is_abnormal = True
             message = f"Tête tournée sur le côté (Yaw: {yaw:.1f} deg)."
@@ -199,32 +395,32 @@ def analyze_head_movement(frame: np.ndarray):
             message = f"Tête inclinée latéralement (Roll: {roll:.1f} deg)."
 
         if is_abnormal:
-            _abnormal_movement_counter += 1
-            if _abnormal_movement_counter >= CONSECUTIVE_FRAMES_THRESHOLD:
+            session.abnormal_movement_counter += 1
+            if session.abnormal_movement_counter >= CONSECUTIVE_FRAMES_THRESHOLD:
                 message = f"ALERTE : Mouvement anormal prolongé détecté ({message})."
             else:
-                message = f"Mouvement anormal détecté ({message}). Compteur: {_abnormal_movement_counter}/{CONSECUTIVE_FRAMES_THRESHOLD}"
+                message = f"Mouvement anormal détecté ({message}). Compteur: {session.abnormal_movement_counter}/{CONSECUTIVE_FRAMES_THRESHOLD}"
         else:
-            _abnormal_movement_counter = 0
+            session.abnormal_movement_counter = 0
     else:
         message = "Initialisation du suivi de la tête."
 
-    _last_head_pose = current_head_pose
+    session.last_head_pose = current_head_pose
+    session.pose_history.append(current_head_pose)
     return is_abnormal, message, current_head_pose
 
-def detect_multiple_faces(frame: np.ndarray):
+def detect_multiple_faces(frame: np.ndarray, session, face_boxes: list = None):
     """
     Détecte la présence de plusieurs visages dans le cadre.
     :param frame: Le cadre de l'image (np.array).
+    :param session: ExamSession dont le graphe FaceDetection est réutilisé.
+    :param face_boxes: Boîtes issues de localize_faces pour cette frame (évite une nouvelle détection).
     :return: (is_multiple_faces: bool, message: str, num_faces: int)
     """
-    image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    with mp_face_detection.FaceDetection(min_detection_confidence=0.7) as face_detector:
-        results = face_detector.process(image_rgb)
+    if face_boxes is None:
+        face_boxes = localize_faces(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), session)
 
-    num_faces = 0
-    if results.detections:
-        num_faces = len(results.detections)
+    num_faces = len(face_boxes)
 
     is_multiple_faces = num_faces > 1
     message = f"{num_faces} visage(s) détecté(s)."
@@ -233,33 +429,63 @@ def detect_multiple_faces(frame: np.ndarray):
 
     return is_multiple_faces, message, num_faces
 
-def detect_specific_objects(frame: np.ndarray):
+def _yolo_infer_batch(frames: list):
+    """
+    Passe un lot de frames dans le détecteur d'objets partagé.
+    :return: Pour chaque frame, la liste des noms de classes surveillées détectées.
+    """
+    return get_object_detector().detect_batch(frames)
+
+yolo_scheduler = BatchInferenceScheduler(
+    _yolo_infer_batch,
+    max_batch_size=YOLO_MAX_BATCH_SIZE,
+    max_wait_ms=YOLO_MAX_WAIT_MS,
+    max_queue_depth=YOLO_MAX_QUEUE_DEPTH,
+    name="yolo-batch"
+)
+
+# Sans regroupement en lots, les threads des requêtes appellent le modèle l'un après l'autre (il n'est pas thread-safe)
+_direct_inference_lock = threading.Lock()
+
+def _detect_yolo_classes(frame: np.ndarray):
+    """
+    Noms des classes YOLO détectées dans la frame, via le scheduler de lots si activé (seul son
+    thread appelle alors le modèle).
+    :raises SchedulerOverloaded: Si la file du scheduler est pleine ; la frame n'est pas analysée.
+    """
+    if YOLO_BATCHING_ENABLED:
+        return yolo_scheduler.infer(frame)
+    with _direct_inference_lock:
+        return _yolo_infer_batch([frame])[0]
+
+def detect_specific_objects(frame: np.ndarray, gray: np.ndarray = None):
     """
     Détecte la présence de téléphones ou de papiers dans le cadre.
-    :param frame: Le cadre de l'image (np.array).
+    :param frame: Le cadre de l'image (np.array, BGR) à la taille d'entrée du détecteur d'objets.
+    :param gray: Version en niveaux de gris (éventuellement réduite) pour l'heuristique des feuilles ;
+                 calculée depuis `frame` si None.
     :return: (is_suspect: bool, message: str, detected_objects_list: list)
+    :raises SchedulerOverloaded: Si le détecteur d'objets est saturé (voir _detect_yolo_classes).
     """
     detected_objects = []
     is_phone_detected = False
     is_paper_detected = False
 
-    if yolo_model is not None:
-        results = yolo_model(frame, verbose=False)
-        for r in results:
-            for c in r.boxes.cls:
-                class_name = yolo_model.names[int(c)]
-                if class_name in TARGET_OBJECTS_YOLO:
-                    detected_objects.append(class_name)
-                    if class_name == 'cell phone':
-                        is_phone_detected = True
-
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if get_object_detector() is not None:
+        for class_name in _detect_yolo_classes(frame):
+            if class_name in TARGET_OBJECTS_YOLO:
+                detected_objects.append(class_name)
+                if class_name == 'cell phone':
+                    is_phone_detected = True
+
+    if gray is None:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     _, binary = cv2.threshold(gray, 200, 255, cv2.THRESH_BINARY)
     contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
     for contour in contours:
         area = cv2.contourArea(contour)
-        if area > (frame.shape[0] * frame.shape[1] * 0.05):
+        if area > (gray.shape[0] * gray.shape[1] * 0.05):
             perimeter = cv2.arcLength(contour, True)
             approx = cv2.approxPolyDP(contour, 0.02 * perimeter, True)
             if len(approx) == 4:
@@ -302,147 +528,420 @@ def init_audio_source():
             _audio_source = None
             print(f"Erreur lors de l'initialisation du microphone: {e}. La détection vocale sera simulée.")
 
-def analyze_audio_stream(audio_data_chunk=None):
+def _detect_voice(session, samples: np.ndarray):
     """
-    Analyse un chunk de données audio pour détecter la présence de voix.
-    :param audio_data_chunk: Un objet sr.AudioData (si l'audio vient du frontend) ou None (pour utiliser le microphone).
+    Détecte la présence de voix dans un segment PCM mono.
+    Par défaut la détection est locale (VAD de la session) ; la reconnaissance Google n'est
+    utilisée que si SIPA_VOICE_ENGINE vaut 'google'.
+    :param samples: PCM float32 dans [-1, 1], à VAD_SAMPLE_RATE.
     :return: (is_voice_detected: bool, message: str)
     """
-    global _unexpected_voice_counter
-
-    is_voice_detected = False
-    message = "Aucune activité vocale."
-
-    if _audio_source is None and audio_data_chunk is None:
-        # Simuler la détection si le micro n'est pas dispo et pas de chunk fourni
-        if random.random() < 0.05: # 5% de chance de simuler une voix inattendue
-            is_voice_detected = True
-            message = "Voix inattendue simulée."
-        else:
-            is_voice_detected = False
-            message = "Aucune activité vocale simulée."
-        return is_voice_detected, message
-
     try:
-        if audio_data_chunk:
-            audio_segment = audio_data_chunk
-        else:
-            with _audio_source as source:
-                audio_segment = _recognizer.listen(source, phrase_time_limit=2, timeout=1)
-
-        _recognizer.recognize_google(audio_segment, language="fr-FR")
-        is_voice_detected = True
-        message = "Activité vocale détectée."
-
+        if VOICE_ENGINE == 'google':
+            pcm_bytes = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+            _recognizer.recognize_google(sr.AudioData(pcm_bytes, VAD_SAMPLE_RATE, 2), language="fr-FR")
+            return True, "Activité vocale détectée."
+        activity = session.voice_activity.analyze(samples)
+        if activity["speech"]:
+            return True, f"Activité vocale détectée (parole sur {activity['speech_ratio']:.0%} du segment)."
+        return False, "Aucune activité vocale claire."
     except sr.UnknownValueError:
-        is_voice_detected = False
-        message = "Aucune activité vocale claire."
+        return False, "Aucune activité vocale claire."
     except sr.RequestError as e:
         print(f"Erreur du service de reconnaissance vocale; {e}")
-        is_voice_detected = False
-        message = "Erreur de service vocal."
-    except Exception as e:
-        print(f"Erreur de capture/traitement audio: {e}")
-        is_voice_detected = False
-        message = "Erreur audio."
+        return False, "Erreur de service vocal."
 
+def _update_voice_counter(session, is_voice_detected: bool, message: str):
+    """Met à jour le compteur de voix inattendue de la session. :return: (is_voice_detected, message)"""
     if is_voice_detected:
-        _unexpected_voice_counter += 1
-        if _unexpected_voice_counter >= UNEXPECTED_VOICE_CONSECUTIVE_ALERTS:
+        session.unexpected_voice_counter += 1
+        if session.unexpected_voice_counter >= UNEXPECTED_VOICE_CONSECUTIVE_ALERTS:
             message = f"ALERTE : Voix inattendue détectée ({message})."
         else:
-            message = f"Voix inattendue détectée. Compteur: {_unexpected_voice_counter}/{UNEXPECTED_VOICE_CONSECUTIVE_ALERTS}"
+            message = f"Voix inattendue détectée. Compteur: {session.unexpected_voice_counter}/{UNEXPECTED_VOICE_CONSECUTIVE_ALERTS}"
     else:
-        _unexpected_voice_counter = 0
-
+        session.unexpected_voice_counter = 0
     return is_voice_detected, message
 
+def _analyze_audio_windows(session):
+    """
+    Analyse les fenêtres glissantes complètes décodées depuis le dernier appel et met à jour le
+    compteur de voix inattendue. Appelé par le flux audio de la session dès que de nouveaux
+    échantillons sont dans le tampon (à la réception d'un chunk PCM, ou depuis le thread du décodeur).
+    """
+    if session.closed:
+        return # Session en cours de fermeture : close() attend le décodeur sous audio_lock
+    with session.audio_lock:
+        windows = session.audio.take_windows()
+        if not windows:
+            return
+        try:
+            for window in windows:
+                result = _update_voice_counter(session, *_detect_voice(session, window))
+        except Exception as e:
+            print(f"Erreur de traitement audio: {e}")
+            result = _update_voice_counter(session, False, "Erreur audio.")
+        session.last_voice_result = result
+
+def _feed_audio(session, audio_data_chunk):
+    """Transmet un chunk audio du client au flux de la session (ignoré si la session est fermée)."""
+    with session.audio_lock:
+        if not session.closed:
+            session.audio.feed(audio_data_chunk)
+
+def ingest_audio(student_id: str, audio_data_chunk, exam_id: str = None):
+    """
+    Point d'entrée de l'audio reçu hors des frames (canal WebSocket) : le chunk est décodé et
+    analysé au fil de l'eau, sans attendre la frame suivante ni passer par le pipeline visuel.
+    :param student_id: ID de l'étudiant surveillé.
+    :param audio_data_chunk: Chunk audio brut reçu du client (bytes, WebM/Opus ou PCM 16 bits).
+    :param exam_id: ID de l'examen (optionnel).
+    """
+    if audio_data_chunk:
+        _feed_audio(get_session(student_id, exam_id), audio_data_chunk)
+
+def analyze_audio_stream(session):
+    """
+    Résultat de détection de voix de la session.
+    Les chunks reçus du navigateur sont décodés en continu dans le tampon circulaire de la session
+    (voir models/audio_stream.py) et chaque fenêtre glissante complète est analysée dès son décodage
+    (_analyze_audio_windows) : ici seul le dernier résultat est lu.
+    Sans audio du client, le microphone du serveur est utilisé s'il est disponible.
+    :param session: ExamSession portant le flux audio, le détecteur d'activité vocale et le compteur de voix inattendue.
+    :return: (is_voice_detected: bool, message: str)
+    """
+    if session.audio.started:
+        with session.audio_lock:
+            return session.last_voice_result
+
+    if _audio_source is None:
+        # Simuler la détection si le micro n'est pas dispo et pas d'audio reçu du client
+        if random.random() < 0.05: # 5% de chance de simuler une voix inattendue
+            return _update_voice_counter(session, True, "Voix inattendue simulée.")
+        return _update_voice_counter(session, False, "Aucune activité vocale simulée.")
+
+    try:
+        with _audio_source as source:
+            audio_segment = _recognizer.listen(source, phrase_time_limit=2, timeout=1)
+        samples = pcm_to_float(audio_segment.get_raw_data(convert_rate=VAD_SAMPLE_RATE, convert_width=2))
+        is_voice_detected, message = _detect_voice(session, samples)
+    except Exception as e:
+        print(f"Erreur de capture/traitement audio: {e}")
+        is_voice_detected, message = False, "Erreur audio."
+    return _update_voice_counter(session, is_voice_detected, message)
+
 # --- Fonction Globale de Traitement de Données en Temps Réel ---
 
-def process_realtime_data(frame: np.ndarray, student_id_to_verify: str, audio_data_chunk=None):
+def process_realtime_data(frame: np.ndarray, student_id_to_verify: str, audio_data_chunk=None, exam_id: str = None,
+                          source_scale: float = 1.0):
     """
     Traite un cadre de webcam et un chunk audio pour toutes les détections.
-    :param frame: Le cadre de l'image (np.array).
+    L'état entre frames est lu et mis à jour dans la session (student_id_to_verify, exam_id).
+    :param frame: Le cadre de l'image (np.array, BGR), à la résolution de travail (voir frame_preparation.decode_frame).
     :param student_id_to_verify: L'ID de l'étudiant dont l'identité doit être vérifiée.
-    :param audio_data_chunk: Un objet sr.AudioData (si l'audio vient du frontend) ou None.
+    :param audio_data_chunk: Chunk audio brut reçu du frontend (bytes, WebM/Opus ou PCM 16 bits) ou None.
+    :param exam_id: ID de l'examen (optionnel).
+    :param source_scale: Taille de l'image envoyée par le client / taille de `frame` (pour les coordonnées renvoyées).
     :return: Un dictionnaire avec tous les résultats de détection.
     """
+    if audio_data_chunk:
+        ingest_audio(student_id_to_verify, audio_data_chunk, exam_id) # Analysé à réception, même si la frame est ignorée
+    while True:
+        session = get_session(student_id_to_verify, exam_id)
+        if admission.should_reject() and session.last_results is not None:
+            return _shed_frame(session)
+        with admission.track(), session.lock:
+            if session.closed:
+                continue # Session évincée pendant l'attente du verrou : la frame est traitée par la nouvelle session
+            return _process_session_frame(session, PreparedFrame(frame, source_scale), student_id_to_verify)
+
+def _shed_frame(session):
+    """
+    Réponse à une frame refusée par le contrôle d'admission (processus saturé) : derniers résultats
+    de la session, sans analyse (l'audio a déjà été transmis au flux de la session).
+    """
+    admission.record_rejection()
+    results = dict(session.last_results)
+    results["detectors_run"] = []
+    results["detectors_shed"] = []
+    results["shed"] = True
+    results["pacing"] = pacing_hints(admission.tier, shed=True)
+    return results
+
+# --- Étapes du Pipeline Temps Réel ---
+# Chaque étape exécute un détecteur sur la frame et retourne (champs de résultats, alerte_en_cours).
+# Les étapes non planifiées sur une frame (voir models/detector_scheduling.py) voient leur dernier
+# résultat reporté dans la réponse.
+
+FACE_DETECTORS = ("identity", "head_pose", "multiple_faces") # Étapes qui consomment la localisation des visages
+
+class _FrameContext:
+    """
+    Données partagées par les étapes du pipeline pour une frame. Les conversions de couleur et les
+    copies réduites viennent de la PreparedFrame : chacune est calculée une seule fois par frame.
+    """
+
+    def __init__(self, session, prepared: PreparedFrame, student_id: str):
+        self.session = session
+        self.prepared = prepared
+        self.frame = prepared.bgr
+        self.student_id = student_id
+        self.face_boxes = None
+
+    @property
+    def image_rgb(self):
+        return self.prepared.rgb
+
+    def localize_faces(self):
+        # Détection sur une copie réduite, boîtes exprimées dans la frame de travail (dlib, ROI FaceMesh)
+        small_rgb = self.prepared.for_detector("face_detection", "rgb")
+        self.face_boxes = localize_faces(small_rgb, self.session, frame_size=(self.prepared.width, self.prepared.height))
+
+def _run_identity_stage(ctx):
+    is_verified, score, msg, from_cache, candidates = verify_identity_tracked(ctx.image_rgb, ctx.student_id, ctx.session, ctx.face_boxes)
+    return {
+        "identity_verified": is_verified,
+        "identity_score": score,
+        "identity_message": msg,
+        "identity_cached": from_cache,
+        "impersonation_suspected": bool(candidates) and candidates[0]["match"],
+        "impersonation_candidates": candidates,
+    }, not is_verified
+
+def _run_head_pose_stage(ctx):
+    is_abnormal_move, move_msg, pose = analyze_head_movement(ctx.frame, ctx.session, ctx.face_boxes, ctx.image_rgb)
+    return {
+        "abnormal_movement_detected": is_abnormal_move,
+        "abnormal_movement_count": ctx.session.abnormal_movement_counter,
+        "movement_message": move_msg,
+        "head_pose": pose,
+    }, is_abnormal_move
+
+def _run_multiple_faces_stage(ctx):
+    is_multiple, multi_msg, count = detect_multiple_faces(ctx.frame, ctx.session, ctx.face_boxes)
+    return {
+        "multiple_faces_detected": is_multiple,
+        "multiple_faces_count": count,
+        "multiple_faces_message": multi_msg,
+        "face_boxes": [ctx.prepared.to_source(box) for box in ctx.face_boxes], # Coordonnées de l'image envoyée
+    }, is_multiple
+
+def _run_objects_stage(ctx):
+    is_objects_detected, objects_msg, object_list = detect_specific_objects(
+        ctx.prepared.for_detector("objects"), ctx.prepared.for_detector("paper", "gray"))
+    return {
+        "suspect_objects_detected": is_objects_detected,
+        "objects_message": objects_msg,
+        "detected_object_list": object_list,
+    }, is_objects_detected
+
+def _run_audio_stage(ctx):
+    is_voice, voice_msg = analyze_audio_stream(ctx.session)
+    return {
+        "unexpected_voice_detected": is_voice,
+        "unexpected_voice_count": ctx.session.unexpected_voice_counter,
+        "voice_probability": ctx.session.voice_activity.last_probability,
+        "voice_message": voice_msg,
+    }, is_voice
+
+DETECTOR_STAGES = {
+    "identity": _run_identity_stage,
+    "head_pose": _run_head_pose_stage,
+    "multiple_faces": _run_multiple_faces_stage,
+    "objects": _run_objects_stage,
+    "audio": _run_audio_stage,
+}
+
+# Pool de threads partagé par toutes les sessions pour le mode parallèle (créé à la demande)
+_stage_pool = None
+_stage_pool_lock = threading.Lock()
+
+def _call_stage(stage, *args):
+    """
+    Exécute une étape du pipeline.
+    :return: (champs de résultats, alerte_en_cours), ou None si l'étape est délestée (modèle saturé) :
+             son dernier résultat est alors reporté et elle reste planifiée pour la frame suivante.
+    """
+    try:
+        return stage(*args)
+    except SchedulerOverloaded:
+        return None
+
+def _get_stage_pool():
+    global _stage_pool
+    if _stage_pool is None:
+        with _stage_pool_lock:
+            if _stage_pool is None:
+                _stage_pool = ThreadPoolExecutor(max_workers=DETECTOR_THREAD_POOL_SIZE, thread_name_prefix="sipa-detector")
+    return _stage_pool
+
+def _fuse_alerts(results: dict):
+    """Calcule l'alerte globale et son message à partir des résultats de tous les détecteurs."""
+    results["overall_alert"] = False
+    if not results["identity_verified"]:
+        results["overall_alert"] = True
+    if results["abnormal_movement_detected"] and results["abnormal_movement_count"] >= CONSECUTIVE_FRAMES_THRESHOLD:
+        results["overall_alert"] = True
+    if results["multiple_faces_detected"] or results["suspect_objects_detected"]:
+        results["overall_alert"] = True
+    if results["unexpected_voice_detected"] and results["unexpected_voice_count"] >= UNEXPECTED_VOICE_CONSECUTIVE_ALERTS:
+        results["overall_alert"] = True
+
+    # Combinaison d'alertes (ex: autre visage + voix inattendue = alerte forte)
+    if results["impersonation_suspected"]:
+        results["overall_alert_message"] = f"ALERTE : Le visage correspond à un autre étudiant enrôlé ({results['impersonation_candidates'][0]['student_id']}) !"
+    elif results["multiple_faces_detected"] and results["unexpected_voice_detected"]:
+        results["overall_alert"] = True
+        results["overall_alert_message"] = "ALERTE COMBINÉE : Autre personne et voix inattendue détectées !"
+    elif results["overall_alert"]:
+        results["overall_alert_message"] = "ALERTE : Comportement suspect détecté."
+    else:
+        results["overall_alert_message"] = "Surveillance active. Aucun problème détecté."
+
+def _reuse_session_results(session, ctx):
+    """
+    Réponse pour une frame ignorée par le filtre de changement : résultats en cache de la session.
+    Le résultat audio, analysé à la réception de l'audio, y est tout de même actualisé.
+    """
+    results = dict(session.last_results)
+    results["detectors_run"] = []
+    results["detectors_shed"] = []
+    if session.audio.started:
+        output, alert_pending = _run_audio_stage(ctx)
+        session.scheduler.record("audio", output, alert_pending)
+        results.update(output)
+        results["detectors_run"] = ["audio"]
+    results["frame_skipped"] = True
+    _fuse_alerts(results)
+    return results
+
+def _process_session_frame(session, prepared: PreparedFrame, student_id_to_verify: str):
+    ctx = _FrameContext(session, prepared, student_id_to_verify)
+    alert_active = session.last_results is not None and session.last_results["overall_alert"]
+
+    # Niveau de qualité : la session se rapproche d'un cran du niveau imposé par la charge du processus
+    session.quality_tier = admission.session_tier(session.quality_tier, alert_active)
+    prepared.detail_scale = admission.detail_scale(session.quality_tier)
+
+    # Filtre de changement : une scène inchangée réutilise les derniers résultats, sauf alerte en cours
+    # ou en train de se confirmer (compteur de frames consécutives entamé, détecteur promu à chaque
+    # frame) : une tête tournée immobile ne change pas la scène mais doit être comptée à chaque frame
+    confirming = session.abnormal_movement_counter > 0 or session.scheduler.alert_pending()
+    gate_open = session.last_results is not None and not alert_active and not confirming
+    if session.frame_gate.should_skip(prepared.for_detector("gate", "gray"), force_process=not gate_open):
+        results = _reuse_session_results(session, ctx)
+    else:
+        results = _run_pipeline(session, ctx)
+    results["frame_gate"] = session.frame_gate.stats()
+    results["quality_tier"] = {"level": session.quality_tier, "name": admission.tier_name(session.quality_tier)}
+    results["shed"] = False
+
+    # Rythme de capture demandé au client : pleine fidélité en alerte, ralenti pour une session calme
+    now = time.monotonic()
+    if results["overall_alert"]:
+        session.last_alert_at = now
+    results["pacing"] = pacing_hints(
+        admission.tier, prepared.detail_scale, alert_active=results["overall_alert"],
+        calm=now - session.last_alert_at >= PACING_CALM_AFTER_S
+    )
+    session.last_results = results
+    return results
+
+def _run_pipeline(session, ctx):
     results = {
         "identity_verified": False,
         "identity_score": 0.0,
         "identity_message": "Non vérifié.",
+        "identity_cached": False,
+        "impersonation_suspected": False, # Vrai si le visage correspond à un autre étudiant enrôlé
+        "impersonation_candidates": [], # Identités enrôlées les plus proches (recherche 1:N si la vérification échoue)
         "abnormal_movement_detected": False,
+        "abnormal_movement_count": 0,
         "movement_message": "Normal.",
         "head_pose": {},
         "multiple_faces_detected": False,
         "multiple_faces_count": 0,
         "multiple_faces_message": "Aucun autre visage.",
+        "face_boxes": [], # Boîtes (top, right, bottom, left) des visages, dans l'image envoyée par le client
         "suspect_objects_detected": False,
         "objects_message": "Aucun objet suspect.",
         "detected_object_list": [],
         "unexpected_voice_detected": False,
+        "unexpected_voice_count": 0,
+        "voice_probability": 0.0, # Probabilité de parole maximale sur le dernier segment (VAD local)
         "voice_message": "Aucune activité vocale.",
+        "detectors_run": [], # Détecteurs exécutés sur cette frame (les autres sont reportés)
+        "detectors_shed": [], # Détecteurs planifiés mais délestés (modèle saturé), résultat reporté
+        "frame_skipped": False, # Vrai si la frame a été ignorée par le filtre de changement de scène
         "overall_alert": False, # Indique si une alerte majeure a été déclenchée
         "overall_alert_message": "Surveillance active. Aucun problème détecté."
     }
 
-    # 1. Vérification d'identité
-    is_verified, score, msg = verify_identity(frame, student_id_to_verify)
-    results["identity_verified"] = is_verified
-    results["identity_score"] = score
-    results["identity_message"] = msg
-    if not is_verified:
-        results["overall_alert"] = True
-
-    # 2. Analyse des mouvements de la tête
-    is_abnormal_move, move_msg, pose = analyze_head_movement(frame)
-    results["abnormal_movement_detected"] = is_abnormal_move
-    results["movement_message"] = move_msg
-    results["head_pose"] = pose
-    if is_abnormal_move and _abnormal_movement_counter >= CONSECUTIVE_FRAMES_THRESHOLD:
-        results["overall_alert"] = True
-
-    # 3. Détection de plusieurs visages
-    is_multiple, multi_msg, count = detect_multiple_faces(frame)
-    results["multiple_faces_detected"] = is_multiple
-    results["multiple_faces_count"] = count
-    results["multiple_faces_message"] = multi_msg
-    if is_multiple:
-        results["overall_alert"] = True
-
-    # 4. Détection d'objets (téléphone, papier)
-    is_objects_detected, objects_msg, object_list = detect_specific_objects(frame)
-    results["suspect_objects_detected"] = is_objects_detected
-    results["objects_message"] = objects_msg
-    results["detected_object_list"] = object_list
-    if is_objects_detected:
-        results["overall_alert"] = True
-
-    # 5. Analyse audio
-    is_voice, voice_msg = analyze_audio_stream(audio_data_chunk)
-    results["unexpected_voice_detected"] = is_voice
-    results["voice_message"] = voice_msg
-    if is_voice and _unexpected_voice_counter >= UNEXPECTED_VOICE_CONSECUTIVE_ALERTS:
-        results["overall_alert"] = True
-
-    # Combinaison d'alertes (ex: autre visage + voix inattendue = alerte forte)
-    if results["multiple_faces_detected"] and results["unexpected_voice_detected"]:
-        results["overall_alert"] = True
-        results["overall_alert_message"] = "ALERTE COMBINÉE : Autre personne et voix inattendue détectées !"
-    elif results["overall_alert"]:
-        results["overall_alert_message"] = "ALERTE : Comportement suspect détecté."
+    scheduler = session.scheduler
+    due = scheduler.next_frame()
+
+    # Détecteurs suspendus par le niveau de qualité, sauf vérification garantie arrivée à échéance
+    disabled = admission.disabled_detectors(session.quality_tier)
+    due = [name for name in due
+           if name not in disabled or scheduler.seconds_since_run(name) >= GUARANTEED_CHECK_INTERVAL_S.get(name, 0.0)]
+
+    # En mode parallèle, les étapes qui n'ont pas besoin des visages démarrent pendant la localisation
+    futures = {}
+    if PARALLEL_DETECTORS:
+        pool = _get_stage_pool()
+        futures = {name: pool.submit(_call_stage, DETECTOR_STAGES[name], ctx) for name in due if name not in FACE_DETECTORS}
+
+    # 0. Localisation des visages, une seule fois pour les détecteurs visuels planifiés
+    if any(name in FACE_DETECTORS for name in due):
+        ctx.localize_faces()
+        # Une rupture de la piste du visage (perte, saut, changement du nombre de visages) force la
+        # vérification d'identité même hors de sa cadence
+        if "identity" not in due and session.identity.observe(ctx.face_boxes):
+            due.append("identity")
+
+    # 1-5. Détecteurs planifiés sur cette frame, par priorité ; les autres reportent leur dernier résultat
+    if PARALLEL_DETECTORS:
+        futures.update({name: pool.submit(_call_stage, DETECTOR_STAGES[name], ctx) for name in due if name in FACE_DETECTORS})
+        outputs = {name: future.result() for name, future in futures.items()}
     else:
-        results["overall_alert_message"] = "Surveillance active. Aucun problème détecté."
-
+        outputs = {name: _call_stage(DETECTOR_STAGES[name], ctx) for name in due}
+    for name in due:
+        if outputs[name] is not None:
+            output, alert_pending = outputs[name]
+            scheduler.record(name, output, alert_pending)
+    for name in DETECTOR_STAGES:
+        results.update(scheduler.carried_output(name))
+    results["detectors_run"] = [name for name in due if outputs[name] is not None]
+    results["detectors_shed"] = [name for name in due if outputs[name] is None]
+
+    _fuse_alerts(results)
     return results
 
-def reset_visual_module_state():
+def reset_visual_module_state(student_id: str = None, exam_id: str = None):
     """
-    Réinitialise les variables d'état globales du module visuel et audio.
+    Réinitialise l'état du module visuel et audio.
     À appeler au début d'un nouvel examen ou d'une nouvelle session.
+    :param student_id: Si fourni, termine uniquement la session de cet étudiant (compteurs et
+                       détecteurs MediaPipe) ; sinon toutes les sessions sont terminées.
+    :param exam_id: ID de l'examen (optionnel).
+    """
+    if student_id is None:
+        sessions.clear()
+        print("État du module visuel et audio réinitialisé pour toutes les sessions.")
+    else:
+        sessions.remove(student_id, exam_id)
+        print(f"État du module visuel et audio réinitialisé pour {student_id}.")
+
+def get_realtime_stats():
     """
-    global _last_head_pose, _abnormal_movement_counter, _unexpected_voice_counter
-    _last_head_pose = None
-    _abnormal_movement_counter = 0
-    _unexpected_voice_counter = 0
-    print("État du module visuel et audio réinitialisé.")
\ No newline at end of file
+    Statistiques de supervision du pipeline temps réel (sessions actives, lots YOLO).
+    """
+    return {
+        "sessions": sessions.stats(),
+        "yolo_batching": dict(yolo_scheduler.stats(), enabled=YOLO_BATCHING_ENABLED),
+        "object_detector": object_detector.info() if object_detector is not None else None,
+        "detector_schedule": DETECTOR_SCHEDULE,
+        "parallel_detectors": {"enabled": PARALLEL_DETECTORS, "max_workers": DETECTOR_THREAD_POOL_SIZE},
+        "cohort_search": cohort_index.stats(),
+        "load_shedding": admission.stats(),
+    }
@@ -0,0 +1,130 @@
+# models/voice_activity.py
+import numpy as np
+
+# --- Paramètres de la Détection d'Activité Vocale (VAD) ---
+VAD_SAMPLE_RATE = 16000 # Fréquence d'analyse (Hz) : le PCM est converti à cette fréquence avant analyse
+VAD_WINDOW_MS = 30 # Durée d'une sous-fenêtre d'analyse
+VAD_SPEECH_BAND_HZ = (300, 3400) # Bande des formants de la voix
+VAD_SPEECH_THRESHOLD = 0.5 # Probabilité au-delà de laquelle une sous-fenêtre est considérée comme de la parole
+VAD_ONSET_WINDOWS = 3 # Sous-fenêtres de parole consécutives pour déclencher (évite les bruits impulsionnels)
+VAD_HANGOVER_WINDOWS = 8 # Sous-fenêtres maintenues en parole après la dernière détection (~240 ms)
+VAD_MIN_SPEECH_RATIO = 0.1 # Part minimale de sous-fenêtres de parole pour qu'un chunk contienne de la voix
+VAD_SILENCE_DB = -60.0 # Énergie (dBFS) en dessous de laquelle une sous-fenêtre est du silence
+VAD_NOISE_ADAPTATION = 0.05 # Vitesse d'adaptation du plancher de bruit (par chunk)
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def pcm_to_float(pcm_bytes: bytes):
+    """Convertit du PCM 16 bits signé (little-endian) en np.array float32 dans [-1, 1]."""
+    return np.frombuffer(pcm_bytes, dtype='<i2').astype(np.float32) / 32768.0
+
+
+class VoiceActivityDetector:
+    """
+    Détecteur d'activité vocale local (hors ligne) d'une session, sur du PCM mono.
+    Chaque chunk est découpé en sous-fenêtres analysées en un seul calcul matriciel :
+    - énergie (dBFS) relative à un plancher de bruit adaptatif,
+    - taux de passage par zéro (élevé pour le souffle et les bruits larges bande),
+    - part de l'énergie spectrale dans la bande de la voix.
+    Ces caractéristiques donnent une probabilité de parole par sous-fenêtre, puis une décision
+    lissée (déclenchement sur plusieurs sous-fenêtres et maintien après la fin de la parole),
+    dont l'état est conservé d'un chunk à l'autre.
+    """
+
+    def __init__(self, sample_rate: int = VAD_SAMPLE_RATE, window_ms: int = VAD_WINDOW_MS,
+                 threshold: float = VAD_SPEECH_THRESHOLD, onset_windows: int = VAD_ONSET_WINDOWS,
+                 hangover_windows: int = VAD_HANGOVER_WINDOWS):
+        self.sample_rate = sample_rate
+        self.window = int(sample_rate * window_ms / 1000)
+        self.threshold = threshold
+        self.onset_windows = onset_windows
+        self.hangover_windows = hangover_windows
+        self._taper = np.hanning(self.window).astype(np.float32)
+        frequencies = np.fft.rfftfreq(self.window, d=1.0 / sample_rate)
+        self._speech_band = (frequencies >= VAD_SPEECH_BAND_HZ[0]) & (frequencies <= VAD_SPEECH_BAND_HZ[1])
+        self.reset()
+
+    def reset(self):
+        self.noise_floor_db = None
+        self._onset_run = 0 # Sous-fenêtres de parole consécutives (avant déclenchement)
+        self._hangover = 0  # Sous-fenêtres de maintien restantes
+        self.last_probability = 0.0
+
+    def features(self, samples: np.ndarray):
+        """
+        Caractéristiques de chaque sous-fenêtre complète du signal.
+        :param samples: PCM mono float32 dans [-1, 1].
+        :return: (énergie dBFS, taux de passage par zéro, part d'énergie dans la bande vocale), un np.array chacun.
+        """
+        count = len(samples) // self.window
+        frames = samples[:count * self.window].reshape(count, self.window)
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+        spectrum = np.abs(np.fft.rfft(frames * self._taper, axis=1)) ** 2
+        band_ratio = spectrum[:, self._speech_band].sum(axis=1) / (spectrum.sum(axis=1) + 1e-10)
+        return energy_db, zcr, band_ratio
+
+    def speech_probabilities(self, samples: np.ndarray):
+        """
+        Probabilité de parole de chaque sous-fenêtre (met à jour le plancher de bruit).
+        :param samples: PCM mono float32 dans [-1, 1].
+        :return: np.array des probabilités (une par sous-fenêtre de VAD_WINDOW_MS).
+        """
+        energy_db, zcr, band_ratio = self.features(samples)
+        if len(energy_db) == 0:
+            return energy_db
+
+        # Plancher de bruit : bas percentile des énergies, suivi lentement (et immédiatement à la baisse)
+        quiet_db = float(np.percentile(energy_db, 10))
+        if self.noise_floor_db is None or quiet_db < self.noise_floor_db:
+            self.noise_floor_db = quiet_db
+        else:
+            self.noise_floor_db += VAD_NOISE_ADAPTATION * (quiet_db - self.noise_floor_db)
+
+        # ~0 à 9 dB au-dessus du bruit, borné pour qu'un bruit fort ne suffise pas à faire de la parole
+        snr_score = np.clip((energy_db - self.noise_floor_db - 9.0) / 3.0, -6.0, 3.0)
+        band_score = (band_ratio - 0.5) * 8.0
+        zcr_score = -np.maximum(zcr - 0.25, 0.0) * 20.0 # Pénalise les bruits très larges bande
+        probabilities = _sigmoid(snr_score + band_score + zcr_score)
+        probabilities[energy_db < VAD_SILENCE_DB] = 0.0
+        return probabilities
+
+    def smooth(self, probabilities: np.ndarray):
+        """
+        Décision lissée par sous-fenêtre : déclenchement après `onset_windows` sous-fenêtres de
+        parole consécutives, maintien pendant `hangover_windows` après la dernière.
+        :return: np.array de booléens.
+        """
+        decisions = np.zeros(len(probabilities), dtype=bool)
+        for i, is_speech in enumerate(probabilities >= self.threshold):
+            if is_speech:
+                self._onset_run += 1
+                if self._onset_run >= self.onset_windows or self._hangover > 0:
+                    self._hangover = self.hangover_windows
+            else:
+                self._onset_run = 0
+            if self._hangover > 0:
+                decisions[i] = True
+                if not is_speech:
+                    self._hangover -= 1
+        return decisions
+
+    def analyze(self, samples: np.ndarray, min_speech_ratio: float = VAD_MIN_SPEECH_RATIO):
+        """
+        Analyse un chunk de PCM.
+        :param samples: PCM mono float32 dans [-1, 1], à `sample_rate`.
+        :return: Dict {speech: bool, speech_ratio: float, max_probability: float, probabilities: list}.
+        """
+        probabilities = self.speech_probabilities(samples)
+        decisions = self.smooth(probabilities)
+        speech_ratio = float(decisions.mean()) if len(decisions) else 0.0
+        self.last_probability = float(probabilities.max()) if len(probabilities) else 0.0
+        return {
+            "speech": speech_ratio >= min_speech_ratio,
+            "speech_ratio": speech_ratio,
+            "max_probability": self.last_probability,
+            "probabilities": probabilities.round(3).tolist(),
+        }
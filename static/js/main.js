@@ -5,7 +5,7 @@ let videoStream = null;
 let audioStream = null;
 let mediaRecorder = null;
 let audioChunks = [];
-let detectionInterval = null;
+let detectionTimer = null;
 const AUDIO_SAMPLE_RATE = 44100; // Doit correspondre au backend Python
 
 // --- Helper Functions ---
@@ -93,6 +93,108 @@ if (document.getElementById('student-dashboard')) {
     });
 
     // --- Real-time Exam Simulation (Webcam & Microphone) ---
+    // Les frames et l'audio passent par le canal WebSocket /ws/exam quand il est disponible,
+    // sinon par des POST sur /api/detect/realtime.
+    const WS_FRAME_MESSAGE = 0x01; // Doit correspondre au backend Python
+    const WS_AUDIO_MESSAGE = 0x02;
+    const WS_MAX_BUFFERED_BYTES = 512 * 1024; // Au-delà, le réseau est saturé : on n'envoie pas de nouvelle frame
+    const FRAME_IN_FLIGHT_TIMEOUT_MS = 5000;
+    let examSocket = null;
+    let frameSentAt = null; // Une seule frame en vol : tant que le résultat n'est pas revenu, les frames capturées sont abandonnées
+    // Rythme de capture : mis à jour par chaque réponse du serveur (intervalle, largeur, qualité JPEG)
+    const DEFAULT_PACING = { interval_ms: 1000, width: null, jpeg_quality: 0.8 };
+    let pacing = { ...DEFAULT_PACING };
+
+    function handleRealtimeResults(data) {
+        if (data.pacing) {
+            pacing = data.pacing;
+        }
+        updateRealtimeResults(data);
+
+        // Proposer des conseils via le chatbot après détection en temps réel
+        if (data.overall_alert && data.overall_alert_message && data.overall_alert_message.includes('ALERTE')) {
+            displayMessage('chatbot-messages', `Attention: ${data.overall_alert_message}. Je peux vous donner des conseils.`, 'bot');
+            // Envoyer une requête au chatbot avec le contexte
+            let context = 'visual_audio_alert'; // Contexte générique pour les alertes visuelles/audio
+            if (data.multiple_faces_detected || !data.identity_verified) context = 'visual_alert';
+            else if (data.unexpected_voice_detected) context = 'audio_alert';
+
+            fetch('/api/proactive/ask', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ question: 'conseils', context: context })
+            })
+            .then(res => res.json())
+            .then(chatData => {
+                displayMessage('chatbot-messages', chatData.answer, 'bot');
+            })
+            .catch(err => console.error('Error getting proactive advice:', err));
+        }
+    }
+
+    function showRealtimeConnectionError() {
+        document.getElementById('realtime-detection-results').innerHTML = '<p class="text-red-500">Erreur de connexion au module de détection en temps réel.</p>';
+    }
+
+    // Message binaire WebSocket : 1 octet de type suivi du contenu
+    function framedMessage(type, blob) {
+        return new Blob([new Uint8Array([type]), blob]);
+    }
+
+    // Ouvre le canal WebSocket ; résout null si le serveur ne le propose pas (repli HTTP)
+    function openExamSocket() {
+        return new Promise((resolve) => {
+            if (!window.WebSocket) {
+                resolve(null);
+                return;
+            }
+            const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+            const socket = new WebSocket(`${protocol}://${window.location.host}/ws/exam?student_id=${encodeURIComponent(studentId)}`);
+            socket.binaryType = 'arraybuffer';
+            socket.onopen = () => resolve(socket);
+            socket.onerror = () => resolve(null);
+            socket.onmessage = (event) => {
+                frameSentAt = null;
+                const message = JSON.parse(event.data);
+                if (message.type === 'result') {
+                    handleRealtimeResults(message.results);
+                } else {
+                    console.error('Real-time detection error:', message.error);
+                }
+            };
+            socket.onclose = () => {
+                if (examSocket === socket) {
+                    examSocket = null; // Les frames suivantes repassent par HTTP
+                    frameSentAt = null;
+                }
+            };
+        });
+    }
+
+    async function sendFrameHttp(imageBlob) {
+        const formData = new FormData();
+        formData.append('student_id', studentId);
+        formData.append('image', imageBlob, 'frame.jpg');
+        if (audioChunks.length > 0) {
+            formData.append('audio', new Blob(audioChunks, { type: 'audio/webm;codecs=opus' }), 'audio.webm');
+            audioChunks = []; // Clear chunks after sending
+        }
+
+        try {
+            // Le navigateur fixe lui-même l'en-tête multipart/form-data (avec la frontière)
+            const response = await fetch('/api/detect/realtime', {
+                method: 'POST',
+                body: formData
+            });
+            handleRealtimeResults(await response.json());
+        } catch (error) {
+            console.error('Error sending real-time data:', error);
+            showRealtimeConnectionError();
+        } finally {
+            frameSentAt = null;
+        }
+    }
+
     document.getElementById('startExamBtn').addEventListener('click', async () => {
         const videoElement = document.getElementById('webcamVideo');
         const canvasElement = document.getElementById('webcamCanvas');
@@ -101,18 +203,29 @@ if (document.getElementById('student-dashboard')) {
         const stopBtn = document.getElementById('stopExamBtn');
 
         // Reset state on backend
-        await fetch('/api/reset_visual_audio_state', { method: 'POST' });
+        await fetch('/api/reset_visual_audio_state', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ student_id: studentId })
+        });
 
         try {
             videoStream = await navigator.mediaDevices.getUserMedia({ video: true, audio: true });
             videoElement.srcObject = videoStream;
             videoElement.play();
 
-            // Start audio recording
-            mediaRecorder = new MediaRecorder(videoStream, { mimeType: 'audio/webm;codecs=opus' });
+            examSocket = await openExamSocket();
+            frameSentAt = null;
+
+            // Start audio recording (pistes audio seules : le serveur décode le flux WebM/Opus en continu)
+            mediaRecorder = new MediaRecorder(new MediaStream(videoStream.getAudioTracks()), { mimeType: 'audio/webm;codecs=opus' });
             mediaRecorder.ondataavailable = (event) => {
                 if (event.data.size > 0) {
-                    audioChunks.push(event.data);
+                    if (examSocket && examSocket.readyState === WebSocket.OPEN) {
+                        examSocket.send(framedMessage(WS_AUDIO_MESSAGE, event.data)); // L'audio monte dès qu'il est disponible
+                    } else {
+                        audioChunks.push(event.data);
+                    }
                 }
             };
             mediaRecorder.onstop = () => {
@@ -123,64 +236,40 @@ if (document.getElementById('student-dashboard')) {
             startBtn.classList.add('hidden');
             stopBtn.classList.remove('hidden');
 
-            // Start sending frames and audio chunks
-            detectionInterval = setInterval(async () => {
-                if (videoElement.readyState === videoElement.HAVE_ ENOUGH_DATA) {
-                    canvasElement.width = videoElement.videoWidth;
-                    canvasElement.height = videoElement.videoHeight;
-                    context.drawImage(videoElement, 0, 0, canvasElement.width, canvasElement.height);
-                    const imageData = canvasElement.toDataURL('image/jpeg', 0.8); // Qualité 0.8
-
-                    let audioBase64 = null;
-                    if (audioChunks.length > 0) {
-                        const audioBlob = new Blob(audioChunks, { type: 'audio/webm;codecs=opus' });
-                        audioBase64 = await new Promise((resolve) => {
-                            const reader = new FileReader();
-                            reader.onloadend = () => resolve(reader.result.split(',')[1]);
-                            reader.readAsDataURL(audioBlob);
-                        });
-                        audioChunks = []; // Clear chunks after sending
-                    }
+            async function captureFrame() {
+                if (videoElement.readyState !== videoElement.HAVE_ENOUGH_DATA) return;
+                // Contre-pression : pas de nouvelle frame tant que la précédente n'a pas eu de réponse
+                if (frameSentAt !== null && Date.now() - frameSentAt < FRAME_IN_FLIGHT_TIMEOUT_MS) return;
+                if (examSocket && examSocket.bufferedAmount > WS_MAX_BUFFERED_BYTES) return;
+
+                // Largeur demandée par le serveur (jamais au-delà de la résolution de la caméra)
+                const scale = pacing.width ? Math.min(1, pacing.width / videoElement.videoWidth) : 1;
+                canvasElement.width = Math.round(videoElement.videoWidth * scale);
+                canvasElement.height = Math.round(videoElement.videoHeight * scale);
+                context.drawImage(videoElement, 0, 0, canvasElement.width, canvasElement.height);
+                frameSentAt = Date.now();
+                // JPEG binaire (pas de base64), à la qualité demandée par le serveur
+                const imageBlob = await new Promise((resolve) => canvasElement.toBlob(resolve, 'image/jpeg', pacing.jpeg_quality));
+
+                if (examSocket && examSocket.readyState === WebSocket.OPEN) {
+                    examSocket.send(framedMessage(WS_FRAME_MESSAGE, imageBlob));
+                } else {
+                    await sendFrameHttp(imageBlob);
+                }
+            }
 
-                    try {
-                        const response = await fetch('/api/detect/realtime', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({
-                                image: imageData.split(',')[1], // Envoyer seulement la partie base64
-                                audio: audioBase64,
-                                student_id: studentId
-                            })
-                        });
-                        const data = await response.json();
-                        updateRealtimeResults(data);
-
-                        // Proposer des conseils via le chatbot après détection en temps réel
-                        if (data.overall_alert && data.overall_alert_message && data.overall_alert_message.includes('ALERTE')) {
-                            displayMessage('chatbot-messages', `Attention: ${data.overall_alert_message}. Je peux vous donner des conseils.`, 'bot');
-                            // Envoyer une requête au chatbot avec le contexte
-                            let context = 'visual_audio_alert'; // Contexte générique pour les alertes visuelles/audio
-                            if (data.multiple_faces_detected || !data.identity_verified) context = 'visual_alert';
-                            else if (data.unexpected_voice_detected) context = 'audio_alert';
-
-                            fetch('/api/proactive/ask', {
-                                method: 'POST',
-                                headers: { 'Content-Type': 'application/json' },
-                                body: JSON.stringify({ question: 'conseils', context: context })
-                            })
-                            .then(res => res.json())
-                            .then(chatData => {
-                                displayMessage('chatbot-messages', chatData.answer, 'bot');
-                            })
-                            .catch(err => console.error('Error getting proactive advice:', err));
-                        }
-
-                    } catch (error) {
-                        console.error('Error sending real-time data:', error);
-                        document.getElementById('realtime-detection-results').innerHTML = '<p class="text-red-500">Erreur de connexion au module de détection en temps réel.</p>';
+            // Start sending frames and audio chunks : chaque capture programme la suivante selon le rythme courant
+            pacing = { ...DEFAULT_PACING };
+            async function captureLoop() {
+                try {
+                    await captureFrame();
+                } finally {
+                    if (detectionTimer !== null) {
+                        detectionTimer = setTimeout(captureLoop, pacing.interval_ms);
                     }
                 }
-            }, 1000); // Send data every 1 second
+            }
+            detectionTimer = setTimeout(captureLoop, 0);
         } catch (error) {
             console.error('Error accessing webcam/microphone:', error);
             alert('Impossible d\'accéder à la webcam ou au microphone. Veuillez vérifier les permissions.');
@@ -188,9 +277,13 @@ if (document.getElementById('student-dashboard')) {
     });
 
     document.getElementById('stopExamBtn').addEventListener('click', () => {
-        if (detectionInterval) {
-            clearInterval(detectionInterval);
-            detectionInterval = null;
+        if (detectionTimer !== null) {
+            clearTimeout(detectionTimer);
+            detectionTimer = null;
+        }
+        if (examSocket) {
+            examSocket.close();
+            examSocket = null;
         }
         if (videoStream) {
             videoStream.getTracks().forEach(track => track.stop());
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Les tests importent les modules du dossier models/ comme l'application (depuis la racine du dépôt)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,21 @@
+# tests/test_audio_stream.py
+import numpy as np
+
+from models.audio_stream import RAW_PCM_SAMPLE_RATE, SessionAudioStream
+
+
+def _raw_pcm(seconds: float):
+    return np.zeros(int(seconds * RAW_PCM_SAMPLE_RATE), dtype='<i2').tobytes()
+
+
+def test_windows_are_taken_as_audio_arrives():
+    stream = SessionAudioStream()
+    windows = []
+    stream.on_samples = lambda: windows.extend(stream.take_windows())
+
+    stream.feed(_raw_pcm(0.5))
+    assert windows == [] # Fenêtre d'une seconde pas encore complète
+
+    stream.feed(_raw_pcm(1.0))
+    assert len(windows) == 2 # Fenêtres [0, 1 s) et [0,5 s, 1,5 s), sans attendre de frame
+    assert all(len(window) == stream.window for window in windows)
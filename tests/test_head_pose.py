@@ -0,0 +1,41 @@
+# tests/test_head_pose.py
+import cv2
+import numpy as np
+
+from models.head_pose import (DIST_COEFFS, HEAD_MODEL_POINTS, HEAD_PITCH_THRESHOLD, HeadPoseTracker,
+                              camera_matrix, estimate_head_poses_batch)
+
+WIDTH, HEIGHT = 640, 480
+
+
+def _project(pitch_deg: float, yaw_deg: float = 0.0):
+    """Points 2D du modèle de visage vu de face (rotation de 180° autour de X), tourné de pitch/yaw."""
+    rmat = cv2.Rodrigues(np.array([np.pi + np.radians(pitch_deg), 0.0, 0.0]))[0]
+    rmat = rmat @ cv2.Rodrigues(np.array([0.0, np.radians(yaw_deg), 0.0]))[0]
+    points, _ = cv2.projectPoints(HEAD_MODEL_POINTS, cv2.Rodrigues(rmat)[0], np.array([0.0, 0.0, 2000.0]),
+                                  camera_matrix(WIDTH, HEIGHT), DIST_COEFFS)
+    return points.reshape(-1, 2)
+
+
+def test_frontal_pose_is_not_a_tilted_head():
+    tracker = HeadPoseTracker()
+    rng = np.random.default_rng(0)
+    for i in range(10):
+        # Bruit des landmarks : le pitch brut oscillerait autour de ±180° sans rapport à la pose de face
+        points = _project(0.0) + rng.normal(0.0, 1.0, (6, 2))
+        smoothed, raw = tracker.update(points, WIDTH, HEIGHT, now=i / 10)
+        assert abs(raw[0]) < HEAD_PITCH_THRESHOLD
+        assert abs(smoothed[0]) < HEAD_PITCH_THRESHOLD
+
+
+def test_tilted_pose_exceeds_pitch_threshold():
+    tracker = HeadPoseTracker()
+    smoothed, raw = tracker.update(_project(35.0), WIDTH, HEIGHT, now=0.0)
+    assert abs(raw[0]) > HEAD_PITCH_THRESHOLD
+    assert abs(smoothed[0]) > HEAD_PITCH_THRESHOLD
+
+
+def test_batch_pitch_is_relative_to_frontal():
+    euler = estimate_head_poses_batch(np.stack([_project(0.0), _project(-30.0)]), WIDTH, HEIGHT)
+    assert abs(euler[0, 0]) < 1.0
+    assert abs(abs(euler[1, 0]) - 30.0) < 2.0
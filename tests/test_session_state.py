@@ -0,0 +1,69 @@
+# tests/test_session_state.py
+import threading
+import time
+
+import pytest
+
+from models.session_state import SessionClosed, SessionRegistry
+
+
+class FakeDetectors:
+    """Détecteurs factices : enregistrent leur fermeture et refusent d'être utilisés ensuite."""
+
+    def __init__(self):
+        self.closed = False
+
+    def process(self):
+        assert not self.closed, "graphe utilisé après sa fermeture"
+
+    def close(self):
+        self.closed = True
+
+
+def test_eviction_waits_for_frame_in_progress():
+    registry = SessionRegistry(max_sessions=1)
+    session = registry.get("student_a")
+    frame_started = threading.Event()
+    release_frame = threading.Event()
+    seen = {}
+
+    def process_frame():
+        with session.lock:
+            detectors = session.get_detectors(FakeDetectors)
+            frame_started.set()
+            release_frame.wait(timeout=5)
+            detectors.process() # La session ne doit pas avoir été fermée pendant la frame
+            seen["detectors"] = detectors
+
+    worker = threading.Thread(target=process_frame)
+    worker.start()
+    assert frame_started.wait(timeout=5)
+
+    # Une nouvelle session dépasse max_sessions : student_a est évincée pendant sa frame
+    evictor = threading.Thread(target=registry.get, args=("student_b",))
+    evictor.start()
+    time.sleep(0.1)
+    assert evictor.is_alive(), "la fermeture doit attendre la fin de la frame en cours"
+    assert not session.closed
+
+    release_frame.set()
+    worker.join(timeout=5)
+    evictor.join(timeout=5)
+    assert session.closed
+    assert seen["detectors"].closed
+    assert registry.peek("student_a") is None
+
+    # Une requête qui tenait encore la session évincée ne recrée pas de graphes
+    with pytest.raises(SessionClosed):
+        session.get_detectors(FakeDetectors)
+    assert session.detectors is None
+
+
+def test_remove_closes_session():
+    registry = SessionRegistry()
+    session = registry.get("student_a", "exam_1")
+    detectors = session.get_detectors(FakeDetectors)
+    assert registry.remove("student_a", "exam_1")
+    assert session.closed and detectors.closed
+    # La prochaine requête obtient une nouvelle session, utilisable
+    assert registry.get("student_a", "exam_1") is not session
@@ -0,0 +1,49 @@
+# tests/test_text_detection.py
+import pytest
+
+from models import text_detection
+from models.passage_index import PassageIndex
+from models.plagiarism_index import PlagiarismIndex
+from models.result_cache import ResultCache
+
+ESSAY = (
+    "La photosynthèse permet aux plantes de transformer la lumière du soleil en énergie chimique "
+    "grâce à la chlorophylle contenue dans leurs feuilles, un mécanisme essentiel pour la vie sur Terre "
+    "puisque la quasi totalité des chaînes alimentaires en dépend directement ou indirectement."
+)
+OTHER = (
+    "La révolution industrielle commence en Angleterre à la fin du dix huitième siècle avec la machine "
+    "à vapeur, le charbon et les premières usines textiles qui transforment durablement la société."
+)
+
+
+@pytest.fixture(autouse=True)
+def text_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_detection, "plagiarism_index", PlagiarismIndex(str(tmp_path / "index")))
+    monkeypatch.setattr(text_detection, "passage_index", PassageIndex(str(tmp_path / "index")))
+    monkeypatch.setattr(text_detection, "result_cache", ResultCache())
+
+
+def test_cache_hit_does_not_report_the_submission_itself():
+    first = text_detection.analyze_text(ESSAY)
+    text_detection.analyze_text(OTHER, "s2") # Nouveau document : la soumission en cache est mise à jour
+    again = text_detection.analyze_text(ESSAY)
+    assert again["cached"] and not again["updated"]
+    assert again["plagiarism"]["score"] == first["plagiarism"]["score"] == 0.0
+    assert "features" not in again
+
+
+def test_cache_hit_searches_new_documents_from_stored_fingerprints(monkeypatch):
+    assert not text_detection.analyze_text(ESSAY, "s1")["cached"]
+    text_detection.analyze_text(ESSAY, "s2") # Copie par un autre étudiant, indexée après le résultat en cache
+
+    def recompute(*args, **kwargs):
+        raise AssertionError("empreintes recalculées pour un résultat en cache")
+    monkeypatch.setattr(text_detection, "ngram_hashes", recompute)
+    monkeypatch.setattr(text_detection.plagiarism_index, "featurize", recompute)
+
+    again = text_detection.analyze_text(ESSAY, "s1")
+    assert again["cached"] and again["updated"] # Le résultat a changé : l'appelant doit l'enregistrer
+    assert again["plagiarism"]["score"] > 0.9
+    assert [source["student_id"] for source in again["plagiarism"]["sources"]] == ["s2"]
+    assert not text_detection.analyze_text(ESSAY, "s1")["updated"]